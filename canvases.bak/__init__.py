@@ -11,6 +11,18 @@ from ... import config as _config
 class Config(metaclass=_config.Config):
     canvas = "GLCanvas"
 
+    # maximum number of frames per second the canvas paints
+    frame_rate = 60
+
+    # objects this far in mm outside of the view are kept on standby and
+    # get tested every time the camera moves, objects further away are
+    # checked on a worker thread
+    standby_distance = 250.0
+
+    # keep an offscreen color ID buffer of the visible objects so the
+    # object under the mouse is a lookup instead of a CPU pick
+    id_picking = True
+
 
 _registered = {}
 _active = None
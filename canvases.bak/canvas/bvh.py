@@ -0,0 +1,358 @@
+"""
+Bounding volume hierarchy over axis aligned boxes.
+
+The tree is kept in flat arrays. Every node covers a contiguous range of
+`perm`, the box indices sorted along a morton curve, and a node is split
+in half until it holds no more than `LEAF_SIZE` boxes. Queries walk the
+tree one level at a time and test all of the nodes of a level with a
+single NumPy expression, a node that is entirely inside of the frustum
+hands over its whole range of boxes without visiting its children.
+
+Nodes are built around fat boxes, the boxes grown by `MARGIN`. A box that
+moves but stays inside of its fat box does not touch the tree, one that
+leaves it gets a new fat box and only the nodes on the path up to the
+root are refit. Adding or removing boxes needs a rebuild.
+"""
+
+import numpy as np
+
+
+# maximum number of boxes in a leaf
+LEAF_SIZE = 8
+
+# how far in mm the fat box of a leaf box reaches past the box
+MARGIN = 5.0
+
+
+def expand_ranges(starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+    """
+    Concatenation of range(start, stop) for every start, stop pair.
+    """
+    lengths = stops - starts
+    total = int(lengths.sum())
+
+    if not total:
+        return np.empty((0,), dtype=np.intp)
+
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return np.arange(total, dtype=np.intp) + offsets
+
+
+def inverse_direction(direction: np.ndarray) -> np.ndarray:
+    """
+    1 / direction for `ray_slabs`, axes the ray runs parallel to are kept
+    finite.
+    """
+    direction = np.asarray(direction, dtype=np.float64)
+    direction = np.where(np.abs(direction) < 1e-12,
+                         np.copysign(1e-12, direction), direction)
+    return 1.0 / direction
+
+
+def ray_slabs(origin: np.ndarray, inv_dir: np.ndarray, mins: np.ndarray,
+              maxs: np.ndarray, t_max: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Slab test of one ray against (K,3) boxes, returns the hit mask and the
+    entry distances.
+    """
+    t1 = (mins - origin) * inv_dir
+    t2 = (maxs - origin) * inv_dir
+
+    t_enter = np.maximum(np.minimum(t1, t2).max(axis=1), 0.0)
+    t_exit = np.minimum(np.maximum(t1, t2).min(axis=1), t_max)
+
+    return t_enter <= t_exit, t_enter
+
+
+def _spread_bits(values: np.ndarray) -> np.ndarray:
+    # put two zero bits in front of each of the lower 10 bits
+    values = values.astype(np.uint32)
+    values = (values | (values << 16)) & 0x030000FF
+    values = (values | (values << 8)) & 0x0300F00F
+    values = (values | (values << 4)) & 0x030C30C3
+    values = (values | (values << 2)) & 0x09249249
+    return values
+
+
+def _morton_codes(points: np.ndarray) -> np.ndarray:
+    """
+    30 bit morton codes of (N,3) points inside of their bounding box.
+    """
+    low = points.min(axis=0)
+    size = points.max(axis=0) - low
+    size[size == 0.0] = 1.0
+
+    cells = ((points - low) / size * 1023.0).astype(np.uint32)
+
+    return (_spread_bits(cells[:, 0]) << 2) | (_spread_bits(cells[:, 1]) << 1) | _spread_bits(cells[:, 2])
+
+
+class BVH:
+
+    def __init__(self, mins: np.ndarray, maxs: np.ndarray, margin: float = MARGIN):
+        """
+        mins, maxs: (M,3) corners of the boxes, a box is referred to by its
+        row in these arrays.
+
+        margin: how far the fat boxes reach past the boxes, boxes that
+        never move can use 0.0 for a tighter tree
+        """
+        self.mins = np.array(mins, dtype=np.float64).reshape(-1, 3)
+        self.maxs = np.array(maxs, dtype=np.float64).reshape(-1, 3)
+        self.margin = margin
+
+        # goes up on every refit, a query that ran on another thread while
+        # this changed may have read boxes that were half written
+        self.refit_count = 0
+
+        self.fat_mins = self.mins - margin
+        self.fat_maxs = self.maxs + margin
+
+        count = len(self.mins)
+
+        self.perm = np.arange(count, dtype=np.intp)
+        # leaf node of every box
+        self.box_node = np.zeros((count,), dtype=np.intp)
+
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self.mins)
+
+    def _build(self) -> None:
+        count = len(self.mins)
+
+        # boxes sorted along a morton curve are close to each other in
+        # space when they are close to each other in perm, splitting perm
+        # in halves then gives a tree of compact nodes
+        if count:
+            self.perm = np.argsort(_morton_codes((self.mins + self.maxs) * 0.5),
+                                   kind='stable')
+
+        perm = self.perm
+
+        starts = [np.zeros((1,), dtype=np.intp)]
+        stops = [np.full((1,), count, dtype=np.intp)]
+        lefts = []
+        rights = []
+        parents = [np.full((1,), -1, dtype=np.intp)]
+
+        # build a level at a time, the children of a level get numbered
+        # after all of the nodes of the level
+        first = 0
+        level_starts = starts[0]
+        level_stops = stops[0]
+
+        while True:
+            level_count = len(level_starts)
+            split = (level_stops - level_starts) > LEAF_SIZE
+            split_nodes = np.flatnonzero(split)
+
+            left = np.full((level_count,), -1, dtype=np.intp)
+            right = np.full((level_count,), -1, dtype=np.intp)
+
+            next_first = first + level_count
+            left[split_nodes] = next_first + np.arange(split_nodes.size) * 2
+            right[split_nodes] = left[split_nodes] + 1
+
+            lefts.append(left)
+            rights.append(right)
+
+            if not split_nodes.size:
+                break
+
+            s = level_starts[split_nodes]
+            e = level_stops[split_nodes]
+            mid = s + (e - s) // 2
+
+            level_starts = np.stack((s, mid), axis=1).reshape(-1)
+            level_stops = np.stack((mid, e), axis=1).reshape(-1)
+
+            starts.append(level_starts)
+            stops.append(level_stops)
+            parents.append(np.repeat(first + split_nodes, 2))
+
+            first = next_first
+
+        self.node_start = np.concatenate(starts)
+        self.node_stop = np.concatenate(stops)
+        self.node_left = np.concatenate(lefts)
+        self.node_right = np.concatenate(rights)
+        self.node_parent = np.concatenate(parents)
+
+        node_count = len(self.node_start)
+        self.node_mins = np.empty((node_count, 3), dtype=np.float64)
+        self.node_maxs = np.empty((node_count, 3), dtype=np.float64)
+
+        if not count:
+            self.node_mins.fill(np.inf)
+            self.node_maxs.fill(-np.inf)
+            return
+
+        is_leaf = self.node_left == -1
+        leaves = np.flatnonzero(is_leaf)
+
+        # leaves cover perm in order, sorted by start their ranges line up
+        # for reduceat
+        leaves = leaves[np.argsort(self.node_start[leaves])]
+        leaf_starts = self.node_start[leaves]
+
+        self.box_node[perm] = np.repeat(leaves, self.node_stop[leaves] - leaf_starts)
+        self.node_mins[leaves] = np.minimum.reduceat(self.fat_mins[perm], leaf_starts)
+        self.node_maxs[leaves] = np.maximum.reduceat(self.fat_maxs[perm], leaf_starts)
+
+        # fit the inner nodes a level at a time from the deepest up
+        level_firsts = np.cumsum([0] + [len(level) for level in starts])
+        for level in range(len(starts) - 1, -1, -1):
+            nodes = np.arange(level_firsts[level], level_firsts[level + 1])
+            nodes = nodes[~is_leaf[nodes]]
+
+            left = self.node_left[nodes]
+            right = self.node_right[nodes]
+
+            self.node_mins[nodes] = np.minimum(self.node_mins[left], self.node_mins[right])
+            self.node_maxs[nodes] = np.maximum(self.node_maxs[left], self.node_maxs[right])
+
+    def refit(self, box: int, mn, mx) -> None:
+        """
+        Move box to mn, mx and refit the nodes above it if it left its fat
+        box.
+        """
+        self.refit_count += 1
+        self.mins[box] = mn
+        self.maxs[box] = mx
+
+        if (
+            (self.mins[box] >= self.fat_mins[box]).all() and
+            (self.maxs[box] <= self.fat_maxs[box]).all()
+        ):
+            return
+
+        self.fat_mins[box] = self.mins[box] - self.margin
+        self.fat_maxs[box] = self.maxs[box] + self.margin
+
+        node = self.box_node[box]
+        boxes = self.perm[self.node_start[node]:self.node_stop[node]]
+        self.node_mins[node] = self.fat_mins[boxes].min(axis=0)
+        self.node_maxs[node] = self.fat_maxs[boxes].max(axis=0)
+
+        node = self.node_parent[node]
+        while node != -1:
+            left = self.node_left[node]
+            right = self.node_right[node]
+
+            mins = np.minimum(self.node_mins[left], self.node_mins[right])
+            maxs = np.maximum(self.node_maxs[left], self.node_maxs[right])
+
+            if (
+                (mins == self.node_mins[node]).all() and
+                (maxs == self.node_maxs[node]).all()
+            ):
+                break
+
+            self.node_mins[node] = mins
+            self.node_maxs[node] = maxs
+            node = self.node_parent[node]
+
+    def _leaf_boxes(self, leaves: np.ndarray) -> np.ndarray:
+        return self.perm[expand_ranges(self.node_start[leaves],
+                                       self.node_stop[leaves])]
+
+    def _children(self, nodes: np.ndarray) -> np.ndarray:
+        return np.concatenate((self.node_left[nodes], self.node_right[nodes]))
+
+    def query_frustum(self, planes: np.ndarray) -> np.ndarray:
+        """
+        planes: (6,4) from `Camera.extract_frustum_planes`
+
+        Returns the indices of the boxes that intersect or are inside of the
+        frustum.
+        """
+        if not len(self.mins):
+            return np.empty((0,), dtype=np.intp)
+
+        n = planes[:, :3]
+        d = planes[:, 3]
+        abs_n = np.abs(n)
+
+        found = []
+        frontier = np.zeros((1,), dtype=np.intp)
+
+        while len(frontier):
+            mins = self.node_mins[frontier]
+            maxs = self.node_maxs[frontier]
+
+            # signed distance of the centers and projected radius, (F,6)
+            s = ((mins + maxs) * 0.5) @ n.T + d
+            r = ((maxs - mins) * 0.5) @ abs_n.T
+
+            outside = ((s + r) < 0.0).any(axis=1)
+            inside = ((s - r) >= 0.0).all(axis=1)
+
+            nodes = frontier[inside]
+            if len(nodes):
+                found.append(self.perm[expand_ranges(self.node_start[nodes],
+                                                     self.node_stop[nodes])])
+
+            nodes = frontier[~(outside | inside)]
+            is_leaf = self.node_left[nodes] == -1
+
+            leaves = nodes[is_leaf]
+            if len(leaves):
+                boxes = self._leaf_boxes(leaves)
+                mins = self.mins[boxes]
+                maxs = self.maxs[boxes]
+
+                s = ((mins + maxs) * 0.5) @ n.T + d
+                s += ((maxs - mins) * 0.5) @ abs_n.T
+                found.append(boxes[(s >= 0.0).all(axis=1)])
+
+            frontier = self._children(nodes[~is_leaf])
+
+        if not found:
+            return np.empty((0,), dtype=np.intp)
+
+        return np.concatenate(found)
+
+    def query_ray(self, origin, direction,
+                  t_max: float = np.inf) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (boxes, t), the indices of the boxes the ray hits and the
+        distance along the ray where it enters them, sorted front to back.
+        """
+        if not len(self.mins):
+            return np.empty((0,), dtype=np.intp), np.empty((0,), dtype=np.float64)
+
+        origin = np.asarray(origin, dtype=np.float64)
+        inv_dir = inverse_direction(direction)
+
+        found_boxes = []
+        found_t = []
+        frontier = np.zeros((1,), dtype=np.intp)
+
+        while len(frontier):
+            hit, _ = ray_slabs(origin, inv_dir, self.node_mins[frontier],
+                               self.node_maxs[frontier], t_max)
+
+            nodes = frontier[hit]
+            is_leaf = self.node_left[nodes] == -1
+
+            leaves = nodes[is_leaf]
+            if len(leaves):
+                boxes = self._leaf_boxes(leaves)
+                hit, t = ray_slabs(origin, inv_dir, self.mins[boxes],
+                                   self.maxs[boxes], t_max)
+
+                found_boxes.append(boxes[hit])
+                found_t.append(t[hit])
+
+            frontier = self._children(nodes[~is_leaf])
+
+        if not found_boxes:
+            return np.empty((0,), dtype=np.intp), np.empty((0,), dtype=np.float64)
+
+        boxes = np.concatenate(found_boxes)
+        t = np.concatenate(found_t)
+        order = np.argsort(t, kind='stable')
+
+        return boxes[order], t[order]
@@ -174,10 +174,8 @@ Common camera movement terms
 
 from typing import TYPE_CHECKING
 
-import wx
 import math
 from OpenGL import GL
-from OpenGL import GLU
 
 import numpy as np
 
@@ -186,10 +184,12 @@ from ...geometry import point as _point
 from ...geometry import angle as _angle
 from ...geometry import line as _line
 from ... import Config
+from . import frame_scheduler as _frame_scheduler
 
 
 if TYPE_CHECKING:
     from . import canvas as _canvas
+    from . import scene_bounds as _scene_bounds
 
 
 Config = Config.editor3d
@@ -204,10 +204,23 @@ class Camera:
         self.context = canvas.context
 
         self._is_dirty = True
+
+        # goes up every time anything the matrices are built from changes,
+        # code that caches something computed from the matrices can compare
+        # it to know when to recompute
+        self.generation = 0
+
+        # perspective, the canvas used gluPerspective(65, aspect, 0.1, 1000.0)
+        self.fov = 65.0
+        self.near = 0.1
+        self.far = 1000.0
+
+        # row major matrices, built in _update_views
         self.projection = None
         self.modelview = None
-        self.viewport = None
+        self.viewport = (0, 0, 1, 1)
         self.clip = None
+        self.inverse_clip = None
         self.up = None
         self.right = None
         self.forward = None
@@ -230,15 +243,70 @@ class Camera:
         self.angle_from_center = _angle.Angle.from_points(
             ZERO_POINT.copy(), self.eye)
 
-        self.focal_distance = _line.Line(self.eye, self.position).length()
-
         self.distance_from_center = _line.Line(ZERO_POINT, self.eye).length()
 
+        # the interactive path works on float64 copies of eye and position,
+        # the Points are only written back by sync_points once per frame
+        self._eye = np.array(self.eye.as_float, dtype=np.float64)
+        self._position = np.array(self.position.as_float, dtype=np.float64)
+        self.focal_distance = float(np.linalg.norm(self._position - self._eye))
+
+        self._points_stale = False
+        self._is_syncing = False
+
         self._calculate_camera()
 
         self.position.bind(self._update_camera)
         self.eye.bind(self._update_camera)
 
+    @property
+    def eye_array(self) -> np.ndarray:
+        """
+        The eye as a float64 (3,) array, do not modify it.
+        """
+        return self._eye
+
+    @property
+    def position_array(self) -> np.ndarray:
+        """
+        The focal point as a float64 (3,) array, do not modify it.
+        """
+        return self._position
+
+    def sync_points(self) -> None:
+        """
+        Write the float eye and position back to the `eye` and `position`
+        Points if they changed. Called once per frame before anything is
+        shown, code that needs the Points to be current can call it too.
+        """
+        if not self._points_stale:
+            return
+
+        self._points_stale = False
+        self._is_syncing = True
+
+        try:
+            for point, values in ((self.eye, self._eye),
+                                  (self.position, self._position)):
+                x, y, z = values.tolist()
+
+                with point:
+                    point.x = _decimal(x)
+                    point.y = _decimal(y)
+                    point.z = _decimal(z)
+        finally:
+            self._is_syncing = False
+
+    def _moved(self) -> None:
+        # the float eye or position changed
+        self.focal_distance = float(np.linalg.norm(self._position - self._eye))
+        self._points_stale = True
+        self._is_dirty = True
+        self.generation += 1
+
+        if not self.context.is_locked:
+            self.canvas.invalidate(_frame_scheduler.REDRAW_CAMERA)
+
     def reset(self):
         with self.position and self.eye:
             self.position.x = _decimal(0.0)
@@ -252,41 +320,240 @@ class Camera:
         self._update_camera(None)
 
     def _update_camera(self, _=None):
-        if self.context.is_locked:
+        if self._is_syncing:
+            return
+
+        # something other than the camera changed the Points, they win over
+        # the float copies
+        self._eye = np.array(self.eye.as_float, dtype=np.float64)
+        self._position = np.array(self.position.as_float, dtype=np.float64)
+        self.focal_distance = float(np.linalg.norm(self._position - self._eye))
+        self._points_stale = False
+
+        self._is_dirty = True
+        self.generation += 1
+
+        if not self.context.is_locked:
+            self.canvas.invalidate(_frame_scheduler.REDRAW_CAMERA)
+
+    def set_viewport(self, width: int, height: int) -> None:
+        viewport = (0, 0, max(int(width), 1), max(int(height), 1))
+
+        if viewport != self.viewport:
+            self.viewport = viewport
             self._is_dirty = True
-        else:
-            wx.CallAfter(self.canvas.Refresh, False)
+            self.generation += 1
 
-    def get_objects_in_view(self, objs: list) -> list:
+    def get_frustum_planes(self) -> np.ndarray:
+        """
+        (6,4) normalized planes of the view frustum, see
+        `extract_frustum_planes`.
+        """
         if self.clip is None:
             self._is_dirty = True
 
         if self._is_dirty:
             self._update_views()
 
-        planes = self._frustum_planes
-        aabb_in_frustum_planes = self.aabb_in_frustum_planes
-        res = [
-            [_line.Line(self.eye, obj.position).length(), obj] for obj in objs
-            if any(aabb_in_frustum_planes(mn.as_float, mx.as_float, planes)
-                   for mn, mx in obj.rect)]
+        return self._frustum_planes
+
+    def _rect_ndc(self, x0: float, y0: float, x1: float,
+                  y1: float) -> tuple[float, float, float, float]:
+        # left, right, bottom and top in NDC of a window rectangle
+        vx, vy, vw, vh = self.viewport
+
+        x0, x1 = sorted((float(x0), float(x1)))
+        y0, y1 = sorted((float(y0), float(y1)))
+
+        left = 2.0 * (x0 - vx) / vw - 1.0
+        right = 2.0 * (x1 - vx) / vw - 1.0
+        # window y runs down, NDC y runs up
+        bottom = 2.0 * ((vh - y1) - vy) / vh - 1.0
+        top = 2.0 * ((vh - y0) - vy) / vh - 1.0
 
-        # sort the objects by distance from the camera
-        res = sorted(res, key=lambda o: o[0])
+        return left, right, bottom, top
+
+    def get_rect_planes(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """
+        (6,4) normalized planes of the part of the view frustum behind the
+        window rectangle x0, y0, x1, y1 (top-left origin), in the same order
+        as `extract_frustum_planes`.
+        """
+        self._update_views()
 
-        # we need to have the order as far -> near, we also trim off the distance
-        # that was used for saorting
-        res = [res[i][1] for i in range(len(res) - 1, -1, -1)]
+        left, right, bottom, top = self._rect_ndc(x0, y0, x1, y1)
+        r0, r1, r2, r3 = self.clip
+
+        planes = np.stack([r0 - left * r3,
+                           right * r3 - r0,
+                           r1 - bottom * r3,
+                           top * r3 - r1,
+                           r3 + r2,
+                           r3 - r2], axis=0)
+
+        return planes / np.linalg.norm(planes[:, :3], axis=1)[:, None]
+
+    def get_rect_corners(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """
+        (8,3) world corners of the part of the view frustum behind the
+        window rectangle x0, y0, x1, y1 (top-left origin). The 4 near
+        corners come first, each 4 as left-bottom, right-bottom, right-top
+        and left-top.
+        """
+        self._update_views()
+
+        left, right, bottom, top = self._rect_ndc(x0, y0, x1, y1)
+
+        ndc = np.array([[x, y, z, 1.0] for z in (-1.0, 1.0) for x, y in
+                        ((left, bottom), (right, bottom), (right, top), (left, top))])
+
+        world = ndc @ self.inverse_clip.T
+        return world[:, :3] / world[:, 3:]
+
+    def project_points(self, points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Window coordinates (top-left origin) of (N,3) world points.
+
+        Returns (xy, in_front), xy is (N,2) and in_front is False for the
+        points behind the camera, their xy is not usable.
+        """
+        self._update_views()
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        clip = points @ self.clip[:, :3].T + self.clip[:, 3]
+
+        w = clip[:, 3]
+        in_front = w > 1e-8
+        ndc = clip[:, :2] / np.where(in_front, w, 1.0)[:, None]
+
+        vx, vy, vw, vh = self.viewport
+
+        xy = np.empty((len(points), 2), dtype=np.float64)
+        xy[:, 0] = vx + (ndc[:, 0] + 1.0) * vw * 0.5
+        xy[:, 1] = vh - (vy + (ndc[:, 1] + 1.0) * vh * 0.5)
+
+        return xy, in_front
+
+    def get_objects_in_view(self, bounds: "_scene_bounds.SceneBounds") -> list:
+        """
+        Returns the objects in bounds that have an AABB inside of the view
+        frustum in the order they are in bounds. The draw order is worked
+        out by `render_lists.RenderLists`.
+        """
+        if self.clip is None:
+            self._is_dirty = True
+
+        if self._is_dirty:
+            self._update_views()
+
+        visible = bounds.cull(self._frustum_planes)
+        objects = bounds.objects
+
+        return [objects[i] for i in np.flatnonzero(visible).tolist()]
+
+    def projected_sizes(self, mins: np.ndarray, maxs: np.ndarray) -> np.ndarray:
+        """
+        Screen size in pixels (diagonal of the 2D bounding box) of AABBs.
+
+        mins, maxs: (N,3) AABB corners
+
+        Boxes that reach behind the camera get an infinite size.
+        """
+        if self._is_dirty or self.clip is None:
+            self._update_views()
 
-        ret = []
-        offset = 0
-        for obj in res:
-            for renderer in obj.triangles:
-                if renderer.is_opaque:
-                    ret.insert(offset, obj)
-                    offset += 1
+        mins = np.asarray(mins, dtype=np.float64)
+        maxs = np.asarray(maxs, dtype=np.float64)
+        count = mins.shape[0]
 
-        return ret
+        # all 8 corners of every box, (N,8,4)
+        sel = np.array([[(i >> 2) & 1, (i >> 1) & 1, i & 1] for i in range(8)],
+                       dtype=bool)
+
+        corners = np.ones((count, 8, 4), dtype=np.float64)
+        corners[:, :, :3] = np.where(sel[None, :, :], maxs[:, None, :],
+                                     mins[:, None, :])
+
+        clip = corners @ self.clip.astype(np.float64).T
+        w = clip[:, :, 3]
+
+        behind = np.any(w <= 1e-8, axis=1)
+        w = np.where(w <= 1e-8, 1.0, w)
+
+        ndc = clip[:, :, :2] / w[:, :, None]
+
+        _, _, vw, vh = self.viewport
+        extent = (ndc.max(axis=1) - ndc.min(axis=1)) * 0.5
+        size = np.hypot(extent[:, 0] * vw, extent[:, 1] * vh)
+        size[behind] = np.inf
+
+        return size
+
+    def screen_rects(self, mins: np.ndarray,
+                     maxs: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Window rectangles (top-left origin) and depths of AABBs.
+
+        mins, maxs: (N,3) AABB corners
+
+        Returns (rects, depths, valid). rects is (N,4) as
+        (minx, miny, maxx, maxy), depths is (N,) the eye space distance of
+        the closest corner in front of the camera (inf if there is none)
+        and valid is False for the boxes that reach behind the camera,
+        their rect is not usable.
+        """
+        self._update_views()
+
+        mins = np.asarray(mins, dtype=np.float64).reshape(-1, 3)
+        maxs = np.asarray(maxs, dtype=np.float64).reshape(-1, 3)
+        count = mins.shape[0]
+
+        sel = np.array([[(i >> 2) & 1, (i >> 1) & 1, i & 1] for i in range(8)],
+                       dtype=bool)
+
+        corners = np.ones((count, 8, 4), dtype=np.float64)
+        corners[:, :, :3] = np.where(sel[None, :, :], maxs[:, None, :],
+                                     mins[:, None, :])
+
+        clip = corners @ self.clip.T
+        w = clip[:, :, 3]
+
+        in_front = w > 1e-8
+        valid = np.all(in_front, axis=1)
+
+        # w of a perspective projection is the eye space distance along
+        # the view direction
+        depths = np.where(in_front, w, np.inf).min(axis=1)
+
+        ndc = clip[:, :, :2] / np.where(in_front, w, 1.0)[:, :, None]
+
+        vx, vy, vw, vh = self.viewport
+        x = vx + (ndc[:, :, 0] + 1.0) * vw * 0.5
+        y = vh - (vy + (ndc[:, :, 1] + 1.0) * vh * 0.5)
+
+        rects = np.stack((x.min(axis=1), y.min(axis=1),
+                          x.max(axis=1), y.max(axis=1)), axis=1)
+
+        return rects, depths, valid
+
+    def get_ray(self, x: float, y: float) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The ray through window pixel x, y (top-left origin) as (origin,
+        direction), origin on the near plane and direction normalized.
+        """
+        self._update_views()
+
+        vx, vy, vw, vh = self.viewport
+
+        ndc_x = 2.0 * (float(x) - vx) / vw - 1.0
+        ndc_y = 2.0 * ((vh - float(y)) - vy) / vh - 1.0
+
+        points = np.array([[ndc_x, ndc_y, -1.0, 1.0],
+                           [ndc_x, ndc_y, 1.0, 1.0]]) @ self.inverse_clip.T
+        points = points[:, :3] / points[:, 3:]
+
+        direction = points[1] - points[0]
+        return points[0], direction / np.linalg.norm(direction)
 
     @staticmethod
     def aabb_in_frustum_planes(mn_xyz, mx_xyz, planes: np.ndarray) -> bool:
@@ -408,16 +675,56 @@ class Camera:
         return False
 
     def set(self):
-        self._calculate_camera()
-        camera = self.eye.as_float + self.position.as_float + tuple(self.up.tolist())
-        GLU.gluLookAt(*camera)
+        """
+        Load the projection and modelview matrices into GL.
+        """
         self._update_views()
 
-    def _calculate_camera(self):
-        eye = self.eye.as_numpy
-        pos = self.position.as_numpy
+        # GL reads the matrices column major
+        GL.glMatrixMode(GL.GL_PROJECTION)
+        GL.glLoadMatrixd(self.projection.T)
+        GL.glMatrixMode(GL.GL_MODELVIEW)
+        GL.glLoadMatrixd(self.modelview.T)
+
+    @staticmethod
+    def look_at(eye: np.ndarray, center: np.ndarray, up: np.ndarray) -> np.ndarray:
+        """
+        Row major version of the matrix gluLookAt builds.
+        """
+        f = center - eye
+        f /= np.linalg.norm(f)
+
+        s = np.cross(f, up)  # NOQA
+        s /= np.linalg.norm(s)
+
+        u = np.cross(s, f)  # NOQA
+
+        m = np.identity(4, dtype=np.float64)
+        m[0, :3] = s
+        m[1, :3] = u
+        m[2, :3] = -f
+        m[:3, 3] = -(m[:3, :3] @ eye)
+
+        return m
+
+    @staticmethod
+    def perspective(fov: float, aspect: float, near: float, far: float) -> np.ndarray:
+        """
+        Row major version of the matrix gluPerspective builds.
+        """
+        f = 1.0 / math.tan(math.radians(fov) / 2.0)
+
+        m = np.zeros((4, 4), dtype=np.float64)
+        m[0, 0] = f / aspect
+        m[1, 1] = f
+        m[2, 2] = (far + near) / (near - far)
+        m[2, 3] = (2.0 * far * near) / (near - far)
+        m[3, 2] = -1.0
 
-        forward = pos - eye
+        return m
+
+    def _calculate_camera(self):
+        forward = self._position - self._eye
 
         fn = np.linalg.norm(forward)
         if fn < 1e-6:
@@ -465,48 +772,47 @@ class Camera:
         self.right = right
         self.forward = forward_ground
 
-        self.focal_distance = _line.Line(self.eye, self.position).length()
-
     def _update_views(self):
         if not self._is_dirty:
             return
 
+        self._is_dirty = False
         self._calculate_camera()
-        with self.context:
-            self._is_dirty = False
-            self.viewport = GL.glGetIntegerv(GL.GL_VIEWPORT)
-            self.projection = np.array(GL.glGetDoublev(GL.GL_PROJECTION_MATRIX)).reshape((4, 4), order="F").T
-            self.modelview = np.array(GL.glGetDoublev(GL.GL_MODELVIEW_MATRIX)).reshape((4, 4), order="F").T
-            self.clip = (self.projection @ self.modelview).astype(np.float32)
-            self._frustum_planes = self.extract_frustum_planes(self.clip)
+
+        _, _, width, height = self.viewport
+
+        self.projection = self.perspective(self.fov, width / height,
+                                           self.near, self.far)
+        self.modelview = self.look_at(self._eye, self._position, self.up)
+        self.clip = self.projection @ self.modelview
+        self.inverse_clip = np.linalg.inv(self.clip)
+        self._frustum_planes = self.extract_frustum_planes(self.clip)
 
     def rotate(self, dx, dy):
         """
         Moves the camera position keeping the focused point locked.
         """
-        self._is_dirty = True
-        eye = self._rotate_about(dx, dy, self.eye, self.position)
-        self.eye += eye - self.eye
+        self._eye = self._rotate_about(float(dx), float(dy), self._eye, self._position)
+        self._moved()
 
     @staticmethod
-    def _rotate_about(dx: int, dy: int, p1: _point.Point, p2: _point.Point) -> np.ndarray:
+    def _rotate_about(dx: float, dy: float, p1: np.ndarray, p2: np.ndarray) -> np.ndarray:
         """
         Moves the camera position keeping the focused point locked.
+
+        Returns where p1 ends up after rotating it about p2.
         """
         # This is a constant that can be adjusted. This is a hard limit
         # to prevent gimbal lock from occuring when looking straight up or
         # straight down. You can set it to a smaller number but do not increase
         # it past 89.9 otherwise gimbal lock can occur.
-        p1 = p1.as_numpy
-        p2 = p2.as_numpy
-
         max_pitch = 89.9
 
         offset = p1 - p2
         dist = np.linalg.norm(offset)
 
         if dist < 1e-6:
-            return np.array([0.0, 0.0, 0.0], dtype=np.float64)
+            return p1.copy()
 
         up = np.array([0.0, 1.0, 0.0], dtype=np.float64)
 
@@ -521,14 +827,13 @@ class Camera:
         yaw_offset_n = np.linalg.norm(yaw_offset)
 
         if yaw_offset_n < 1e-6:
-            return np.array([0.0, 0.0, 0.0], dtype=np.float64)
+            return p1.copy()
 
         yaw_dir = yaw_offset / yaw_offset_n
 
         horiz_len = math.hypot(yaw_dir[0], yaw_dir[2])
 
-        cur_pitch_deg = _decimal(
-            math.degrees(math.atan2(yaw_dir[1], horiz_len)))
+        cur_pitch_deg = math.degrees(math.atan2(yaw_dir[1], horiz_len))
 
         desired_pitch = cur_pitch_deg + dy
         if desired_pitch > max_pitch or desired_pitch < -max_pitch:
@@ -553,10 +858,7 @@ class Camera:
                     # explicitly restore original distance to avoid shrink/grow
                     final_offset = rotated * (dist / rnorm)
 
-        new_point = p2 + final_offset
-
-        return _point.Point(_decimal(new_point[0]), _decimal(new_point[1]),
-                            _decimal(new_point[2]))
+        return p2 + final_offset
 
     def pan_tilt(self, dx, dy):
         """
@@ -564,9 +866,8 @@ class Camera:
 
         Pan and Tilt camera movements.
         """
-        self._is_dirty = True
-        position = self._rotate_about(dx, dy, self.position, self.eye)
-        self.position += position - self.position
+        self._position = self._rotate_about(float(dx), float(dy), self._position, self._eye)
+        self._moved()
 
     def zoom(self, delta, *_):
         """
@@ -575,16 +876,16 @@ class Camera:
         This also doesn't change the camera position at all. It simply shinks
         or expands the distance between the focal point and the camera position.
         """
-        move = self.forward * float(delta)
-        print('delta:', delta)
+        delta = float(delta)
+        move = self.forward * delta
         # If moving would invert eye and pos, prevent crossing pos
         if delta > 0 and self.focal_distance <= 0.1:
             return
         elif delta < 0 and self.focal_distance >= 150.0:
             return
 
-        self._is_dirty = True
-        self.eye += move
+        self._eye = self._eye + move
+        self._moved()
 
     def walk(self, dx, dy, speed):
         """
@@ -603,12 +904,15 @@ class Camera:
         like when you walk in an arc to either left or right.
         """
 
+        dx = float(dx)
+        dy = float(dy)
+
         # Build desired move from input
         input_mag = math.sqrt((dx * dx) + (dy * dy))
         if input_mag == 0:
             return
 
-        move_dir = self.right * float(dx) + self.forward * float(dy)
+        move_dir = self.right * dx + self.forward * dy
 
         mdn = np.linalg.norm(move_dir)
         if mdn < 1e-6:
@@ -617,10 +921,9 @@ class Camera:
         move_dir = move_dir / mdn
         move = move_dir * (input_mag * speed)
 
-        self._is_dirty = True
-        with self.eye and self.position:
-            self.eye += move
-            self.position += move
+        self._eye = self._eye + move
+        self._position = self._position + move
+        self._moved()
 
     def truck_pedistal(self, dx, dy, speed):
         """
@@ -628,12 +931,15 @@ class Camera:
         and a Pedistal (up down) movement
         """
 
+        dx = float(dx)
+        dy = float(dy)
+
         # Build desired move from input
         input_mag = math.sqrt((dx * dx) + (dy * dy))
         if input_mag == 0:
             return
 
-        move_dir = self.right * float(dx) + self.up * float(dy)
+        move_dir = self.right * dx + self.up * dy
 
         mdn = np.linalg.norm(move_dir)
         if mdn < 1e-6:
@@ -643,37 +949,54 @@ class Camera:
 
         move = move_dir * (input_mag * speed)
 
-        with self.eye:
-            self.eye += move
+        self._eye = self._eye + move
+        self._position = self._position + move
+        self._moved()
 
-        self._is_dirty = True
-        self.position += move
+    def get_matrices(self) -> tuple[np.ndarray, np.ndarray, tuple]:
+        """
+        Returns (modelview, projection, viewport), the matrices row major.
+        """
+        self._update_views()
+        return self.modelview, self.projection, self.viewport
 
     def project_point(self, point: _point.Point) -> _point.Point:
         """
         Project a world-space _point.Point to window coordinates (top-left origin).
         Returns (winx, winy_top, winz) where winz is in [0,1].
         """
+        self._update_views()
 
-        with self.context:
-            winx, winy, winz = GLU.gluProject(float(point.x), float(point.y), float(point.z),
-                                              self.modelview, self.projection, self.viewport)
+        clip = self.clip @ np.array([float(point.x), float(point.y), float(point.z), 1.0])
+        ndc = clip[:3] / clip[3]
+
+        vx, vy, vw, vh = self.viewport
+        winx = vx + (ndc[0] + 1.0) * vw * 0.5
+        winy = vy + (ndc[1] + 1.0) * vh * 0.5
+        winz = (ndc[2] + 1.0) * 0.5
 
         # convert to top-left origin to match wx mouse coordinates
-        winy_top = _decimal(self.viewport[3]) - _decimal(winy)
-        return _point.Point(_decimal(winx), winy_top, _decimal(winz))
+        winy_top = _decimal(vh) - _decimal(float(winy))
+        return _point.Point(_decimal(float(winx)), winy_top, _decimal(float(winz)))
 
     def unproject_point(self, point: _point.Point) -> _point.Point:
         """
         Unproject window coordinates (top-left origin) and
         winz back to a world _point.Point.
         """
+        self._update_views()
+
+        vx, vy, vw, vh = self.viewport
+
+        # convert top-left y back to OpenGL bottom-left y
+        winy = vh - float(point.y)
 
-        with self.context:
-            # convert top-left y back to OpenGL bottom-left y
-            winy = _decimal(self.viewport[3]) - point.y
+        ndc = np.array([2.0 * (float(point.x) - vx) / vw - 1.0,
+                        2.0 * (winy - vy) / vh - 1.0,
+                        2.0 * float(point.z) - 1.0,
+                        1.0])
 
-            x, y, z = GLU.gluUnProject(float(point.x), float(winy), float(point.z),
-                                       self.modelview, self.projection, self.viewport)
+        world = self.inverse_clip @ ndc
+        x, y, z = (world[:3] / world[3]).tolist()
 
         return _point.Point(_decimal(x), _decimal(y), _decimal(z))
@@ -1,12 +1,13 @@
 
 from typing import Self, TYPE_CHECKING
 
+import time
+
 import wx
 
 import numpy as np
 from wx import glcanvas
 from OpenGL import GL
-from OpenGL import GLU
 
 # from . import free_rotate as _free_rotate
 # from . import dragging as _dragging
@@ -19,6 +20,19 @@ from ... import debug as _debug
 from ...geometry import point as _point
 from ...wrappers.decimal import Decimal as _decimal
 from .. import axis_indicators as _axis_indicators
+from .. import renderers as _renderers
+from ..canvases import Config as _canvases_config
+from ..renderers import lod as _lod
+from ..renderers import tessellator as _tessellator
+from ..renderers import render_queue as _render_queue
+from ..renderers import id_buffer as _id_buffer
+from . import frame_scheduler as _frame_scheduler
+from . import hover_grid as _hover_grid
+from . import object_picker as _object_picker
+from . import render_lists as _render_lists
+from . import scene_bounds as _scene_bounds
+from . import selection as _selection
+from . import visibility as _visibility
 
 if TYPE_CHECKING:
     from ... import ui as _ui
@@ -26,6 +40,28 @@ if TYPE_CHECKING:
 
 Config = Config.editor3d
 
+
+# corners of a box are numbered 0-7, bit 0, 1 and 2 of the number select
+# the max x, y and z. These are the faces and the edges of the box.
+_BOX_QUAD_CORNERS = (
+    0, 1, 3, 2,  # back
+    4, 5, 7, 6,  # front
+    0, 2, 6, 4,  # left
+    1, 5, 7, 3,  # right
+    2, 3, 7, 6,  # top
+    0, 1, 5, 4   # bottom
+)
+
+_BOX_LINE_CORNERS = (
+    2, 3, 3, 7, 7, 6, 6, 2,  # top
+    0, 1, 1, 5, 5, 4, 4, 0,  # bottom
+    0, 2, 4, 6,  # left
+    1, 3, 5, 7   # right
+)
+
+_BOX_COLOR = np.array([1.0, 0.5, 0.5, 0.3], dtype=np.float32)
+_BOX_SELECTED_COLOR = np.array([0.5, 1.0, 0.5, 0.3], dtype=np.float32)
+
 # ***********************************************************
 
 
@@ -117,14 +153,80 @@ class Canvas(glcanvas.GLCanvas):
         self.Bind(wx.EVT_SIZE, self.on_size)
         self.Bind(wx.EVT_PAINT, self.on_paint)
         self.Bind(wx.EVT_ERASE_BACKGROUND, self.on_erase_background)
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.on_destroy)
 
         self.axis = None
 
+        # renderer and draw wrapper used for instanced objects, created
+        # once the GL context exists
+        self.renderer = None
+        self._draw = None
+
+        # offscreen color ID pass of the objects in view, created once the
+        # GL context exists if `canvases.Config.id_picking` is set and supported
+        self._id_buffer = None
+
+        # the ID pass is not drawn while the camera moves, last camera
+        # generation seen, when, and the timer that redraws once it settled
+        self._seen_camera_generation = -1
+        self._seen_camera_time = 0.0
+        self._id_timer = None
+
+        # draws made by the objects get collected here and are issued
+        # sorted by material and color
+        self._render_queue = _render_queue.RenderQueue()
+
+        # AABBs and positions of all objects as arrays with a BVH over
+        # them, used for culling, picking, LOD selection and the draw order
+        self.bounds = _scene_bounds.SceneBounds()
+
+        # id(obj) -> (obj, callback bound to the objects position) and the
+        # objects that moved since the bounds were last updated
+        self._position_callbacks = {}
+        self._moved = {}
+
+        # in view, standby and far sets, OnDraw only reads the in view set
+        self.visibility = _visibility.VisibilityManager(
+            self.bounds, self._on_visibility_changed,
+            _canvases_config.standby_distance)
+        self._render_lists = _render_lists.RenderLists(self.bounds)
+
+        # screen rects of the objects binned in a grid for hover picking,
+        # hovered is the object under the mouse, drawn with its box
+        self.hover_grid = _hover_grid.HoverGrid(self.bounds, self.camera)
+        self.hovered = None
+
+        # CPU picking when the ID pass is not up to date, keeps the last
+        # pick for as long as the camera and the scene do not change
+        self.picker = _object_picker.Picker(self.bounds, self.camera)
+
+        # display list holding the floor grid, built by draw_grid
         self._grid = None
 
         self.selected = None
         self.objects = []
+
+        # id(obj) -> obj of everything selected with a box or a lasso, see
+        # `select`. selection_tool is None or one of the `selection.TOOL_*`
+        # values and selection_outline the window points of the box or
+        # lasso being dragged
+        self.selection = {}
+        self.selection_tool = None
+        self.selection_outline = None
         self._ref_count = 0
+
+        # paints are requested through the scheduler
+        self._scheduler = _frame_scheduler.FrameScheduler(
+            self, _canvases_config.frame_rate)
+
+        # objects waiting on the tessellator, these get drawn as their
+        # bounding box until the mesh arrives
+        self._pending_meshes = {}
+
+        # id(obj) -> (rects, quads, lines) of the bounding boxes drawn in
+        # the last frame
+        self._bounding_boxes = {}
+        self._tessellator = _tessellator.TessellationService(self._on_meshes_ready)
         # self.free_rot: _free_rotate.FreeRotate = None
         # self.axis: _axis_indicators.Indicators = None
 
@@ -171,7 +273,23 @@ class Canvas(glcanvas.GLCanvas):
         with self:
             self.objects.insert(0, obj)
 
-        self.Refresh(False)
+        def _on_position(_=None):
+            entry = self._position_callbacks.get(id(obj), None)
+            if entry is not None and entry[1] is _on_position:
+                self.object_moved(obj)
+
+        # the callback is kept here as well in case the point only holds
+        # a weak reference to it. A rotation changes the oriented hit test
+        # box kept in bounds, so the angle gets the same callback
+        self._position_callbacks[id(obj)] = (obj, _on_position)
+        obj.position.bind(_on_position)
+
+        angle = getattr(obj, 'angle', None)
+        if angle is not None:
+            angle.bind(_on_position)
+
+        self.bounds.mark_dirty()
+        self.invalidate(_frame_scheduler.REDRAW_SCENE)
 
     def remove_object(self, obj):
         try:
@@ -179,7 +297,276 @@ class Canvas(glcanvas.GLCanvas):
         except:  # NOQA
             return
 
-        self.Refresh(False)
+        if self.hovered is obj:
+            self.hovered = None
+
+        self.selection.pop(id(obj), None)
+        self.picker.clear()
+
+        self._pending_meshes.pop(id(obj), None)
+        entry = self._position_callbacks.pop(id(obj), None)
+        if entry is not None:
+            # the closure holds on to the canvas and obj, left bound it
+            # would keep both alive and fire again if obj gets added back
+            obj.position.unbind(entry[1])
+
+            angle = getattr(obj, 'angle', None)
+            if angle is not None:
+                angle.unbind(entry[1])
+
+        self._moved.pop(id(obj), None)
+        self.bounds.mark_dirty()
+        self.invalidate(_frame_scheduler.REDRAW_SCENE)
+
+    def object_moved(self, obj) -> None:
+        """
+        Call after obj has been moved, resized or rotated. Its bounds get
+        refit by the next `update_bounds` instead of rebuilding the bounds
+        of the whole scene. Objects added with `add_object` call this when
+        their position changes.
+        """
+        self._moved[id(obj)] = obj
+        self.invalidate(_frame_scheduler.REDRAW_SCENE)
+
+    def update_bounds(self) -> None:
+        """
+        Bring bounds up to date with the objects.
+        """
+        self.bounds.update(self.objects)
+
+        if self._moved:
+            moved = self._moved
+            self._moved = {}
+
+            for obj in moved.values():
+                self.bounds.update_object(obj)
+
+            rows = self.bounds.rows
+            indices = [rows[key] for key in moved if key in rows]
+            self.visibility.mark_moved(indices)
+            self.hover_grid.mark_moved(indices)
+
+            # an object whose number of boxes changed marks the bounds dirty
+            self.bounds.update(self.objects)
+
+    def _get_id_key(self) -> tuple[int, int, int]:
+        return self.camera.generation, self.bounds.generation, self.scene_generation
+
+    def _camera_settled(self) -> bool:
+        # True once the camera generation has not changed for
+        # `hover_grid.SETTLE_TIME`, a moving camera gets a redraw scheduled
+        # for when it will have settled
+        generation = self.camera.generation
+        now = time.monotonic()
+
+        if generation != self._seen_camera_generation:
+            self._seen_camera_generation = generation
+            self._seen_camera_time = now
+
+            delay = int(_hover_grid.SETTLE_TIME * 1000) + 1
+            if self._id_timer is not None and self._id_timer.IsRunning():
+                self._id_timer.Restart(delay)
+            else:
+                self._id_timer = wx.CallLater(
+                    delay, self.invalidate, _frame_scheduler.REDRAW_SELECTION)
+
+            return False
+
+        return now - self._seen_camera_time >= _hover_grid.SETTLE_TIME
+
+    def object_at(self, x: int, y: int):
+        """
+        The object under window pixel x, y or None.
+
+        Looked up in the color ID pass when it is up to date with the camera
+        and the scene, otherwise the objects are picked on the CPU.
+        """
+        if self._id_buffer is not None:
+            with self.context:
+                self._id_buffer.resolve()
+
+            if self._id_buffer.is_current(self._get_id_key()):
+                return self._id_buffer.object_at(x, y)
+
+        self.update_bounds()
+        return self.picker.find(x, y, self._get_id_key())
+
+    def surface_at(self, x: int, y: int):
+        """
+        (object, triangle, point) of the surface under window pixel x, y or
+        None. Unlike `object_at` this looks past the hit test boxes, the
+        object is the one whose mesh is hit first and point is where, in
+        world coordinates, for snapping and placing things onto a part.
+        triangle is None for objects without a mesh.
+        """
+        self.update_bounds()
+        return self.picker.pick_surface(x, y, self._get_id_key())
+
+    def hover_at(self, x: int, y: int):
+        """
+        Update `hovered` for the mouse at window pixel x, y and redraw if it
+        changed. Cheap enough to call on every mouse move, while the camera
+        is moving hovered is left as it is.
+        """
+        self.update_bounds()
+
+        if not self.hover_grid.update():
+            return self.hovered
+
+        hovered = self.hover_grid.query(x, y)
+
+        if hovered is not self.hovered:
+            self.hovered = hovered
+            self.invalidate(_frame_scheduler.REDRAW_SELECTION)
+
+        return hovered
+
+    def select(self, objs, mode: int = _selection.SELECT_REPLACE) -> None:
+        """
+        Change `selection` by objs, mode is one of the `selection.SELECT_*`
+        values.
+        """
+        objs = list(objs)
+
+        if mode == _selection.SELECT_REPLACE:
+            keep = {id(obj) for obj in objs}
+
+            for obj_id, obj in self.selection.items():
+                if obj_id not in keep:
+                    obj.is_selected = False
+
+            self.selection = {}
+
+        if mode == _selection.SELECT_SUBTRACT:
+            for obj in objs:
+                if self.selection.pop(id(obj), None) is not None:
+                    obj.is_selected = False
+        else:
+            for obj in objs:
+                self.selection[id(obj)] = obj
+                obj.is_selected = True
+
+        self.invalidate(_frame_scheduler.REDRAW_SELECTION)
+
+    def select_box(self, x0: float, y0: float, x1: float, y1: float,
+                   mode: int = _selection.SELECT_REPLACE) -> None:
+        """
+        Select the objects inside of the window rectangle, dragged right to
+        left the ones it crosses as well, see `selection.box_select`.
+        """
+        self.update_bounds()
+
+        indices = _selection.box_select(self.bounds, self.camera,
+                                        x0, y0, x1, y1, crossing=x1 < x0)
+        objects = self.bounds.objects
+        self.select([objects[i] for i in indices.tolist()], mode)
+
+    def select_lasso(self, polygon, mode: int = _selection.SELECT_REPLACE) -> None:
+        """
+        Select the objects whose center is inside of the window coordinate
+        polygon, see `selection.lasso_select`.
+        """
+        self.update_bounds()
+
+        indices = _selection.lasso_select(self.bounds, self.camera, polygon)
+        objects = self.bounds.objects
+        self.select([objects[i] for i in indices.tolist()], mode)
+
+    def _draw_selection_outline(self) -> None:
+        outline = self.selection_outline
+        if not outline or len(outline) < 2:
+            return
+
+        _, _, width, height = self.camera.viewport
+        points = np.array(outline, dtype=np.float32)
+
+        GL.glPushAttrib(GL.GL_ENABLE_BIT | GL.GL_CURRENT_BIT)
+        GL.glDisable(GL.GL_LIGHTING)
+        GL.glDisable(GL.GL_DEPTH_TEST)
+
+        # window coordinates, top-left origin
+        GL.glMatrixMode(GL.GL_PROJECTION)
+        GL.glPushMatrix()
+        GL.glLoadIdentity()
+        GL.glOrtho(0.0, width, height, 0.0, -1.0, 1.0)
+        GL.glMatrixMode(GL.GL_MODELVIEW)
+        GL.glPushMatrix()
+        GL.glLoadIdentity()
+
+        GL.glPushClientAttrib(GL.GL_CLIENT_VERTEX_ARRAY_BIT)
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glDisableClientState(GL.GL_NORMAL_ARRAY)
+
+        GL.glColor4f(1.0, 1.0, 1.0, 0.8)
+        GL.glVertexPointer(2, GL.GL_FLOAT, 0, points)
+        GL.glDrawArrays(GL.GL_LINE_LOOP, 0, len(points))
+
+        GL.glPopClientAttrib()
+
+        GL.glPopMatrix()
+        GL.glMatrixMode(GL.GL_PROJECTION)
+        GL.glPopMatrix()
+        GL.glMatrixMode(GL.GL_MODELVIEW)
+
+        GL.glPopAttrib()
+
+    def _on_visibility_changed(self) -> None:
+        # called from the visibility worker when far objects came closer
+        self.invalidate(_frame_scheduler.REDRAW_SCENE)
+
+    def load_mesh(self, obj, data: bytes, type_: str, callback,
+                  lod: bool = False) -> str:
+        """
+        Tessellates the STEP/STL file data for obj in a background process.
+
+        callback gets called on the UI thread with
+        (normals, triangles, triangle_count[, indices]), or with a `LODMesh`
+        if lod is True, once the mesh is ready. Until then the object is
+        drawn as its bounding box (`hit_test_rect`).
+
+        Objects loaded from the same data share their arrays. The returned
+        model key is the same for all of them and can be used as the
+        objects `model_key`, see `_draw_instanced`.
+        """
+        obj_id = id(obj)
+        self._pending_meshes[obj_id] = obj
+
+        def _on_mesh(*args):
+            if self._pending_meshes.pop(obj_id, None) is None:
+                # the object was removed while it was being tessellated
+                return
+
+            if lod:
+                # the level arrays are shared, the selected level is not
+                args = (args[0].share(),)
+
+            callback(*args)
+
+        if self._tessellator.submit(_renderers.get_active_renderer_cls(),
+                                    data, type_, _on_mesh, lod):
+            # the mesh was cached and has already been handed to callback
+            self.invalidate(_frame_scheduler.REDRAW_SCENE)
+
+        return _tessellator.make_model_key(data)
+
+    def _on_meshes_ready(self, ready: list) -> None:
+        # swap all of the finished meshes in and redraw once
+        with self:
+            for callback, args in ready:
+                callback(*args)
+
+        self.invalidate(_frame_scheduler.REDRAW_SCENE)
+
+    def on_destroy(self, evt):
+        if evt.GetEventObject() is self:
+            if self._id_timer is not None:
+                self._id_timer.Stop()
+
+            self._scheduler.stop()
+            self.visibility.stop()
+            self._tessellator.shutdown()
+
+        evt.Skip()
 
     def __enter__(self) -> Self:
         self._ref_count += 1
@@ -188,30 +575,56 @@ class Canvas(glcanvas.GLCanvas):
     def __exit__(self, exc_type, exc_val, exc_tb):
         self._ref_count -= 1
 
-    def Refresh(self, *args, **kwargs):
-        if self._ref_count:
-            return
-
-        glcanvas.GLCanvas.Refresh(self, *args, **kwargs)
-
-    def truck_pedistal(self, dx: _decimal, dy: _decimal) -> None:
+        if not self._ref_count:
+            self._scheduler.flush()
+
+    @property
+    def is_held(self) -> bool:
+        """
+        True while the canvas is being held with `with canvas:`, redraws
+        wait until it is released.
+        """
+        return self._ref_count > 0
+
+    @property
+    def scene_generation(self) -> int:
+        """
+        Goes up every time the scene is invalidated, the ID pass gets drawn
+        again when this or the camera generation changes.
+        """
+        return self._scheduler.scene_generation
+
+    def invalidate(self, reasons: int = _frame_scheduler.REDRAW_ALL) -> None:
+        """
+        Ask for a redraw, reasons is a combination of the
+        `frame_scheduler.REDRAW_*` flags. Requests are coalesced into at most
+        one paint per frame. This can be called from any thread.
+        """
+        self._scheduler.invalidate(reasons)
+
+    def Refresh(self, *_, **__):
+        # callers that do not say what changed redraw everything, changes
+        # to the bounds come in through add_object, remove_object and
+        # object_moved
+        self.invalidate(_frame_scheduler.REDRAW_ALL)
+
+    def request_paint(self) -> None:
+        glcanvas.GLCanvas.Refresh(self, False)
+
+    def truck_pedistal(self, dx: float, dy: float) -> None:
         if Config.truck_pedistal.mouse & MOUSE_REVERSE_X_AXIS:
             dx = -dx
 
         if Config.truck_pedistal.mouse & MOUSE_REVERSE_Y_AXIS:
             dy = -dy
 
-        sens = _decimal(Config.truck_pedistal.sensitivity)
-        dx *= sens
-        dy *= sens
-
-        self.camera.truck_pedistal(dx, dy, Config.truck_pedistal.speed)
+        sens = float(Config.truck_pedistal.sensitivity)
+        self.camera.truck_pedistal(dx * sens, dy * sens, Config.truck_pedistal.speed)
 
-    def zoom(self, dx, _):
-        dx *= _decimal(Config.zoom.sensitivity)
-        self.camera.zoom(dx)
+    def zoom(self, dx: float, _):
+        self.camera.zoom(dx * float(Config.zoom.sensitivity))
 
-    def rotate(self, dx: _decimal, dy: _decimal) -> None:
+    def rotate(self, dx: float, dy: float) -> None:
 
         if Config.rotate.mouse & MOUSE_REVERSE_X_AXIS:
             dx = -dx
@@ -219,15 +632,12 @@ class Canvas(glcanvas.GLCanvas):
         if Config.rotate.mouse & MOUSE_REVERSE_Y_AXIS:
             dy = -dy
 
-        sens = _decimal(Config.rotate.sensitivity)
-        dx *= sens
-        dy *= sens
+        sens = float(Config.rotate.sensitivity)
+        self.camera.rotate(dx * sens, dy * sens)
 
-        self.camera.rotate(dx, dy)
-
-    def walk(self, dx: _decimal, dy: _decimal) -> None:
+    def walk(self, dx: float, dy: float) -> None:
         if dy == 0.0:
-            self.pan_tilt(dx * _decimal(6.0), _decimal(0.0))
+            self.pan_tilt(dx * 6.0, 0.0)
             return
 
         look_dx = dx
@@ -238,25 +648,19 @@ class Canvas(glcanvas.GLCanvas):
         if Config.walk.mouse & MOUSE_REVERSE_Y_AXIS:
             dy = -dy
 
-        sens = _decimal(Config.walk.sensitivity)
-        dx *= sens
-        dy *= sens
-
-        self.camera.walk(dx, dy, Config.walk.speed)
-        self.pan_tilt(look_dx * _decimal(2.0), _decimal(0.0))
+        sens = float(Config.walk.sensitivity)
+        self.camera.walk(dx * sens, dy * sens, Config.walk.speed)
+        self.pan_tilt(look_dx * 2.0, 0.0)
 
-    def pan_tilt(self, dx: _decimal, dy: _decimal) -> None:
+    def pan_tilt(self, dx: float, dy: float) -> None:
         if Config.pan_tilt.mouse & MOUSE_REVERSE_X_AXIS:
             dx = -dx
 
         if Config.pan_tilt.mouse & MOUSE_REVERSE_Y_AXIS:
             dy = -dy
 
-        sens = _decimal(Config.pan_tilt.sensitivity)
-
-        dx *= sens
-        dy *= sens
-        self.camera.pan_tilt(dx, dy)
+        sens = float(Config.pan_tilt.sensitivity)
+        self.camera.pan_tilt(dx * sens, dy * sens)
 
     def on_erase_background(self, _):
         pass
@@ -270,6 +674,8 @@ class Canvas(glcanvas.GLCanvas):
         with self.context:
             GL.glViewport(0, 0, width, height)
 
+        self.camera.set_viewport(width, height)
+
     def on_paint(self, _):
         _ = wx.PaintDC(self)
 
@@ -318,177 +724,252 @@ class Canvas(glcanvas.GLCanvas):
         GL.glMaterialf(GL.GL_FRONT, GL.GL_SHININESS, 80.0)
 
         GL.glEnable(GL.GL_LIGHT0)
-        self.camera.set()
 
-        w, h = self.GetSize()
+        width, height = self.GetSize() * self.GetContentScaleFactor()
+        GL.glViewport(0, 0, width, height)
 
-        aspect = w / float(h)
-
-        GL.glMatrixMode(GL.GL_PROJECTION)
-        GLU.gluPerspective(65, aspect, 0.1, 1000.0)
-        GL.glMatrixMode(GL.GL_MODELVIEW)
+        self.camera.set_viewport(width, height)
+        self.camera.set()
 
         self.axis = _axis_indicators.Indicators(self.mainframe)
 
+        self.renderer = _renderers.get_active_renderer_cls()()
+        self._draw = self.renderer.draw()
+
+        if _canvases_config.id_picking:
+            self._id_buffer = _id_buffer.IdBuffer.create()
+
     @staticmethod
-    def draw_grid():
+    def _build_grid_tiles() -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the (N*4, 3) quad corners of the light and the dark tiles of
+        the checkerboard.
+        """
         GRID_SIZE = 1000
         GRID_STEP = 50
 
         # --- Tiles ---
         TILE_SIZE = GRID_STEP
         HALF = GRID_SIZE
-        GL.glLightfv(GL.GL_LIGHT0, GL.GL_AMBIENT, [0.5, 0.5, 0.5, 0.5])
-        GL.glLightfv(GL.GL_LIGHT0, GL.GL_DIFFUSE, [0.3, 0.3, 0.3, 0.5])
-        GL.glLightfv(GL.GL_LIGHT0, GL.GL_SPECULAR, [0.5, 0.5, 0.5, 0.5])
-
-        GL.glMaterialfv(GL.GL_FRONT, GL.GL_AMBIENT, [0.3, 0.3, 0.3, 0.5])
-        GL.glMaterialfv(GL.GL_FRONT, GL.GL_DIFFUSE, [0.5, 0.5, 0.5, 0.5])
-        GL.glMaterialfv(GL.GL_FRONT, GL.GL_SPECULAR, [0.8, 0.8, 0.8, 0.5])
-        GL.glMaterialf(GL.GL_FRONT, GL.GL_SHININESS, 100.0)
-
-        for x in range(-HALF, HALF, TILE_SIZE):
-            for y in range(-HALF, HALF, TILE_SIZE):
-                # Alternate coloring for checkerboard effect
-                is_even = ((x // TILE_SIZE) + (y // TILE_SIZE)) % 2 == 0
-                if is_even:
-                    GL.glColor4f(0.8, 0.8, 0.8, 0.4)
-                else:
-                    GL.glColor4f(0.3, 0.3, 0.3, 0.4)
-
-                GL.glBegin(GL.GL_QUADS)
-                GL.glVertex3f(x, 0, y)
-                GL.glVertex3f(x, 0, y + TILE_SIZE)
-                GL.glVertex3f(x + TILE_SIZE, 0, y + TILE_SIZE)
-                GL.glVertex3f(x + TILE_SIZE, 0, y)
-                GL.glEnd()
-
-    def _render_bounding_boxes(self):
-
-        for obj in self.objects:
+
+        steps = np.arange(-HALF, HALF, TILE_SIZE, dtype=np.float32)
+        xs, ys = np.meshgrid(steps, steps, indexing='ij')
+        xs = xs.reshape(-1, 1)
+        ys = ys.reshape(-1, 1)
+
+        # same corner order as the quads have always been drawn with
+        quads = np.zeros((len(xs), 4, 3), dtype=np.float32)
+        quads[:, :, 0] = xs + np.array([0, 0, TILE_SIZE, TILE_SIZE], dtype=np.float32)
+        quads[:, :, 2] = ys + np.array([0, TILE_SIZE, TILE_SIZE, 0], dtype=np.float32)
+
+        # Alternate coloring for checkerboard effect
+        is_even = ((xs[:, 0] // TILE_SIZE) + (ys[:, 0] // TILE_SIZE)) % 2 == 0
+
+        return (np.ascontiguousarray(quads[is_even].reshape(-1, 3)),
+                np.ascontiguousarray(quads[~is_even].reshape(-1, 3)))
+
+    def draw_grid(self):
+        """
+        Draw the floor checkerboard.
+
+        The grid never changes so the tiles and the light and material
+        state that goes with them get compiled into a display list the first
+        time and every frame after that is a single glCallList.
+        """
+        if self._grid is None:
+            even_tiles, odd_tiles = self._build_grid_tiles()
+
+            self._grid = GL.glGenLists(1)
+            GL.glNewList(self._grid, GL.GL_COMPILE)
+
+            GL.glLightfv(GL.GL_LIGHT0, GL.GL_AMBIENT, [0.5, 0.5, 0.5, 0.5])
+            GL.glLightfv(GL.GL_LIGHT0, GL.GL_DIFFUSE, [0.3, 0.3, 0.3, 0.5])
+            GL.glLightfv(GL.GL_LIGHT0, GL.GL_SPECULAR, [0.5, 0.5, 0.5, 0.5])
+
+            GL.glMaterialfv(GL.GL_FRONT, GL.GL_AMBIENT, [0.3, 0.3, 0.3, 0.5])
+            GL.glMaterialfv(GL.GL_FRONT, GL.GL_DIFFUSE, [0.5, 0.5, 0.5, 0.5])
+            GL.glMaterialfv(GL.GL_FRONT, GL.GL_SPECULAR, [0.8, 0.8, 0.8, 0.5])
+            GL.glMaterialf(GL.GL_FRONT, GL.GL_SHININESS, 100.0)
+
+            # client array state is not part of the list, it only has to be
+            # set while compiling because that is when the vertex arrays get
+            # copied into the list
+            GL.glPushClientAttrib(GL.GL_CLIENT_VERTEX_ARRAY_BIT)
+            GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+
+            # the dark tiles go first so the color that is left set after the
+            # grid is the same as it was when the tiles were drawn one by one
+            GL.glColor4f(0.3, 0.3, 0.3, 0.4)
+            GL.glVertexPointer(3, GL.GL_FLOAT, 0, odd_tiles)
+            GL.glDrawArrays(GL.GL_QUADS, 0, len(odd_tiles))
+
+            GL.glColor4f(0.8, 0.8, 0.8, 0.4)
+            GL.glVertexPointer(3, GL.GL_FLOAT, 0, even_tiles)
+            GL.glDrawArrays(GL.GL_QUADS, 0, len(even_tiles))
+
+            GL.glPopClientAttrib()
+
+            GL.glEndList()
+
+        GL.glCallList(self._grid)
+
+    @staticmethod
+    def _build_box_arrays(rects: list[tuple[tuple, tuple]]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the (N*24, 3) quad corners and the (N*24, 3) line end points
+        of the boxes in rects.
+        """
+        bounds = np.array(rects, dtype=np.float32)  # (N,2,3)
+
+        # corner i takes x, y and z from the max point if bit 0, 1 or 2 of
+        # i is set
+        bits = (np.arange(8)[:, None] >> np.arange(3)) & 1  # (8,3)
+        corners = np.where(bits, bounds[:, 1, None, :], bounds[:, 0, None, :])  # (N,8,3)
+
+        quads = corners[:, _BOX_QUAD_CORNERS].reshape(-1, 3)
+        lines = corners[:, _BOX_LINE_CORNERS].reshape(-1, 3)
+
+        return np.ascontiguousarray(quads), np.ascontiguousarray(lines)
+
+    def _render_bounding_boxes(self, objs=None):
+        """
+        Draw the `hit_test_rect` boxes of objs, all objects if objs is None.
+
+        The box geometry of an object is kept until its rect changes and
+        all of the boxes get drawn with one call for the faces and one for
+        the edges.
+        """
+        if objs is None:
+            objs = self.objects
+
+        cache = {}
+        quads = []
+        lines = []
+        colors = []
+
+        for obj in objs:
+            rects = tuple((p1.as_float, p2.as_float) for p1, p2 in obj.hit_test_rect)
+
+            if not rects:
+                continue
+
+            obj_id = id(obj)
+            entry = self._bounding_boxes.get(obj_id, None)
+
+            if entry is None or entry[0] != rects:
+                entry = (rects,) + self._build_box_arrays(list(rects))
+
+            cache[obj_id] = entry
+            quads.append(entry[1])
+            lines.append(entry[2])
+
             if obj.is_selected:
-                GL.glColor4f(0.5, 1.0, 0.5, 0.3)
+                color = _BOX_SELECTED_COLOR
             else:
-                GL.glColor4f(1.0, 0.5, 0.5, 0.3)
-
-            for p1, p2 in obj.hit_test_rect:
-
-                x1, y1, z1 = p1.as_float
-                x2, y2, z2 = p2.as_float
-
-                # back
-                GL.glBegin(GL.GL_QUADS)
-                GL.glVertex3f(x1, y1, z1)
-                GL.glVertex3f(x2, y1, z1)
-                GL.glVertex3f(x2, y2, z1)
-                GL.glVertex3f(x1, y2, z1)
-                GL.glEnd()
-
-                # front
-                GL.glBegin(GL.GL_QUADS)
-                GL.glVertex3f(x1, y1, z2)
-                GL.glVertex3f(x2, y1, z2)
-                GL.glVertex3f(x2, y2, z2)
-                GL.glVertex3f(x1, y2, z2)
-                GL.glEnd()
-
-                # left
-                GL.glBegin(GL.GL_QUADS)
-                GL.glVertex3f(x1, y1, z1)
-                GL.glVertex3f(x1, y2, z1)
-                GL.glVertex3f(x1, y2, z2)
-                GL.glVertex3f(x1, y1, z2)
-                GL.glEnd()
-
-                # right
-                GL.glBegin(GL.GL_QUADS)
-                GL.glVertex3f(x2, y1, z1)
-                GL.glVertex3f(x2, y1, z2)
-                GL.glVertex3f(x2, y2, z2)
-                GL.glVertex3f(x2, y2, z1)
-                GL.glEnd()
-
-                # top
-                GL.glBegin(GL.GL_QUADS)
-                GL.glVertex3f(x1, y2, z1)
-                GL.glVertex3f(x2, y2, z1)
-                GL.glVertex3f(x2, y2, z2)
-                GL.glVertex3f(x1, y2, z2)
-                GL.glEnd()
-
-                # bottom
-                GL.glBegin(GL.GL_QUADS)
-                GL.glVertex3f(x1, y1, z1)
-                GL.glVertex3f(x2, y1, z1)
-                GL.glVertex3f(x2, y1, z2)
-                GL.glVertex3f(x1, y1, z2)
-                GL.glEnd()
-
-                GL.glColor4f(0.2, 0.2, 0.2, 1.0)
-                # top
-                GL.glLineWidth(1.0)
-                GL.glBegin(GL.GL_LINES)
-                GL.glVertex3f(x1, y2, z1)
-                GL.glVertex3f(x2, y2, z1)
-                GL.glEnd()
-
-                GL.glBegin(GL.GL_LINES)
-                GL.glVertex3f(x2, y2, z1)
-                GL.glVertex3f(x2, y2, z2)
-                GL.glEnd()
-
-                GL.glBegin(GL.GL_LINES)
-                GL.glVertex3f(x2, y2, z2)
-                GL.glVertex3f(x1, y2, z2)
-                GL.glEnd()
-
-                GL.glBegin(GL.GL_LINES)
-                GL.glVertex3f(x1, y2, z2)
-                GL.glVertex3f(x1, y2, z1)
-                GL.glEnd()
-
-                # bottom
-                GL.glBegin(GL.GL_LINES)
-                GL.glVertex3f(x1, y1, z1)
-                GL.glVertex3f(x2, y1, z1)
-                GL.glEnd()
-
-                GL.glBegin(GL.GL_LINES)
-                GL.glVertex3f(x2, y1, z1)
-                GL.glVertex3f(x2, y1, z2)
-                GL.glEnd()
-
-                GL.glBegin(GL.GL_LINES)
-                GL.glVertex3f(x2, y1, z2)
-                GL.glVertex3f(x1, y1, z2)
-                GL.glEnd()
-
-                GL.glBegin(GL.GL_LINES)
-                GL.glVertex3f(x1, y1, z2)
-                GL.glVertex3f(x1, y1, z1)
-                GL.glEnd()
-
-                # left
-                GL.glBegin(GL.GL_LINES)
-                GL.glVertex3f(x1, y1, z1)
-                GL.glVertex3f(x1, y2, z1)
-                GL.glEnd()
-
-                GL.glBegin(GL.GL_LINES)
-                GL.glVertex3f(x1, y1, z2)
-                GL.glVertex3f(x1, y2, z2)
-                GL.glEnd()
-
-                # right
-                GL.glBegin(GL.GL_LINES)
-                GL.glVertex3f(x2, y1, z1)
-                GL.glVertex3f(x2, y2, z1)
-                GL.glEnd()
-
-                GL.glBegin(GL.GL_LINES)
-                GL.glVertex3f(x2, y1, z2)
-                GL.glVertex3f(x2, y2, z2)
-                GL.glEnd()
+                color = _BOX_COLOR
+
+            colors.append(np.broadcast_to(color, (len(entry[1]), 4)))
+
+        # only the boxes drawn this frame are kept
+        self._bounding_boxes = cache
+
+        if not quads:
+            return
+
+        quads = np.concatenate(quads)
+        lines = np.concatenate(lines)
+        colors = np.concatenate(colors)
+
+        GL.glPushClientAttrib(GL.GL_CLIENT_VERTEX_ARRAY_BIT)
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glEnableClientState(GL.GL_COLOR_ARRAY)
+        GL.glDisableClientState(GL.GL_NORMAL_ARRAY)
+
+        GL.glColorPointer(4, GL.GL_FLOAT, 0, colors)
+        GL.glVertexPointer(3, GL.GL_FLOAT, 0, quads)
+        GL.glDrawArrays(GL.GL_QUADS, 0, len(quads))
+
+        GL.glDisableClientState(GL.GL_COLOR_ARRAY)
+
+        GL.glColor4f(0.2, 0.2, 0.2, 1.0)
+        GL.glLineWidth(1.0)
+        GL.glVertexPointer(3, GL.GL_FLOAT, 0, lines)
+        GL.glDrawArrays(GL.GL_LINES, 0, len(lines))
+
+        GL.glPopClientAttrib()
+
+    def _select_lods(self, objs: list) -> None:
+        lod_objs = [obj for obj in objs if getattr(obj, 'lod', None) is not None]
+        if not lod_objs:
+            return
+
+        rows = self.bounds.rows
+        indices = [rows[id(obj)] for obj in lod_objs]
+
+        sizes = self.camera.projected_sizes(self.bounds.mins[indices],
+                                            self.bounds.maxs[indices])
+
+        for obj, size in zip(lod_objs, sizes.tolist()):
+            obj.lod.select(size)
+
+    def _draw_instanced(self, objs: list) -> list:
+        """
+        Draw the objects that share a model with a single instanced draw
+        per model and return the objects that still need to be drawn.
+
+        Objects take part by having a `model_key` that is not None, it is
+        the same for all objects using the same mesh (the model id or the
+        key returned by `load_mesh`). Those objects also need to provide
+
+          mesh:            (normals, triangles, triangle_count[, indices])
+                           in model space, or lod: a `LODMesh` of those
+          instance_matrix: (4, 4) model to world matrix
+          color:           rgba
+          material:        the material, objects with equal materials are
+                           drawn together, the color comes from color
+
+        Selected objects are left for the normal draw so they keep their
+        highlight, as are models that only show up once.
+        """
+        if self._draw is None:
+            return objs
+
+        candidates = []
+        remaining = []
+
+        for obj in objs:
+            if getattr(obj, 'model_key', None) is None or obj.is_selected:
+                remaining.append(obj)
+            else:
+                candidates.append(obj)
+
+        groups = {}
+        material_keys = _render_queue.material_keys(candidates)
+
+        for obj in candidates:
+            # objects of the same model can sit at different LOD levels
+            lod_mesh = getattr(obj, 'lod', None)
+            level = None if lod_mesh is None else lod_mesh.level
+
+            material_key = material_keys.get(id(obj.material), -1)
+
+            groups.setdefault((obj.model_key, material_key, level), []).append(obj)
+
+        for group in groups.values():
+            if len(group) < 2:
+                remaining.extend(group)
+                continue
+
+            first = group[0]
+            normals, triangles, triangle_count, *indices = _lod.get_mesh(first)
+
+            matrices = np.array([obj.instance_matrix for obj in group], dtype=np.float32)
+            colors = np.array([obj.color for obj in group], dtype=np.float32)
+
+            self._draw.instances(normals, triangles, triangle_count, matrices,
+                                 colors, first.material, *indices)
+
+        return remaining
 
     def set_axis_overlay_angle(self):
         self.mainframe.editor3d.axis_overlay.set_angle(
@@ -496,32 +977,68 @@ class Canvas(glcanvas.GLCanvas):
 
     @_debug.timeit
     def OnDraw(self):
+        self._scheduler.begin_frame()
+
+        # the camera moves in floats, its Points are brought up to date
+        # once per frame before anything reads them
+        self.camera.sync_points()
         self.set_axis_overlay_angle()
 
         with self.context:
-            w, h = self.GetSize()
-            aspect = w / float(h)
+            if self._draw is not None:
+                self._draw.begin_frame()
 
             GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
-            GL.glMatrixMode(GL.GL_PROJECTION)
-            GL.glLoadIdentity()
-            GLU.gluPerspective(65, aspect, 0.1, 1000.0)
-
-            GL.glMatrixMode(GL.GL_MODELVIEW)
-            GL.glLoadIdentity()
 
+            # loads the projection and modelview the camera computed, the
+            # matrix mode is left at GL_MODELVIEW
             self.camera.set()
 
             GL.glPushMatrix()
 
-            objs = self.camera.get_objects_in_view(self.objects)
+            self.update_bounds()
+            self.visibility.update(self.camera.get_frustum_planes())
 
-            for obj in objs:
-                for renderer in obj.triangles:
+            in_view = self.visibility.in_view()
+            self._select_lods(in_view)
+            objs = self._draw_instanced(in_view)
+
+            opaque, transparent = self._render_lists.build(
+                objs, self.camera.eye_array)
+
+            # the queue sort is stable so draws that share a material and
+            # color keep their front to back order
+            with self._render_queue:
+                for renderer in opaque:
                     renderer()
 
+            if self._draw is None:
+                self._render_queue.clear()
+            else:
+                self._render_queue.flush(self._draw)
+
+            # drawn straight away, sorting them by material would break
+            # the back to front order blending needs
+            for renderer in transparent:
+                renderer()
+
+            if self._id_buffer is not None and self._camera_settled():
+                # the same culled list that was just drawn, the pass is
+                # skipped if neither the camera nor the scene changed.
+                # While the camera moves object_at picks on the CPU
+                self._id_buffer.render(in_view, self._get_id_key(),
+                                       *self.camera.viewport[2:], self._draw)
+
+            boxes = list(self._pending_meshes.values())
+            if self.hovered is not None and id(self.hovered) not in self._pending_meshes:
+                boxes.append(self.hovered)
+
+            if boxes:
+                self._render_bounding_boxes(boxes)
+
             self.draw_grid()
             # self._render_bounding_boxes()
+            self._draw_selection_outline()
             GL.glPopMatrix()
 
             self.SwapBuffers()
@@ -50,7 +50,7 @@ class DragObject:
         screen_new = self.anchor_screen + delta
 
         # Unproject at anchor winZ (note our unproject_point expects top-left coords)
-        world_hit = canvas.unproject_point(screen_new)
+        world_hit = canvas.camera.unproject_point(screen_new)
 
         # candidate world = world_hit + pick_offset
         candidate = world_hit + self.pick_offset
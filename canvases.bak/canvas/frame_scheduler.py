@@ -0,0 +1,117 @@
+"""
+Redraw scheduling.
+
+Mouse motion, the camera point callbacks, the key repeat loop and scene
+changes all ask for a redraw. A fast drag produces several of those for
+every frame the display can actually show. `FrameScheduler` collects them
+and paints at most once per frame interval.
+
+Every request carries the reason for the redraw. The reasons are or'ed
+together until the next paint picks them up with `begin_frame`. A request
+with `REDRAW_SCENE` also counts up `scene_generation`, the canvas keys its
+ID pass and pick results on it. Requests come from worker threads too
+(the visibility worker) so the count goes up under the same lock as the
+reasons.
+"""
+
+from typing import TYPE_CHECKING
+
+import threading
+import time
+
+import wx
+
+if TYPE_CHECKING:
+    from . import canvas as _canvas
+
+
+REDRAW_CAMERA = 0x01
+REDRAW_SCENE = 0x02
+REDRAW_SELECTION = 0x04
+REDRAW_ALL = REDRAW_CAMERA | REDRAW_SCENE | REDRAW_SELECTION
+
+
+class FrameScheduler:
+
+    def __init__(self, canvas: "_canvas.Canvas", frame_rate: int | float):
+        self.canvas = canvas
+        self.frame_interval = 1.0 / frame_rate
+
+        self._lock = threading.Lock()
+        self._reasons = 0
+
+        # goes up with every REDRAW_SCENE request
+        self.scene_generation = 0
+        self._is_scheduled = False
+        self._last_frame = 0.0
+        self._timer = None
+
+    def invalidate(self, reasons: int = REDRAW_ALL) -> None:
+        """
+        Ask for a redraw. This can be called from any thread.
+        """
+        with self._lock:
+            self._reasons |= reasons
+
+            if reasons & REDRAW_SCENE:
+                self.scene_generation += 1
+
+            if self._is_scheduled:
+                return
+
+            self._is_scheduled = True
+
+        wx.CallAfter(self._schedule)
+
+    def _schedule(self) -> None:
+        if self.canvas.is_held:
+            # the canvas calls flush once it is released
+            with self._lock:
+                self._is_scheduled = False
+            return
+
+        delay = self.frame_interval - (time.perf_counter() - self._last_frame)
+
+        if delay <= 0.0:
+            self._paint()
+        else:
+            self._timer = wx.CallLater(max(1, int(delay * 1000)), self._paint)
+
+    def _paint(self) -> None:
+        self._timer = None
+
+        try:
+            self.canvas.request_paint()
+        except RuntimeError:
+            # the canvas has been destroyed
+            pass
+
+    def flush(self) -> None:
+        """
+        Schedule the redraw for requests made while the canvas was held.
+        """
+        with self._lock:
+            if not self._reasons or self._is_scheduled:
+                return
+
+            self._is_scheduled = True
+
+        wx.CallAfter(self._schedule)
+
+    def begin_frame(self) -> int:
+        """
+        Called by the paint, returns the reasons collected since the last
+        frame.
+        """
+        with self._lock:
+            reasons = self._reasons
+            self._reasons = 0
+            self._is_scheduled = False
+
+        self._last_frame = time.perf_counter()
+        return reasons
+
+    def stop(self) -> None:
+        if self._timer is not None:
+            self._timer.Stop()
+            self._timer = None
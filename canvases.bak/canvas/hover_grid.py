@@ -0,0 +1,263 @@
+"""
+Screen space bin grid for hover picking.
+
+`object_picker.find_object` projects the boxes of every object each time
+it runs, fine for a click but not for every mouse move. `HoverGrid` keeps
+the projected window rectangle and depth of the hit test box of every
+object and bins the rectangles into a uniform grid of `CELL_SIZE` pixel
+cells over the viewport. A hover query only looks at the objects in the
+cell under the cursor and ray tests those that contain it.
+
+The rectangles only hold for the camera they were projected with. While
+the camera keeps moving the grid is left alone and `update` returns False,
+it is rebuilt once the camera generation has not changed for
+`SETTLE_TIME` seconds. Objects that move get their rectangles projected
+again on their own and are kept in a small overlay that every query tests
+next to the cell, as are objects that cover more than `MAX_CELLS` cells.
+The whole grid is rebuilt when the overlay grows past `MAX_OVERLAY`.
+"""
+
+from typing import TYPE_CHECKING
+
+import time
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from . import camera as _camera
+    from . import scene_bounds as _scene_bounds
+
+
+# size in pixels of a grid cell
+CELL_SIZE = 32
+
+# seconds the camera has to stand still before the grid gets rebuilt
+SETTLE_TIME = 0.15
+
+# pixels a rectangle is grown by for the containment test
+TOLERANCE = 3.0
+
+# objects covering more cells than this are tested on every query instead
+MAX_CELLS = 64
+
+# number of overlay objects that triggers a rebuild
+MAX_OVERLAY = 512
+
+
+class HoverGrid:
+
+    def __init__(self, bounds: "_scene_bounds.SceneBounds",
+                 camera: "_camera.Camera"):
+        self.bounds = bounds
+        self.camera = camera
+
+        # generations the grid was built for
+        self._camera_generation = -1
+        self._bounds_generation = -1
+
+        # last camera generation seen and when, to know when it settled
+        self._seen_generation = -1
+        self._seen_time = 0.0
+
+        # per object, (N,4) rects grown by TOLERANCE, (N,) depths and
+        # whether the rect can be used
+        self._rects = np.empty((0, 4), dtype=np.float64)
+        self._depths = np.empty((0,), dtype=np.float64)
+        self._valid = np.empty((0,), dtype=bool)
+
+        self._cols = 0
+        self._rows = 0
+
+        # objects of cell c are _cell_objects[_cell_starts[c]:_cell_starts[c + 1]]
+        # sorted by depth, objects the ray enters at the same distance go
+        # to the nearer one
+        self._cell_starts = np.zeros((1,), dtype=np.intp)
+        self._cell_objects = np.empty((0,), dtype=np.intp)
+
+        # objects tested on every query, their cell entries are ignored
+        self._overlay = np.empty((0,), dtype=np.intp)
+        self._in_overlay = np.empty((0,), dtype=bool)
+
+        # object indices that moved since the grid was last brought up to
+        # date
+        self._moved = set()
+
+    def mark_moved(self, indices) -> None:
+        self._moved.update(indices)
+
+    def _project(self, indices: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        bounds = self.bounds
+        rows = bounds.hit_rows[indices]
+        has_box = rows != -1
+
+        rects = np.zeros((len(indices), 4), dtype=np.float64)
+        depths = np.full((len(indices),), np.inf, dtype=np.float64)
+        valid = np.zeros((len(indices),), dtype=bool)
+
+        if has_box.any():
+            rows = rows[has_box]
+            box_rects, box_depths, box_valid = self.camera.screen_rects(
+                bounds.hit_bvh.mins[rows], bounds.hit_bvh.maxs[rows])
+
+            # a box reaching through the near plane can be anywhere on the
+            # screen, it gets the whole screen and the ray test decides
+            straddles = ~box_valid & np.isfinite(box_depths)
+            box_rects[straddles] = (-np.inf, -np.inf, np.inf, np.inf)
+
+            rects[has_box] = box_rects + (-TOLERANCE, -TOLERANCE, TOLERANCE, TOLERANCE)
+            depths[has_box] = box_depths
+            valid[has_box] = box_valid | straddles
+
+        _, _, width, height = self.camera.viewport
+
+        # rects entirely off of the screen can not be hovered
+        valid &= ((rects[:, 2] >= 0.0) & (rects[:, 0] < width) &
+                  (rects[:, 3] >= 0.0) & (rects[:, 1] < height))
+
+        return rects, depths, valid
+
+    def _cell_ranges(self, rects: np.ndarray) -> tuple[np.ndarray, ...]:
+        cols = self._cols
+        rows = self._rows
+
+        c0 = np.clip(np.floor(rects[:, 0] / CELL_SIZE), 0, cols - 1).astype(np.intp)
+        c1 = np.clip(np.floor(rects[:, 2] / CELL_SIZE), 0, cols - 1).astype(np.intp)
+        r0 = np.clip(np.floor(rects[:, 1] / CELL_SIZE), 0, rows - 1).astype(np.intp)
+        r1 = np.clip(np.floor(rects[:, 3] / CELL_SIZE), 0, rows - 1).astype(np.intp)
+
+        return c0, c1, r0, r1
+
+    def _rebuild(self) -> None:
+        bounds = self.bounds
+        camera = self.camera
+        count = len(bounds.objects)
+
+        _, _, width, height = camera.viewport
+        self._cols = max(1, int(np.ceil(width / CELL_SIZE)))
+        self._rows = max(1, int(np.ceil(height / CELL_SIZE)))
+        cell_count = self._cols * self._rows
+
+        indices = np.arange(count, dtype=np.intp)
+        self._rects, self._depths, self._valid = self._project(indices)
+
+        objs = indices[self._valid]
+        c0, c1, r0, r1 = self._cell_ranges(self._rects[objs])
+        widths = c1 - c0 + 1
+        counts = widths * (r1 - r0 + 1)
+
+        large = counts > MAX_CELLS
+        self._overlay = objs[large]
+        self._in_overlay = np.zeros((count,), dtype=bool)
+        self._in_overlay[self._overlay] = True
+
+        small = ~large
+        objs = objs[small]
+        c0 = c0[small]
+        r0 = r0[small]
+        widths = widths[small]
+        counts = counts[small]
+
+        # one entry per object and cell it covers
+        total = int(counts.sum())
+        local = np.arange(total, dtype=np.intp) - np.repeat(np.cumsum(counts) - counts, counts)
+        widths = np.repeat(widths, counts)
+
+        entry_objects = np.repeat(objs, counts)
+        entry_cells = ((np.repeat(r0, counts) + local // widths) * self._cols +
+                       np.repeat(c0, counts) + local % widths)
+
+        order = np.lexsort((self._depths[entry_objects], entry_cells))
+        self._cell_objects = entry_objects[order]
+
+        self._cell_starts = np.zeros((cell_count + 1,), dtype=np.intp)
+        np.cumsum(np.bincount(entry_cells, minlength=cell_count), out=self._cell_starts[1:])
+
+        self._camera_generation = camera.generation
+        self._bounds_generation = bounds.generation
+        self._moved.clear()
+
+    def _update_moved(self) -> None:
+        moved = np.fromiter(self._moved, dtype=np.intp)
+        self._moved.clear()
+
+        moved = moved[moved < len(self._valid)]
+        rects, depths, valid = self._project(moved)
+
+        self._rects[moved] = rects
+        self._depths[moved] = depths
+        self._valid[moved] = valid
+
+        self._in_overlay[moved] = True
+        self._overlay = np.union1d(self._overlay, moved)
+
+    def update(self) -> bool:
+        """
+        Bring the grid up to date, returns False while the camera is moving
+        and the grid can not be used. Call after the bounds are updated.
+        """
+        camera = self.camera
+
+        if self.bounds.generation != self._bounds_generation:
+            self._rebuild()
+            return True
+
+        if camera.generation != self._camera_generation:
+            now = time.monotonic()
+
+            if camera.generation != self._seen_generation:
+                self._seen_generation = camera.generation
+                self._seen_time = now
+                return False
+
+            if now - self._seen_time < SETTLE_TIME:
+                return False
+
+            self._rebuild()
+            return True
+
+        if self._moved:
+            if len(self._overlay) + len(self._moved) > MAX_OVERLAY:
+                self._rebuild()
+            else:
+                self._update_moved()
+
+        return True
+
+    def query(self, x: float, y: float):
+        """
+        The object under window pixel x, y (top-left origin) or None. Only
+        valid after `update` returned True.
+        """
+        col = int(x // CELL_SIZE)
+        row = int(y // CELL_SIZE)
+
+        if 0 <= col < self._cols and 0 <= row < self._rows:
+            cell = row * self._cols + col
+            objs = self._cell_objects[self._cell_starts[cell]:self._cell_starts[cell + 1]]
+            objs = objs[~self._in_overlay[objs]]
+
+            if len(self._overlay):
+                objs = np.concatenate((objs, self._overlay))
+        else:
+            objs = self._overlay
+
+        if not len(objs):
+            return None
+
+        rects = self._rects[objs]
+        objs = objs[
+            self._valid[objs] &
+            (rects[:, 0] <= x) & (x <= rects[:, 2]) &
+            (rects[:, 1] <= y) & (y <= rects[:, 3])
+        ]
+
+        if not len(objs):
+            return None
+
+        t = self.bounds.ray_test(objs, *self.camera.get_ray(x, y))
+        i = int(np.argmin(t))
+
+        if not np.isfinite(t[i]):
+            return None
+
+        return self.bounds.objects[objs[i]]
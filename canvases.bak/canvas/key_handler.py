@@ -4,9 +4,6 @@ import threading
 from . import canvas as _canvas
 
 
-from ...wrappers.decimal import Decimal as _decimal
-
-
 Config = _canvas.Config
 
 
@@ -279,8 +276,7 @@ class KeyHandler:
             elif key == Config.rotate.right_key:
                 dx += 1.0
 
-        self.canvas.rotate(_decimal(dx) * _decimal(factor),
-                           _decimal(dy) * _decimal(factor))
+        self.canvas.rotate(dx * factor, dy * factor)
 
     def _process_pan_tilt_key(self, factor, *keys):
         dx = 0.0
@@ -296,8 +292,7 @@ class KeyHandler:
             elif key == Config.pan_tilt.right_key:
                 dx += 1.0
 
-        self.canvas.pan_tilt(_decimal(dx) * _decimal(factor),
-                             _decimal(dy) * _decimal(factor))
+        self.canvas.pan_tilt(dx * factor, dy * factor)
 
     def _process_truck_pedistal_key(self, factor, *keys):
         dx = 0.0
@@ -313,8 +308,7 @@ class KeyHandler:
             elif key == Config.truck_pedistal.right_key:
                 dx += 3.0
 
-        self.canvas.truck_pedistal(_decimal(dx) * _decimal(factor),
-                                   _decimal(dy) * _decimal(factor))
+        self.canvas.truck_pedistal(dx * factor, dy * factor)
 
     def _process_walk_key(self, factor, *keys):
         dx = 0.0
@@ -330,8 +324,7 @@ class KeyHandler:
             elif key == Config.walk.right_key:
                 dx -= 1.0
 
-        self.canvas.walk(_decimal(dx) * _decimal(factor),
-                         _decimal(dy) * _decimal(factor))
+        self.canvas.walk(dx * factor, dy * factor)
 
     def _process_zoom_key(self, factor, *keys):
         delta = 0.0
@@ -342,7 +335,7 @@ class KeyHandler:
             elif key == Config.zoom.out_key:
                 delta -= 1.0
 
-        self.canvas.zoom(_decimal(delta) * _decimal(factor), None)
+        self.canvas.zoom(delta * factor, None)
 
     def _process_reset_key(self, *_):
         self.canvas.camera.reset()
@@ -0,0 +1,147 @@
+"""
+Triangle level ray picking.
+
+Picking with the hit test boxes of the objects finds the box the ray
+enters first, which is not always the object that is drawn under the
+mouse. A wire that runs through the box of a housing gets lost behind the
+housing even where nothing of the housing is in the way.
+
+`MeshBVH` puts a `bvh.BVH` over the triangles of a mesh in model space and
+intersects rays with the triangles the BVH hands back, all of them in one
+vectorized Möller–Trumbore test. The triangles are tested in batches in
+the order the ray enters their boxes, once a hit is closer than where the
+ray enters the next batch the rest can not be closer and are skipped.
+
+Building the tree is the expensive part, `get_mesh_bvh` builds it the first
+time a mesh gets picked and keeps it for as long as the vertex array of
+the mesh is alive. All objects that share a mesh share its tree.
+"""
+
+import weakref
+
+import numpy as np
+
+from . import bvh as _bvh
+
+
+# number of triangles tested per vectorized batch
+BATCH_SIZE = 256
+
+# id(vertex array) -> MeshBVH
+_cache: dict[int, "MeshBVH"] = {}
+
+
+def ray_triangles_intersect(orig: np.ndarray, direc: np.ndarray, v0: np.ndarray,
+                            edge1: np.ndarray, edge2: np.ndarray,
+                            eps: float = 1e-9) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Möller–Trumbore for one ray against (T,3) triangles given as a corner
+    and the two edges leaving it. Returns (hit, t) as (T,) arrays, t is only
+    meaningful where hit is True.
+    """
+    h = np.cross(direc, edge2)
+    a = np.einsum('ij,ij->i', edge1, h)
+
+    # parallel triangles get a = 1 so the divide stays finite, hit masks
+    # them out
+    parallel = np.abs(a) < eps
+    f = 1.0 / np.where(parallel, 1.0, a)
+
+    s = orig - v0
+    u = f * np.einsum('ij,ij->i', s, h)
+
+    q = np.cross(s, edge1)
+    v = f * (q @ direc)
+    t = f * np.einsum('ij,ij->i', edge2, q)
+
+    hit = ~parallel & (u >= 0.0) & (u <= 1.0) & (v >= 0.0) & (u + v <= 1.0) & (t > eps)
+
+    return hit, t
+
+
+def _mesh_corners(mesh) -> np.ndarray:
+    """
+    (T,3,3) corners of the triangles of a mesh as it is handed to
+    `DrawWrapper.model`, (normals, triangles, triangle_count[, indices]).
+    """
+    _, vertices, triangle_count, *indices = mesh
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+
+    if indices and indices[0] is not None:
+        faces = np.asarray(indices[0]).reshape(-1)[:triangle_count].reshape(-1, 3)
+        return vertices[faces]
+
+    return vertices[:triangle_count - triangle_count % 3].reshape(-1, 3, 3)
+
+
+class MeshBVH:
+
+    def __init__(self, mesh):
+        """
+        mesh: (normals, triangles, triangle_count[, indices]) in model space
+        """
+        corners = _mesh_corners(mesh)
+
+        self.v0 = corners[:, 0]
+        self.edge1 = corners[:, 1] - self.v0
+        self.edge2 = corners[:, 2] - self.v0
+
+        # the triangles never move, fat boxes would only loosen the tree
+        self.bvh = _bvh.BVH(corners.min(axis=1), corners.max(axis=1), margin=0.0)
+
+    def __len__(self) -> int:
+        return len(self.v0)
+
+    def intersect(self, origin, direction,
+                  t_max: float = np.inf) -> tuple[int, float] | None:
+        """
+        Returns (triangle, t) for the closest triangle the ray hits before
+        t_max or None. t is in units of direction, which does not need to
+        be normalized.
+        """
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(direction, dtype=np.float64)
+
+        triangles, t_enter = self.bvh.query_ray(origin, direction, t_max)
+
+        best_triangle = None
+        best_t = t_max
+
+        for start in range(0, len(triangles), BATCH_SIZE):
+            if t_enter[start] > best_t:
+                break
+
+            batch = triangles[start:start + BATCH_SIZE]
+            hit, t = ray_triangles_intersect(origin, direction, self.v0[batch],
+                                             self.edge1[batch], self.edge2[batch])
+
+            hit &= t < best_t
+            if hit.any():
+                t = np.where(hit, t, np.inf)
+                i = int(np.argmin(t))
+
+                best_triangle = int(batch[i])
+                best_t = float(t[i])
+
+        if best_triangle is None:
+            return None
+
+        return best_triangle, best_t
+
+
+def get_mesh_bvh(mesh) -> MeshBVH:
+    """
+    The `MeshBVH` of mesh, built the first time it is asked for.
+    """
+    vertices = mesh[1]
+    key = id(vertices)
+
+    mesh_bvh = _cache.get(key, None)
+    if mesh_bvh is None:
+        mesh_bvh = MeshBVH(mesh)
+        _cache[key] = mesh_bvh
+
+        # ids get reused once the array is gone, the tree goes with it
+        weakref.finalize(vertices, _cache.pop, key, None)
+
+    return mesh_bvh
@@ -2,7 +2,8 @@ import wx
 
 from . import canvas as _canvas
 from . import dragging as _dragging
-from . import object_picker as _object_picker
+from . import frame_scheduler as _frame_scheduler
+from . import selection as _selection
 from . import free_rotate as _free_rotate
 from ...wrappers.decimal import Decimal as _decimal
 from ...geometry import point as _point
@@ -54,6 +55,10 @@ class MouseHandler:
         self.mouse_pos = None
         self._free_rot: _free_rotate.FreeRotate = None
 
+        # window points of the box or lasso being dragged, None when no
+        # selection drag is going on
+        self._band = None
+
         canvas.Bind(wx.EVT_LEFT_UP, self.on_left_up)
         canvas.Bind(wx.EVT_LEFT_DOWN, self.on_left_down)
         canvas.Bind(wx.EVT_LEFT_DCLICK, self.on_left_dclick)
@@ -106,11 +111,10 @@ class MouseHandler:
 
     def on_left_down(self, evt: wx.MouseEvent):
         x, y = evt.GetPosition()
-        mouse_pos = _point.Point(_decimal(x), _decimal(y))
-        self.mouse_pos = mouse_pos
+        self.mouse_pos = (x, y)
         self.is_motion = False
 
-        selected = _object_picker.find_object(mouse_pos, self.canvas.objects)
+        selected = self.canvas.object_at(x, y)
         # if isinstance(selected, (_cavity.Cavity, _housing.Housing)):
         #     with self.canvas:
         #         if selected == self.canvas.selected:
@@ -167,6 +171,7 @@ class MouseHandler:
 
                 selected.is_selected = True
                 # store drag state on canvas
+                mouse_pos = _point.Point(_decimal(x), _decimal(y))
                 self._drag_obj = _dragging.DragObject(obj, selected,
                                                       anchor_screen=win_point,
                                                       pick_offset=pick_offset,
@@ -174,11 +179,61 @@ class MouseHandler:
                                                       start_obj_pos=obj.position.copy(),
                                                       last_pos=obj.position.copy())
 
-            self.canvas.Refresh(True)
+            self.canvas.invalidate(_frame_scheduler.REDRAW_SELECTION)
+
+        elif self.canvas.selection_tool is not None:
+            # with a selection tool a left drag selects instead of moving
+            # the camera
+            if not self.canvas.HasCapture():
+                self.canvas.CaptureMouse()
+
+            self._band = [(x, y)]
+
+    def _update_band(self, x: int, y: int) -> None:
+        band = self._band
+
+        if self.canvas.selection_tool == _selection.TOOL_LASSO:
+            # skip points that add nothing to the outline
+            last_x, last_y = band[-1]
+            if abs(x - last_x) + abs(y - last_y) < 3:
+                return
+
+            band.append((x, y))
+            self.canvas.selection_outline = band
+        else:
+            del band[1:]
+            band.append((x, y))
+
+            (x0, y0), (x1, y1) = band
+            self.canvas.selection_outline = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+
+        self.canvas.invalidate(_frame_scheduler.REDRAW_SELECTION)
+
+    def _finish_band(self, evt: wx.MouseEvent) -> None:
+        band = self._band
+        self._band = None
+        self.canvas.selection_outline = None
+
+        mode = _selection.get_mode(evt.ShiftDown(), evt.ControlDown())
+
+        if len(band) == 1:
+            # a click without a drag selects what is under the mouse
+            obj = self.canvas.object_at(*band[0])
+            self.canvas.select([] if obj is None else [obj], mode)
+
+        elif self.canvas.selection_tool == _selection.TOOL_LASSO:
+            self.canvas.select_lasso(band, mode)
+        else:
+            x0, y0 = band[0]
+            x1, y1 = band[-1]
+            self.canvas.select_box(x0, y0, x1, y1, mode)
 
     def on_left_up(self, evt: wx.MouseEvent):
         self._process_mouse_release(evt)
         with self.canvas:
+            if self._band is not None:
+                self._finish_band(evt)
+
             self._free_rot = None
 
             if self._drag_obj is not None:
@@ -188,7 +243,7 @@ class MouseHandler:
                 if self.canvas.HasCapture():
                     self.canvas.ReleaseMouse()
 
-                self.canvas.Refresh(False)
+                self.canvas.invalidate(_frame_scheduler.REDRAW_SELECTION)
 
             evt.Skip()
 
@@ -222,7 +277,7 @@ class MouseHandler:
             self.canvas.CaptureMouse()
 
         x, y = evt.GetPosition()
-        self.mouse_pos = _point.Point(_decimal(x), _decimal(y))
+        self.mouse_pos = (x, y)
 
         evt.Skip()
 
@@ -233,9 +288,7 @@ class MouseHandler:
     def on_right_up(self, evt: wx.MouseEvent):
         if not self.is_motion:
             x, y = evt.GetPosition()
-            mouse_pos = _point.Point(_decimal(x), _decimal(y))
-
-            selected = _object_picker.find_object(mouse_pos, self.canvas.objects)
+            selected = self.canvas.object_at(x, y)
             # if selected is not None:
             #     if isinstance(selected, _wire.Wire):
             #         menu = wx.Menu()
@@ -607,7 +660,7 @@ class MouseHandler:
             self.canvas.CaptureMouse()
 
         x, y = evt.GetPosition()
-        self.mouse_pos = _point.Point(_decimal(x), _decimal(y))
+        self.mouse_pos = (x, y)
 
         evt.Skip()
 
@@ -617,55 +670,71 @@ class MouseHandler:
 
     def on_mouse_wheel(self, evt: wx.MouseEvent):
         if evt.GetWheelRotation() > 0:
-            delta = _decimal(1.0)
+            delta = 1.0
         else:
-            delta = -_decimal(1.0)
+            delta = -1.0
 
-        self._process_mouse(MOUSE_WHEEL)(delta, _decimal(0.0))
+        self._process_mouse(MOUSE_WHEEL)(delta, 0.0)
 
-        self.canvas.Refresh(False)
+        self.canvas.invalidate(_frame_scheduler.REDRAW_CAMERA)
         evt.Skip()
 
     def on_mouse_motion(self, evt: wx.MouseEvent):
         if evt.Dragging():
             x, y = evt.GetPosition()
-            new_mouse_pos = _point.Point(_decimal(x), _decimal(y))
 
             if self.mouse_pos is None:
-                self.mouse_pos = new_mouse_pos
+                self.mouse_pos = (x, y)
 
-            delta = new_mouse_pos - self.mouse_pos
-            self.mouse_pos = new_mouse_pos
+            # camera moves take plain floats, a Point is only made for
+            # dragging an object
+            dx = float(x - self.mouse_pos[0])
+            dy = float(y - self.mouse_pos[1])
+            self.mouse_pos = (x, y)
 
             with self.canvas:
                 if evt.LeftIsDown():
-                    if self._drag_obj is not None:
+                    if self._band is not None:
+                        self._update_band(x, y)
+
+                    elif self._drag_obj is not None:
+                        new_mouse_pos = _point.Point(_decimal(x), _decimal(y))
+
                         if self._drag_obj.owner.is_move_shown:
-                            self._drag_obj.move(self, new_mouse_pos)
+                            self._drag_obj.move(self.canvas, new_mouse_pos)
 
                         elif self._drag_obj.owner.is_angle_shown:
-                            self._drag_obj.rotate(self, new_mouse_pos)
+                            self._drag_obj.rotate(self.canvas, new_mouse_pos)
+
+                        self.canvas.object_moved(self._drag_obj.owner)
+                        self.canvas.object_moved(self._drag_obj.obj)
 
                     elif self._free_rot is not None:
                         self._free_rot(x, y)
                     else:
                         self.is_motion = True
-                        self._process_mouse(MOUSE_LEFT)(*list(delta)[:-1])
+                        self._process_mouse(MOUSE_LEFT)(dx, dy)
 
                 if evt.MiddleIsDown():
                     self.is_motion = True
-                    self._process_mouse(MOUSE_MIDDLE)(*list(delta)[:-1])
+                    self._process_mouse(MOUSE_MIDDLE)(dx, dy)
                 if evt.RightIsDown():
                     self.is_motion = True
-                    self._process_mouse(MOUSE_RIGHT)(*list(delta)[:-1])
+                    self._process_mouse(MOUSE_RIGHT)(dx, dy)
                 if evt.Aux1IsDown():
                     self.is_motion = True
-                    self._process_mouse(MOUSE_AUX1)(*list(delta)[:-1])
+                    self._process_mouse(MOUSE_AUX1)(dx, dy)
                 if evt.Aux2IsDown():
                     self.is_motion = True
-                    self._process_mouse(MOUSE_AUX2)(*list(delta)[:-1])
+                    self._process_mouse(MOUSE_AUX2)(dx, dy)
 
-            self.canvas.Refresh(False)
+            if self._drag_obj is not None or self._free_rot is not None:
+                self.canvas.invalidate(_frame_scheduler.REDRAW_SCENE)
+            elif self._band is None:
+                self.canvas.invalidate(_frame_scheduler.REDRAW_CAMERA)
+        else:
+            x, y = evt.GetPosition()
+            self.canvas.hover_at(x, y)
 
         evt.Skip()
 
@@ -691,7 +760,7 @@ class MouseHandler:
             self.canvas.CaptureMouse()
 
         x, y = evt.GetPosition()
-        self.mouse_pos = _point.Point(_decimal(x), _decimal(y))
+        self.mouse_pos = (x, y)
 
         evt.Skip()
 
@@ -710,7 +779,7 @@ class MouseHandler:
             self.canvas.CaptureMouse()
 
         x, y = evt.GetPosition()
-        self.mouse_pos = _point.Point(_decimal(x), _decimal(y))
+        self.mouse_pos = (x, y)
 
         evt.Skip()
 
@@ -4,18 +4,34 @@ End-to-end CPU picking pipeline:
  - Screen-space AABB projection + 2D mouse containment (cheap filter)
  - Depth metric (eye-space z or ray-AABB t) and sorting
  - Ray-AABB refinement (slab test)
+ - Ray-OBB refinement for objects that provide `local_hit_test_rect`, the
+   hit test box in their own frame, turned by `angle.as_matrix` and moved
+   to `position` (`_ray_intersect_obbs`)
  - Optional ray-triangle Möller–Trumbore intersection for exact mesh hit
+   (`pick_surface`, the triangles are searched with a `mesh_bvh.MeshBVH`)
 
 This file provides:
  - build frustum from camera params or from view/projection matrices
  - fast filters and precise refinements
- - example pick-on-click handler that cycles candidates on repeated clicks
+ - `Picker`, the pick state of a canvas. It keeps the ray, the candidates
+   and the results of the last pick keyed on the mouse position and the
+   camera and scene generations, a repeat pick at the same spot in an
+   unchanged view costs nothing and a changed view never gets a stale one
 """
 
+from typing import TYPE_CHECKING
+
 import numpy as np
 from OpenGL.GL import *
 from math import inf
 
+from ..renderers import lod as _lod
+from . import mesh_bvh as _mesh_bvh
+
+if TYPE_CHECKING:
+    from . import camera as _camera
+    from . import scene_bounds as _scene_bounds
+
 
 def _gl_get_matrices():
     """
@@ -135,6 +151,29 @@ def _ray_intersect_aabb(orig, direc, aabb_min, aabb_max, t0=0.0, t1=inf):
     return False, None
 
 
+def _ray_intersect_aabbs(orig, direc, aabb_mins, aabb_maxs, t0=0.0, t1=inf):
+    """
+    `_ray_intersect_aabb` for (N,3) boxes at once, returns (hit, t_enter)
+    as (N,) arrays. t_enter is only meaningful where hit is True.
+    """
+    aabb_mins = np.asarray(aabb_mins, dtype=np.float64).reshape(-1, 3)
+    aabb_maxs = np.asarray(aabb_maxs, dtype=np.float64).reshape(-1, 3)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv_dir = 1.0 / direc
+
+        tmin_all = (aabb_mins - orig) * inv_dir
+        tmax_all = (aabb_maxs - orig) * inv_dir
+
+    tmin = np.minimum(tmin_all, tmax_all)
+    tmax = np.maximum(tmin_all, tmax_all)
+
+    t_enter = np.maximum(tmin.max(axis=1), t0)
+    t_exit = np.minimum(tmax.min(axis=1), t1)
+
+    return (t_enter <= t_exit) & (t_exit >= 0.0), t_enter
+
+
 # Ray-triangle Möller–Trumbore
 def _ray_triangle_intersect(orig, dir, v0, v1, v2, eps=1e-9):  # NOQA
     edge1 = v1 - v0  # NOQA
@@ -165,67 +204,81 @@ def _ray_triangle_intersect(orig, dir, v0, v1, v2, eps=1e-9):  # NOQA
     return False, None
 
 
-def _aabb_screen_bbox_and_depth(aabb_min, aabb_max, mv, pj,
-                                viewport, flip_y_for_ui=True):
+def _aabb_corners(mins, maxs):
     """
-    Build a 2D screen bbox from projecting ALL 8 AABB corners.
-    This is necessary for stability across camera yaw/pitch.
+    The 8 corners of (N,3) boxes as (N,8,3), in the same order as the
+    corners of a single box have always been listed.
     """
+    mins = np.asarray(mins, dtype=np.float64).reshape(-1, 3)
+    maxs = np.asarray(maxs, dtype=np.float64).reshape(-1, 3)
 
-    mn = np.array(aabb_min.as_float, dtype=np.float64)
-    mx = np.array(aabb_max.as_float, dtype=np.float64)
-
-    corners = np.array(
-        [
-            [mn[0], mn[1], mn[2]],
-            [mn[0], mn[1], mx[2]],
-            [mn[0], mx[1], mn[2]],
-            [mn[0], mx[1], mx[2]],
-            [mx[0], mn[1], mn[2]],
-            [mx[0], mn[1], mx[2]],
-            [mx[0], mx[1], mn[2]],
-            [mx[0], mx[1], mx[2]],
-        ],
-        dtype=np.float64
-    )
+    # bit 2 picks x, bit 1 picks y and bit 0 picks z from the max corner
+    bits = (np.arange(8)[:, None] >> np.array([2, 1, 0])) & 1
+    return np.where(bits[None, :, :] == 1, maxs[:, None, :], mins[:, None, :])
 
-    screen_pts = []
-    depths = []
-    any_in_front = False
 
-    for c in corners:
-        proj = _project_point_world(c, mv, pj, viewport)
-        if proj is None:
-            continue
+def _aabbs_screen_bbox_and_depth(aabb_mins, aabb_maxs, mv, pj,
+                                 viewport, flip_y_for_ui=True):
+    """
+    `_aabb_screen_bbox_and_depth` for (N,3) boxes at once. All of the
+    corners get projected with a single (N*8,4) matrix multiply.
 
-        wx, wy, wz, eye_coords = proj
-        if flip_y_for_ui:
-            wy = viewport[3] - wy
+    Returns (bbox2d, depth, valid), bbox2d is (N,4) as
+    (minx, miny, maxx, maxy), depth is (N,) and valid is False for the
+    boxes that have no corner that could be projected.
+    """
+    corners = _aabb_corners(aabb_mins, aabb_maxs)
+    count = len(corners)
 
-        screen_pts.append((wx, wy, wz))
+    points = np.ones((count * 8, 4), dtype=np.float64)
+    points[:, :3] = corners.reshape(-1, 3)
 
-        eye_z = eye_coords[2]
-        if eye_z < 0:
-            any_in_front = True
-            depths.append(-eye_z)
-        else:
-            depths.append(inf)
+    # row-major matrices, points are rows so they multiply transposed
+    eye = points @ mv.T
+    clip = eye @ pj.T
 
-    if not screen_pts:
-        return None
+    w = clip[:, 3]
+    valid = ~np.isclose(w, 0.0)
+    w = np.where(valid, w, 1.0)
 
-    xs = [p[0] for p in screen_pts]
-    ys = [p[1] for p in screen_pts]
+    ndc = clip[:, :3] / w[:, None]
+    vx, vy, vw, vh = viewport
 
-    bbox2d = (min(xs), min(ys), max(xs), max(ys))
+    winx = vx + (ndc[:, 0] + 1.0) * vw * 0.5
+    winy = vy + (ndc[:, 1] + 1.0) * vh * 0.5
+    if flip_y_for_ui:
+        winy = vh - winy
 
-    # depth metric: closest in-front corner if possible
-    if any_in_front:
-        depth_metric = float(min(d for d in depths if d != inf))
-    else:
-        depth_metric = float(min(depths))
+    valid = valid.reshape(count, 8)
+    winx = winx.reshape(count, 8)
+    winy = winy.reshape(count, 8)
 
-    return bbox2d, depth_metric
+    bbox2d = np.stack((np.where(valid, winx, inf).min(axis=1),
+                       np.where(valid, winy, inf).min(axis=1),
+                       np.where(valid, winx, -inf).max(axis=1),
+                       np.where(valid, winy, -inf).max(axis=1)), axis=1)
+
+    # depth metric: closest in-front corner, inf if none is in front
+    eye_z = eye[:, 2].reshape(count, 8)
+    depth = np.where(valid & (eye_z < 0.0), -eye_z, inf).min(axis=1)
+
+    return bbox2d, depth, valid.any(axis=1)
+
+
+def _aabb_screen_bbox_and_depth(aabb_min, aabb_max, mv, pj,
+                                viewport, flip_y_for_ui=True):
+    """
+    Build a 2D screen bbox from projecting ALL 8 AABB corners.
+    This is necessary for stability across camera yaw/pitch.
+    """
+
+    bbox2d, depth, valid = _aabbs_screen_bbox_and_depth(
+        aabb_min.as_float, aabb_max.as_float, mv, pj, viewport, flip_y_for_ui)
+
+    if not valid[0]:
+        return None
+
+    return tuple(bbox2d[0].tolist()), float(depth[0])
 
 
 def _get_obj_rotation_matrix_3x3(obj) -> np.ndarray | None:
@@ -284,14 +337,95 @@ def _ray_intersect_obb_via_local_aabb(orig_world, dir_world, local_min,
     return _ray_intersect_aabb(o_local, d_local, local_min, local_max)
 
 
-# Candidate picking + cycling
-last_pick_state = {
-    'mouse_pos': None,
-    'candidates': [],
-    'index': 0
-}
+def _ray_intersect_obbs(orig_world, dir_world, local_mins, local_maxs,
+                        rotations, translations, t0=0.0, t1=inf):
+    """
+    `_ray_intersect_obb_via_local_aabb` for (N,3) local boxes with (N,3,3)
+    rotations and (N,3) translations at once, returns (hit, t_enter) as
+    (N,) arrays.
+
+    The local direction is not normalized, the rotations are orthonormal so
+    t_enter is the world distance along the ray and can be compared with
+    the t of world boxes.
+    """
+    rotations = np.asarray(rotations, dtype=np.float64).reshape(-1, 3, 3)
+    translations = np.asarray(translations, dtype=np.float64).reshape(-1, 3)
+
+    # (p - t) @ R.T for every box
+    o_local = np.einsum('nj,nkj->nk', orig_world - translations, rotations)
+    d_local = np.einsum('j,nkj->nk', dir_world, rotations)
+
+    return _ray_intersect_aabbs(o_local, d_local, local_mins, local_maxs, t0, t1)
+
+
+def _hit_test_boxes(objs):
+    """
+    The world hit test AABBs of objs as two (N,3) arrays.
+    """
+    aabb_mins = np.empty((len(objs), 3), dtype=np.float64)
+    aabb_maxs = np.empty((len(objs), 3), dtype=np.float64)
+
+    for i, obj in enumerate(objs):
+        p1, p2 = obj.hit_test_rect[0]
+        aabb_mins[i] = p1.as_float
+        aabb_maxs[i] = p2.as_float
+
+    return aabb_mins, aabb_maxs
 
 
+def _obb_boxes(objs):
+    """
+    The oriented hit test boxes of the objects in objs that provide a
+    `local_hit_test_rect`. Returns (indices, local_mins, local_maxs,
+    rotations, translations), indices are into objs.
+    """
+    indices = []
+    local_mins = []
+    local_maxs = []
+    rotations = []
+    translations = []
+
+    for i, obj in enumerate(objs):
+        local_rect = getattr(obj, 'local_hit_test_rect', None)
+        if not local_rect:
+            continue
+
+        p1, p2 = local_rect[0]
+        indices.append(i)
+        local_mins.append(p1.as_float)
+        local_maxs.append(p2.as_float)
+        rotations.append(_get_obj_rotation_matrix_3x3(obj))
+        translations.append(_get_obj_translation_3(obj))
+
+    return (np.array(indices, dtype=np.intp),
+            np.array(local_mins, dtype=np.float64).reshape(-1, 3),
+            np.array(local_maxs, dtype=np.float64).reshape(-1, 3),
+            np.array(rotations, dtype=np.float64).reshape(-1, 3, 3),
+            np.array(translations, dtype=np.float64).reshape(-1, 3))
+
+
+def _ray_test_objects(orig, direc, objs):
+    """
+    Where the ray enters the hit test box of each object in objs as a (N,)
+    array, inf for a miss. The world boxes are tested first and the
+    objects with an oriented box that were hit are tested again with that.
+    """
+    hit, t_hit = _ray_intersect_aabbs(orig, direc, *_hit_test_boxes(objs))
+    t_hit = np.where(hit, t_hit, inf)
+
+    hit_objs = [objs[i] for i in np.flatnonzero(hit).tolist()]
+    indices, local_mins, local_maxs, rotations, translations = _obb_boxes(hit_objs)
+
+    if len(indices):
+        indices = np.flatnonzero(hit)[indices]
+        hit, t_obb = _ray_intersect_obbs(orig, direc, local_mins, local_maxs,
+                                         rotations, translations)
+        t_hit[indices] = np.where(hit, t_obb, inf)
+
+    return t_hit
+
+
+# Candidate picking
 def _pick_candidates_at_mouse(mx, my, scene_objects, mv=None, pj=None, viewport=None,
                              mouse_is_top_left=True, tol_pixels=3.0, max_candidates=128):  # NOQA
     """
@@ -304,50 +438,75 @@ def _pick_candidates_at_mouse(mx, my, scene_objects, mv=None, pj=None, viewport=
     if mv is None or pj is None or viewport is None:
         mv, pj, viewport = _gl_get_matrices()
 
-    mx_screen = mx
-    my_screen = my
+    scene_objects = list(scene_objects)
+    if not scene_objects:
+        return []
 
-    candidates = []
-    for obj in scene_objects:
-        res = _aabb_screen_bbox_and_depth(obj.hit_test_rect[0][0], obj.hit_test_rect[0][1],
-                                          mv, pj, viewport, flip_y_for_ui=True)
+    aabb_mins, aabb_maxs = _hit_test_boxes(scene_objects)
+    bbox2d, depth, valid = _aabbs_screen_bbox_and_depth(aabb_mins, aabb_maxs,
+                                                        mv, pj, viewport,
+                                                        flip_y_for_ui=True)
+    minx, miny, maxx, maxy = bbox2d.T
 
-        if res is None:
-            continue
+    inside = (
+        valid &
+        (minx - tol_pixels <= mx) & (mx <= maxx + tol_pixels) &
+        (miny - tol_pixels <= my) & (my <= maxy + tol_pixels)
+    )
 
-        (minx, miny, maxx, maxy), depth = res
+    indices = np.flatnonzero(inside)
+    indices = indices[np.argsort(depth[indices], kind='stable')][:max_candidates]
 
-        if (
-            minx - tol_pixels <= mx_screen <= maxx + tol_pixels and
-            miny - tol_pixels <= my_screen <= maxy + tol_pixels
-        ):
+    return [(depth_metric, scene_objects[i]) for depth_metric, i in
+            zip(depth[indices].tolist(), indices.tolist())]
 
-            candidates.append((depth, obj))
 
-    candidates.sort(key=lambda k: k[0])
+def _pick_candidates_on_ray(mx, my, bounds, mv, pj, viewport, max_candidates=128):
+    """
+    bounds: `scene_bounds.SceneBounds` of the scene
 
-    return candidates[:max_candidates]
+    Uses the BVH of bounds to find the objects whose hit test box is under
+    the mouse. Returns list of (t, object) sorted by t (closest first)
+    """
 
+    o, d = _mouse_ray_from_screen(mx, my, mv, pj, viewport)
+    if o is None:
+        return []
+
+    return bounds.pick(o, d)[:max_candidates]
 
-def find_object(mouse_pos, scene_objects):
-    mx, my = mouse_pos.as_float[:-1]
 
-    mv, pj, vp = _gl_get_matrices()
-    move_thresh = 4.0
+def find_object(mouse_pos, scene_objects, bounds=None, camera=None, exact=False):
+    """
+    bounds: optional `scene_bounds.SceneBounds` holding scene_objects, when
+    given the candidates are looked up in its BVH instead of projecting
+    every object
+
+    camera: optional `camera.Camera`, its cached matrices are used instead
+    of reading them back from GL
+
+    exact: pick the object whose surface is under the mouse, see
+    `pick_surface`, instead of the closest hit test box
+    """
+    if exact:
+        hit = pick_surface(mouse_pos, scene_objects, bounds, camera)
+        if hit is None:
+            return None
 
-    # refresh candidate list if mouse moved significantly
-    if last_pick_state['mouse_pos'] is None:
-        moved = True
+        return hit[0]
+
+    mx, my = mouse_pos.as_float[:-1]
+
+    if camera is None:
+        mv, pj, vp = _gl_get_matrices()
     else:
-        moved = np.hypot(mx - last_pick_state['mouse_pos'][0],
-                         my - last_pick_state['mouse_pos'][1]) > move_thresh
+        mv, pj, vp = camera.get_matrices()
 
-    if moved:
-        last_pick_state['candidates'] = _pick_candidates_at_mouse(mx, my, scene_objects, mv, pj, vp)
-        last_pick_state['mouse_pos'] = (mx, my)
-        last_pick_state['index'] = 0
+    if bounds is None:
+        cands = _pick_candidates_at_mouse(mx, my, scene_objects, mv, pj, vp)
+    else:
+        cands = _pick_candidates_on_ray(mx, my, bounds, mv, pj, vp)
 
-    cands = last_pick_state['candidates']
     if not cands:
         return None
 
@@ -357,18 +516,193 @@ def find_object(mouse_pos, scene_objects):
         # fallback: just pick first candidate
         return cands[0][1]
 
-    # Evaluate ray hit for ALL candidates; pick closest t
-    best_obj = None
+    # Evaluate ray hit for ALL candidates in one go; pick closest t
+    objs = [obj for _, obj in cands]
+    t_hit = _ray_test_objects(o, d, objs)
+
+    i = int(np.argmin(t_hit))
+    if not np.isfinite(t_hit[i]):
+        return None
+
+    return objs[i]
+
+
+def _get_obj_mesh(obj):
+    """
+    (mesh, model to world matrix) of an object that provides them, the
+    same mesh (the selected LOD level) and `instance_matrix` the instanced
+    draw uses, or None.
+    """
+    mesh = _lod.get_mesh(obj)
+    matrix = getattr(obj, 'instance_matrix', None)
+
+    if mesh is None or matrix is None:
+        return None
+
+    return mesh, matrix
+
+
+def pick_surface(mouse_pos, scene_objects, bounds=None, camera=None):
+    """
+    Exact picking, finds the surface under the mouse instead of the
+    closest hit test box.
+
+    Objects that provide `mesh` and `instance_matrix` are intersected
+    triangle by triangle, the others are hit where the ray enters their
+    hit test box.
+
+    Returns (object, triangle, point) or None. triangle is the index of
+    the triangle in the mesh, None for objects without a mesh, and point is
+    the world hit point as a (3,) array.
+    """
+    mx, my = mouse_pos.as_float[:-1]
+
+    if camera is None:
+        mv, pj, vp = _gl_get_matrices()
+    else:
+        mv, pj, vp = camera.get_matrices()
+
+    o, d = _mouse_ray_from_screen(mx, my, mv, pj, vp)
+    if o is None:
+        return None
+
+    if bounds is None:
+        scene_objects = list(scene_objects)
+        if not scene_objects:
+            return None
+
+        t_hit = _ray_test_objects(o, d, scene_objects)
+        indices = np.flatnonzero(np.isfinite(t_hit))
+        indices = indices[np.argsort(t_hit[indices], kind='stable')]
+
+        candidates = [(t, scene_objects[i]) for t, i in
+                      zip(t_hit[indices].tolist(), indices.tolist())]
+    else:
+        # already narrowed down with the oriented boxes
+        candidates = bounds.pick(o, d)
+
+    return _pick_surface_on_ray(o, d, candidates)
+
+
+def _pick_surface_on_ray(o, d, candidates):
+    """
+    `pick_surface` for the ray o, d and its (t, object) candidates sorted
+    front to back.
+    """
+    best = None
     best_t = inf
 
-    for _, obj in cands:
-        # world AABB
-        wmin = obj.hit_test_rect[0][0].as_float
-        wmax = obj.hit_test_rect[0][1].as_float
+    # the candidates are sorted by where the ray enters their box, no
+    # surface of a later one can be closer than a hit in front of its box
+    for t_box, obj in candidates:
+        if t_box >= best_t:
+            break
+
+        obj_mesh = _get_obj_mesh(obj)
+        if obj_mesh is None:
+            best = (obj, None)
+            best_t = t_box
+            continue
+
+        mesh, matrix = obj_mesh
+        inv = np.linalg.inv(np.asarray(matrix, dtype=np.float64))
 
-        hit, t_hit = _ray_intersect_aabb(o, d, wmin, wmax)
-        if hit and t_hit < best_t:
-            best_t = t_hit
-            best_obj = obj
+        # the direction is not normalized in model space so t stays the
+        # world distance along the ray
+        o_local = inv[:3, :3] @ o + inv[:3, 3]
+        d_local = inv[:3, :3] @ d
 
-    return best_obj
+        res = _mesh_bvh.get_mesh_bvh(mesh).intersect(o_local, d_local, best_t)
+        if res is not None:
+            best = (obj, res[0])
+            best_t = res[1]
+
+    if best is None:
+        return None
+
+    return best[0], best[1], o + d * best_t
+
+
+class Picker:
+    """
+    Pick state of one canvas.
+
+    The ray, its candidates and the results are kept for the last pixel
+    picked and the key they were picked with, `Canvas._get_id_key`, the
+    camera, bounds and scene generations. Any change to the camera or the
+    scene changes the key, a pick with another key or at another pixel
+    starts over.
+    """
+
+    def __init__(self, bounds: "_scene_bounds.SceneBounds",
+                 camera: "_camera.Camera"):
+        self.bounds = bounds
+        self.camera = camera
+
+        # (x, y, key) of the ray below
+        self._key = None
+
+        self.ray = (None, None)
+
+        # (t, object) the ray hits, sorted front to back
+        self.candidates = []
+
+        # cached results of the pick methods by name
+        self._results = {}
+
+    def _update(self, x: int, y: int, key) -> None:
+        pick_key = (x, y, key)
+        if pick_key == self._key:
+            return
+
+        self._key = pick_key
+        self._results = {}
+
+        mv, pj, vp = self.camera.get_matrices()
+        self.ray = _mouse_ray_from_screen(x, y, mv, pj, vp)
+
+        o, d = self.ray
+        if o is None:
+            self.candidates = []
+        else:
+            self.candidates = self.bounds.pick(o, d)
+
+    def clear(self) -> None:
+        self._key = None
+        self.ray = (None, None)
+        self.candidates = []
+        self._results = {}
+
+    def find(self, x: int, y: int, key):
+        """
+        The object whose hit test box is closest under window pixel x, y
+        (top left origin) or None, see `find_object`. bounds has to be up
+        to date.
+        """
+        self._update(int(x), int(y), key)
+
+        if 'find' not in self._results:
+            # the candidates are already sorted by the distance to their
+            # oriented or world box
+            if self.candidates:
+                self._results['find'] = self.candidates[0][1]
+            else:
+                self._results['find'] = None
+
+        return self._results['find']
+
+    def pick_surface(self, x: int, y: int, key):
+        """
+        (object, triangle, point) of the surface under window pixel x, y or
+        None, see `pick_surface`. bounds has to be up to date.
+        """
+        self._update(int(x), int(y), key)
+
+        if 'surface' not in self._results:
+            o, d = self.ray
+            if o is None:
+                self._results['surface'] = None
+            else:
+                self._results['surface'] = _pick_surface_on_ray(o, d, self.candidates)
+
+        return self._results['surface']
@@ -0,0 +1,69 @@
+"""
+Draw order of the visible objects.
+
+Opaque renderers are drawn front to back so the depth test throws away
+the fragments of everything behind what has already been drawn.
+Transparent renderers are drawn after all of the opaque ones and back to
+front so they blend over what is behind them.
+
+The distance used is the squared distance from the camera eye to the
+objects position. The positions come from the `SceneBounds` arrays of the
+canvas, a camera move is one NumPy pass over them and a sort.
+"""
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from . import scene_bounds as _scene_bounds
+
+
+class RenderLists:
+
+    def __init__(self, bounds: "_scene_bounds.SceneBounds"):
+        self.bounds = bounds
+
+    def build(self, objs: list, eye) -> tuple[list, list]:
+        """
+        Returns (opaque, transparent), the renderers of objs with the
+        opaque ones ordered front to back and the transparent ones back to
+        front. Every renderer is in one of the lists exactly once.
+
+        The positions of objs are looked up in bounds, objects it does not
+        hold have theirs read from the object.
+        """
+        if not objs:
+            return [], []
+
+        rows = self.bounds.rows
+        positions = self.bounds.positions
+
+        try:
+            indices = np.fromiter((rows[id(obj)] for obj in objs),
+                                  dtype=np.intp, count=len(objs))
+        except KeyError:
+            centers = np.array([obj.position.as_float for obj in objs],
+                               dtype=np.float64)
+        else:
+            centers = positions[indices]
+
+        delta = centers - np.asarray(eye, dtype=np.float64)
+        distances = np.einsum('ij,ij->i', delta, delta)
+
+        order = np.argsort(distances, kind='stable').tolist()
+
+        opaque = []
+        transparent = []
+
+        for i in order:
+            for renderer in objs[i].triangles:
+                if renderer.is_opaque:
+                    opaque.append(renderer)
+                else:
+                    transparent.append(renderer)
+
+        # the transparent renderers were collected near to far
+        transparent.reverse()
+
+        return opaque, transparent
@@ -0,0 +1,316 @@
+"""
+Bounding boxes of all of the objects on the canvas.
+
+Culling and picking object by object means converting the `Point`s of
+every AABB with `.as_float` and testing them one at a time, for every
+frame and every click. `SceneBounds` keeps the AABBs of all objects in
+arrays with `owner` mapping each box to the object it belongs to and puts
+a `bvh.BVH` over them, one over the `rect` boxes used for culling and one
+over the `hit_test_rect` boxes used for picking. Culling the scene and
+finding the objects under the mouse then costs about the log of the
+number of objects.
+
+The world hit test box of a rotated housing is a lot larger than the
+housing and overlaps its neighbours. Objects that also provide
+`local_hit_test_rect`, their hit test box in their own unrotated frame,
+get it kept next to `angle.as_matrix` and `position`. The ray tests run
+on the world boxes first and the boxes the ray hits are then tested
+again as oriented boxes, all of them in one slab test in their local
+frames. The world box has to contain the oriented box.
+
+The arrays are rebuilt when objects are added or removed,
+`update_object` refits the boxes of an object that moved.
+"""
+
+import numpy as np
+
+from . import bvh as _bvh
+
+
+class SceneBounds:
+
+    def __init__(self):
+        self.objects: list = []
+
+        # id(obj) -> index of the object in objects
+        self.rows: dict[int, int] = {}
+
+        # per object, (N,3)
+        self.positions = np.empty((0, 3), dtype=np.float64)
+        self.mins = np.empty((0, 3), dtype=np.float64)
+        self.maxs = np.empty((0, 3), dtype=np.float64)
+
+        # rect boxes, owner maps each box to its object, (M,)
+        self.owner = np.empty((0,), dtype=np.intp)
+        self.bvh = _bvh.BVH(np.empty((0, 3)), np.empty((0, 3)))
+
+        # hit test boxes, one per object that has one
+        self.hit_owner = np.empty((0,), dtype=np.intp)
+        self.hit_bvh = _bvh.BVH(np.empty((0, 3)), np.empty((0, 3)))
+
+        # per object, row of its hit test box or -1, (N,)
+        self.hit_rows = np.empty((0,), dtype=np.intp)
+
+        # per object, local hit test box and rotation, has_obb is False for
+        # the objects without a `local_hit_test_rect`
+        self.has_obb = np.empty((0,), dtype=bool)
+        self.local_mins = np.empty((0, 3), dtype=np.float64)
+        self.local_maxs = np.empty((0, 3), dtype=np.float64)
+        self.rotations = np.empty((0, 3, 3), dtype=np.float64)
+
+        # index of the first AABB of every object, (N + 1,)
+        self.starts = np.zeros((1,), dtype=np.intp)
+
+        # goes up every time the arrays are rebuilt, object indices from
+        # an older generation are no longer valid
+        self.generation = 0
+
+        self._is_dirty = True
+
+    @property
+    def is_dirty(self) -> bool:
+        return self._is_dirty
+
+    def mark_dirty(self) -> None:
+        """
+        Have the arrays rebuilt by the next `update`.
+        """
+        self._is_dirty = True
+
+    def update(self, objs: list) -> None:
+        """
+        Rebuild the arrays from objs if they have been marked dirty.
+        """
+        if not self._is_dirty and len(objs) == len(self.objects):
+            return
+
+        self._is_dirty = False
+        self.generation += 1
+        self.objects = list(objs)
+        self.rows = {id(obj): i for i, obj in enumerate(self.objects)}
+
+        count = len(self.objects)
+        positions = np.empty((count, 3), dtype=np.float64)
+        box_mins = []
+        box_maxs = []
+        counts = np.empty((count,), dtype=np.intp)
+
+        for i, obj in enumerate(self.objects):
+            positions[i] = obj.position.as_float
+            rects = [(p1.as_float, p2.as_float) for p1, p2 in obj.rect]
+            counts[i] = len(rects)
+
+            for p1, p2 in rects:
+                box_mins.append(p1)
+                box_maxs.append(p2)
+
+        box_mins = np.array(box_mins, dtype=np.float64).reshape(-1, 3)
+        box_maxs = np.array(box_maxs, dtype=np.float64).reshape(-1, 3)
+
+        self.starts = np.zeros((count + 1,), dtype=np.intp)
+        np.cumsum(counts, out=self.starts[1:])
+
+        self.positions = positions
+        self.owner = np.repeat(np.arange(count, dtype=np.intp), counts)
+        self.bvh = _bvh.BVH(box_mins, box_maxs)
+
+        self.mins = np.full((count, 3), np.inf, dtype=np.float64)
+        self.maxs = np.full((count, 3), -np.inf, dtype=np.float64)
+        np.minimum.at(self.mins, self.owner, box_mins)
+        np.maximum.at(self.maxs, self.owner, box_maxs)
+
+        hit_owner = []
+        hit_mins = []
+        hit_maxs = []
+
+        for i, obj in enumerate(self.objects):
+            hit_box = self._get_hit_box(obj)
+            if hit_box is not None:
+                hit_owner.append(i)
+                hit_mins.append(hit_box[0])
+                hit_maxs.append(hit_box[1])
+
+        self.hit_owner = np.array(hit_owner, dtype=np.intp)
+        self.hit_bvh = _bvh.BVH(np.array(hit_mins, dtype=np.float64).reshape(-1, 3),
+                                np.array(hit_maxs, dtype=np.float64).reshape(-1, 3))
+        self.hit_rows = np.full((count,), -1, dtype=np.intp)
+        self.hit_rows[self.hit_owner] = np.arange(len(hit_owner), dtype=np.intp)
+
+        self.has_obb = np.zeros((count,), dtype=bool)
+        self.local_mins = np.zeros((count, 3), dtype=np.float64)
+        self.local_maxs = np.zeros((count, 3), dtype=np.float64)
+        self.rotations = np.zeros((count, 3, 3), dtype=np.float64)
+
+        for i, obj in enumerate(self.objects):
+            self._set_obb(i, obj)
+
+    @staticmethod
+    def _get_hit_box(obj) -> tuple[tuple, tuple] | None:
+        hit_test_rect = getattr(obj, 'hit_test_rect', None)
+        if not hit_test_rect:
+            return None
+
+        p1, p2 = hit_test_rect[0]
+        return p1.as_float, p2.as_float
+
+    def _set_obb(self, index: int, obj) -> None:
+        local_rect = getattr(obj, 'local_hit_test_rect', None)
+        if not local_rect:
+            self.has_obb[index] = False
+            return
+
+        p1, p2 = local_rect[0]
+        self.local_mins[index] = p1.as_float
+        self.local_maxs[index] = p2.as_float
+        self.rotations[index] = obj.angle.as_matrix
+        self.has_obb[index] = True
+
+    def update_object(self, obj) -> bool:
+        """
+        Rewrite the rows of an object that moved or changed size. Returns
+        False if obj is not known, if its number of AABBs changed the
+        arrays get marked dirty instead.
+        """
+        index = self.rows.get(id(obj), None)
+        if index is None or self.objects[index] is not obj:
+            return False
+
+        start = self.starts[index]
+        stop = self.starts[index + 1]
+
+        rects = [(p1.as_float, p2.as_float) for p1, p2 in obj.rect]
+        if len(rects) != stop - start:
+            self._is_dirty = True
+            return True
+
+        self.positions[index] = obj.position.as_float
+
+        if rects:
+            box_mins = np.array([p1 for p1, _ in rects], dtype=np.float64)
+            box_maxs = np.array([p2 for _, p2 in rects], dtype=np.float64)
+
+            for i in range(len(rects)):
+                self.bvh.refit(start + i, box_mins[i], box_maxs[i])
+
+            self.mins[index] = box_mins.min(axis=0)
+            self.maxs[index] = box_maxs.max(axis=0)
+
+        hit_box = self._get_hit_box(obj)
+        row = int(self.hit_rows[index])
+
+        if (hit_box is None) != (row == -1):
+            self._is_dirty = True
+        elif row != -1:
+            self.hit_bvh.refit(row, *hit_box)
+
+        self._set_obb(index, obj)
+
+        return True
+
+    def cull(self, planes: np.ndarray) -> np.ndarray:
+        """
+        planes: (6,4) from `Camera.extract_frustum_planes`
+
+        Returns a boolean mask over `objects`, True for the objects that
+        have an AABB intersecting or inside of the frustum.
+        """
+        visible = np.zeros((len(self.objects),), dtype=bool)
+        visible[self.owner[self.bvh.query_frustum(planes)]] = True
+
+        return visible
+
+    def test_objects(self, indices: np.ndarray, planes: np.ndarray) -> np.ndarray:
+        """
+        Frustum test of the AABBs of only the objects at indices, returns a
+        boolean mask over indices.
+        """
+        indices = np.asarray(indices, dtype=np.intp)
+        boxes = _bvh.expand_ranges(self.starts[indices], self.starts[indices + 1])
+
+        mins = self.bvh.mins[boxes]
+        maxs = self.bvh.maxs[boxes]
+
+        n = planes[:, :3]
+        s = ((mins + maxs) * 0.5) @ n.T + planes[:, 3]
+        s += ((maxs - mins) * 0.5) @ np.abs(n).T
+
+        visible = np.zeros((len(self.objects),), dtype=bool)
+        visible[self.owner[boxes[(s >= 0.0).all(axis=1)]]] = True
+
+        return visible[indices]
+
+    def ray_test(self, indices, origin, direction) -> np.ndarray:
+        """
+        Ray test of the hit test boxes of only the objects at indices.
+        Returns (K,) distances along the ray to where it enters the box of
+        each object, inf for the objects it misses or that have no box.
+        """
+        indices = np.asarray(indices, dtype=np.intp)
+        rows = self.hit_rows[indices]
+        has_box = rows != -1
+
+        t = np.full((len(indices),), np.inf, dtype=np.float64)
+        if not has_box.any():
+            return t
+
+        rows = rows[has_box]
+        hit, t_hit = _bvh.ray_slabs(np.asarray(origin, dtype=np.float64),
+                                    _bvh.inverse_direction(direction),
+                                    self.hit_bvh.mins[rows],
+                                    self.hit_bvh.maxs[rows], np.inf)
+
+        t[has_box] = np.where(hit, t_hit, np.inf)
+        return self._obb_test(indices, t, origin, direction)
+
+    def _obb_test(self, indices: np.ndarray, t: np.ndarray, origin,
+                  direction) -> np.ndarray:
+        # replace the world box distances t of the objects at indices that
+        # have an oriented box with where the ray enters that, inf if it
+        # misses
+        test = np.flatnonzero(self.has_obb[indices] & np.isfinite(t))
+        if not len(test):
+            return t
+
+        objs = indices[test]
+        rotations = self.rotations[objs]
+
+        # world to local is (p - position) @ R.T with points as rows, R is
+        # orthonormal so t stays the world distance along the ray
+        origins = np.einsum('nj,nkj->nk',
+                            np.asarray(origin, dtype=np.float64) - self.positions[objs],
+                            rotations)
+        directions = np.einsum('j,nkj->nk', np.asarray(direction, dtype=np.float64),
+                               rotations)
+
+        hit, t_obb = _bvh.ray_slabs(origins, _bvh.inverse_direction(directions),
+                                    self.local_mins[objs], self.local_maxs[objs],
+                                    np.inf)
+
+        t = t.copy()
+        t[test] = np.where(hit, t_obb, np.inf)
+        return t
+
+    def pick(self, origin, direction) -> list[tuple[float, object]]:
+        """
+        Returns (t, obj) for the objects whose hit test box the ray hits,
+        sorted front to back by where the ray enters the box. Objects with
+        an oriented box are only returned if the ray hits that.
+        """
+        rows, t = self.hit_bvh.query_ray(origin, direction)
+        indices = self.hit_owner[rows]
+
+        if self.has_obb[indices].any():
+            t = self._obb_test(indices, t, origin, direction)
+
+            keep = np.isfinite(t)
+            indices = indices[keep]
+            t = t[keep]
+
+            order = np.argsort(t, kind='stable')
+            indices = indices[order]
+            t = t[order]
+
+        objects = self.objects
+
+        return [(t_hit, objects[index]) for t_hit, index in
+                zip(t.tolist(), indices.tolist())]
@@ -0,0 +1,170 @@
+"""
+Box and lasso selection.
+
+Both work on the hit test boxes in `SceneBounds` instead of testing the
+objects one at a time.
+
+A box selection turns the drag rectangle into the planes of the part of
+the view frustum behind it (`Camera.get_rect_planes`) and queries the
+hit test BVH with them. A box dragged from left to right selects the
+objects whose box is entirely inside, one dragged from right to left also
+selects the objects it crosses, the way CAD programs do it.
+
+The BVH query tests every plane on its own, a box that passes by a corner
+of the sub frustum is outside of no single plane and gets through. The
+crossing candidates are tested again with the separating axis test
+between the box and the sub frustum, which is exact.
+
+A lasso selection narrows the objects down with the frustum behind the
+bounding rectangle of the lasso first and then tests the projected
+centers of the hit test boxes of what is left against the lasso polygon.
+"""
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from . import camera as _camera
+    from . import scene_bounds as _scene_bounds
+
+
+# what a selection does with the objects that were already selected
+SELECT_REPLACE = 0
+SELECT_ADD = 1
+SELECT_SUBTRACT = 2
+
+# values for `Canvas.selection_tool`, with a tool set a left drag selects
+# instead of moving the camera
+TOOL_BOX = 'box'
+TOOL_LASSO = 'lasso'
+
+
+def get_mode(shift_down: bool, control_down: bool) -> int:
+    """
+    Selection mode for the modifier keys, shift adds to the selection and
+    control removes from it.
+    """
+    if control_down:
+        return SELECT_SUBTRACT
+
+    if shift_down:
+        return SELECT_ADD
+
+    return SELECT_REPLACE
+
+
+def points_in_polygon(points: np.ndarray, polygon: np.ndarray) -> np.ndarray:
+    """
+    Even-odd test of (N,2) points against a closed (M,2) polygon, returns a
+    (N,) boolean mask. One pass over the points per edge of the polygon.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    polygon = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+
+    inside = np.zeros((len(points),), dtype=bool)
+    if len(polygon) < 3:
+        return inside
+
+    x = points[:, 0]
+    y = points[:, 1]
+
+    for (x1, y1), (x2, y2) in zip(polygon.tolist(), np.roll(polygon, 1, axis=0).tolist()):
+        if y1 == y2:
+            # a horizontal edge is never crossed by the horizontal ray
+            continue
+
+        crosses = (y1 > y) != (y2 > y)
+        x_cross = x1 + (y - y1) * ((x2 - x1) / (y2 - y1))
+        inside ^= crosses & (x < x_cross)
+
+    return inside
+
+
+def _planes_test(mins: np.ndarray, maxs: np.ndarray,
+                 planes: np.ndarray) -> np.ndarray:
+    # True for the (K,3) boxes entirely inside of all of the planes
+    n = planes[:, :3]
+    s = ((mins + maxs) * 0.5) @ n.T + planes[:, 3]
+    s -= ((maxs - mins) * 0.5) @ np.abs(n).T
+    return (s >= 0.0).all(axis=1)
+
+
+def _sat_axes(planes: np.ndarray, corners: np.ndarray) -> np.ndarray:
+    # separating axes of a box and the (8,3) corners of a frustum, the
+    # box faces, the frustum faces and the cross products of the box
+    # edges with the frustum edges
+    near = corners[:4]
+    far = corners[4:]
+
+    edges = np.concatenate(((near[1] - near[0])[None], (near[3] - near[0])[None],
+                            far - near))
+    unit = np.eye(3)
+    cross = np.cross(edges[:, None, :], unit[None, :, :]).reshape(-1, 3)
+
+    return np.concatenate((unit, planes[:, :3], cross))
+
+
+def _crosses_frustum(mins: np.ndarray, maxs: np.ndarray, planes: np.ndarray,
+                     corners: np.ndarray) -> np.ndarray:
+    # True for the (K,3) boxes that overlap the frustum, there is no axis
+    # that separates them
+    axes = _sat_axes(planes, corners)
+
+    frustum = corners @ axes.T
+    low = frustum.min(axis=0)
+    high = frustum.max(axis=0)
+
+    centers = ((mins + maxs) * 0.5) @ axes.T
+    radii = ((maxs - mins) * 0.5) @ np.abs(axes).T
+
+    return ~(((centers + radii) < low) | ((centers - radii) > high)).any(axis=1)
+
+
+def box_select(bounds: "_scene_bounds.SceneBounds", camera: "_camera.Camera",
+               x0: float, y0: float, x1: float, y1: float,
+               crossing: bool) -> np.ndarray:
+    """
+    Indices into `bounds.objects` of the objects whose hit test box is
+    inside of the window rectangle x0, y0, x1, y1, or crosses it if
+    crossing is True.
+    """
+    planes = camera.get_rect_planes(x0, y0, x1, y1)
+    rows = bounds.hit_bvh.query_frustum(planes)
+
+    if len(rows):
+        mins = bounds.hit_bvh.mins[rows]
+        maxs = bounds.hit_bvh.maxs[rows]
+
+        if crossing:
+            corners = camera.get_rect_corners(x0, y0, x1, y1)
+            rows = rows[_crosses_frustum(mins, maxs, planes, corners)]
+        else:
+            rows = rows[_planes_test(mins, maxs, planes)]
+
+    return np.unique(bounds.hit_owner[rows])
+
+
+def lasso_select(bounds: "_scene_bounds.SceneBounds", camera: "_camera.Camera",
+                 polygon: np.ndarray) -> np.ndarray:
+    """
+    Indices into `bounds.objects` of the objects whose hit test box center
+    projects inside of the (M,2) window coordinate polygon.
+    """
+    polygon = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+    if len(polygon) < 3:
+        return np.empty((0,), dtype=np.intp)
+
+    (x0, y0), (x1, y1) = polygon.min(axis=0), polygon.max(axis=0)
+
+    # only boxes that reach into the frustum behind the bounding rect of
+    # the lasso can have their center inside of it
+    rows = bounds.hit_bvh.query_frustum(camera.get_rect_planes(x0, y0, x1, y1))
+    if not len(rows):
+        return np.empty((0,), dtype=np.intp)
+
+    centers = (bounds.hit_bvh.mins[rows] + bounds.hit_bvh.maxs[rows]) * 0.5
+    xy, in_front = camera.project_points(centers)
+
+    inside = in_front & points_in_polygon(xy, polygon)
+    return np.unique(bounds.hit_owner[rows[inside]])
@@ -0,0 +1,246 @@
+"""
+In view, standby and far object sets.
+
+Every object on the canvas is in one of three sets:
+
+  in view: an AABB of the object intersects the view frustum
+  standby: not in view but inside of the frustum grown by
+           `canvases.Config.standby_distance`
+  far:     everything else
+
+When the camera moves only the in view and standby objects get tested
+again on the UI thread, a move can only bring an object into view if it
+was on standby. Objects in those two sets that end up outside of the
+grown frustum drop to far. The far objects get reclassified on a worker
+thread using the BVH of the scene, the ones that came within the standby
+distance are handed back and promoted at the start of the next frame.
+
+The UI thread refits the BVH in place when objects move. A job carries
+the bounds generation and the `refit_count` of the BVH it was started
+with, a result from a BVH that got refit in the meantime may have been
+read from half written boxes and is dropped, the job gets started again
+with the current planes.
+
+A camera move that jumps further than the standby distance in a single
+frame can leave objects out for the frame it takes the worker to catch
+up, the worker asks for a redraw when it promotes anything.
+"""
+
+from typing import Callable, TYPE_CHECKING
+
+import threading
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from . import scene_bounds as _scene_bounds
+
+
+FAR = 0
+STANDBY = 1
+IN_VIEW = 2
+
+
+def _grow_planes(planes: np.ndarray, distance: float) -> np.ndarray:
+    # the planes are normalized, moving d moves the plane along its normal
+    grown = np.array(planes, dtype=np.float64)
+    grown[:, 3] += distance
+    return grown
+
+
+class VisibilityManager:
+
+    def __init__(self, bounds: "_scene_bounds.SceneBounds",
+                 on_changed: Callable[[], None], standby_distance: float):
+        """
+        on_changed gets called from the worker thread when far objects have
+        been promoted and a redraw is needed.
+        """
+        self.bounds = bounds
+        self.standby_distance = standby_distance
+
+        self._on_changed = on_changed
+        self._state = np.zeros((0,), dtype=np.int8)
+        self._generation = -1
+        self._planes = None
+
+        # object indices that moved and need to be tested again
+        self._moved = set()
+
+        self._in_view = []
+        self._in_view_changed = False
+
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._job = None
+        self._result = None
+        self._is_stopped = False
+        self._thread = None
+
+    def in_view(self) -> list:
+        """
+        The objects that are in view, in the order of `bounds.objects`.
+        """
+        if self._in_view_changed:
+            self._in_view_changed = False
+            objects = self.bounds.objects
+            self._in_view = [objects[i] for i in
+                             np.flatnonzero(self._state == IN_VIEW).tolist()]
+
+        return self._in_view
+
+    def mark_moved(self, indices) -> None:
+        self._moved.update(indices)
+
+    def update(self, planes: np.ndarray) -> None:
+        """
+        Bring the sets up to date for the frustum planes. Call on the UI
+        thread after the bounds have been updated.
+        """
+        bounds = self.bounds
+
+        if bounds.generation != self._generation:
+            self._classify_all(planes)
+            return
+
+        self._apply_result()
+
+        camera_moved = self._planes is None or not np.array_equal(planes, self._planes)
+
+        if camera_moved:
+            near = np.flatnonzero(self._state != FAR)
+            if self._moved:
+                near = np.union1d(near, np.fromiter(self._moved, dtype=np.intp))
+        elif self._moved:
+            near = np.fromiter(self._moved, dtype=np.intp)
+        else:
+            return
+
+        self._moved.clear()
+        self._planes = planes
+        self._classify(near, planes)
+
+        if camera_moved:
+            self._request_far(planes)
+
+    def _classify(self, indices: np.ndarray, planes: np.ndarray) -> None:
+        if not len(indices):
+            return
+
+        bounds = self.bounds
+        in_view = bounds.test_objects(indices, planes)
+        standby = bounds.test_objects(
+            indices, _grow_planes(planes, self.standby_distance))
+
+        state = np.where(in_view, IN_VIEW, np.where(standby, STANDBY, FAR))
+        state = state.astype(np.int8)
+
+        if (
+            not self._in_view_changed and
+            not np.array_equal(state == IN_VIEW, self._state[indices] == IN_VIEW)
+        ):
+            self._in_view_changed = True
+
+        self._state[indices] = state
+
+    def _classify_all(self, planes: np.ndarray) -> None:
+        bounds = self.bounds
+        count = len(bounds.objects)
+
+        state = np.zeros((count,), dtype=np.int8)
+
+        boxes = bounds.bvh.query_frustum(_grow_planes(planes, self.standby_distance))
+        state[bounds.owner[boxes]] = STANDBY
+
+        boxes = bounds.bvh.query_frustum(planes)
+        state[bounds.owner[boxes]] = IN_VIEW
+
+        self._state = state
+        self._generation = bounds.generation
+        self._planes = planes
+        self._moved.clear()
+        self._in_view_changed = True
+
+        with self._lock:
+            # results for the old objects no longer apply
+            self._job = None
+            self._result = None
+
+    def _apply_result(self) -> None:
+        with self._lock:
+            result = self._result
+            self._result = None
+
+        if result is None:
+            return
+
+        generation, refit_count, promoted = result
+        if generation != self._generation:
+            return
+
+        if refit_count != self.bounds.bvh.refit_count:
+            self._request_far(self._planes)
+            return
+
+        # only objects that are still far, the ones that got closer have
+        # been classified with newer planes already
+        promoted = promoted[self._state[promoted] == FAR]
+
+        # promoted objects are tested against the current planes by the
+        # update that applies them
+        self._state[promoted] = STANDBY
+        self._moved.update(promoted.tolist())
+
+    def _request_far(self, planes: np.ndarray) -> None:
+        far = self._state == FAR
+        if not far.any():
+            return
+
+        bounds = self.bounds
+
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+            # only the latest camera matters, an older job that has not been
+            # started gets replaced
+            self._job = (self._generation, bounds.bvh.refit_count, bounds.bvh,
+                         bounds.owner, far,
+                         _grow_planes(planes, self.standby_distance))
+            self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._job is None and not self._is_stopped:
+                    self._condition.wait()
+
+                if self._is_stopped:
+                    return
+
+                generation, refit_count, bvh, owner, far, planes = self._job
+                self._job = None
+
+            near = np.zeros((len(far),), dtype=bool)
+            near[owner[bvh.query_frustum(planes)]] = True
+
+            promoted = np.flatnonzero(far & near)
+            if not len(promoted):
+                continue
+
+            with self._lock:
+                if (
+                    self._result is not None and
+                    self._result[:2] == (generation, refit_count)
+                ):
+                    promoted = np.union1d(promoted, self._result[2])
+
+                self._result = (generation, refit_count, promoted)
+
+            self._on_changed()
+
+    def stop(self) -> None:
+        with self._condition:
+            self._is_stopped = True
+            self._condition.notify()
@@ -1,5 +1,6 @@
 
 import wx
+import os
 import math
 import numpy as np
 from OpenGL.GL import *
@@ -17,6 +18,7 @@ from ...database.global_db import model3d as _model3d
 from ...wrappers import color as _color
 from ... import utils
 from ...database.global_db import transition as _transition
+from .. import renderers as _renderers
 
 
 def _read_step(data):
@@ -164,7 +166,7 @@ class GLPreview(glcanvas.GLCanvas):
         return self._scale_x, self._scale_y, self._scale_z
 
     def draw(self):
-        normals, triangles, triangle_count = self.parent.get_triangles()
+        normals, triangles, triangle_count, indices = self.parent.get_triangles()
 
         glLoadIdentity()
         glRotatef(self._up_down_angle * 0.1, 1.0, 0.0, 0.0)
@@ -203,9 +205,15 @@ class GLPreview(glcanvas.GLCanvas):
             if self.parent.material is not None:
                 self.parent.material.set()
 
-            glVertexPointer(3, GL_DOUBLE, 0, triangles)
-            glNormalPointer(GL_DOUBLE, 0, normals)
-            glDrawArrays(GL_TRIANGLES, 0, triangle_count)
+            renderer = _renderers.get_active_renderer_cls()
+
+            glVertexPointer(3, renderer.get_gl_type(triangles), 0, triangles)
+            glNormalPointer(renderer.get_gl_type(normals), 0, normals)
+
+            if indices is None:
+                glDrawArrays(GL_TRIANGLES, 0, triangle_count)
+            else:
+                glDrawElements(GL_TRIANGLES, triangle_count, GL_UNSIGNED_INT, indices)
 
             glDisableClientState(GL_VERTEX_ARRAY)
             glDisableClientState(GL_NORMAL_ARRAY)
@@ -230,7 +238,8 @@ class GLPreview(glcanvas.GLCanvas):
                      np.array([[self.center[0] - half, y, self.center[2] + coord],
                                [self.center[0] + half, y, self.center[2] + coord],
                                [self.center[0] + coord, y, self.center[2] - half],
-                               [self.center[0] + coord, y, self.center[2] + half]], dtype=float)))
+                               [self.center[0] + coord, y, self.center[2] + half]],
+                              dtype=np.dtypes.Float32DType)))
 
         glDisable(GL_LIGHTING)
         glLineWidth(1.0)
@@ -238,7 +247,7 @@ class GLPreview(glcanvas.GLCanvas):
 
         for color, arr in self._grid:
             glColor3f(*color)
-            glVertexPointer(3, GL_DOUBLE, 0, arr)
+            glVertexPointer(3, GL_FLOAT, 0, arr)
             glDrawArrays(GL_LINES, 0, 4)
 
         glDisableClientState(GL_VERTEX_ARRAY)
@@ -384,10 +393,12 @@ class Preview3D(wx.Panel):
         self.normals = [None]
         self.triangles = [None]
         self.triangle_count = [0]
+        self.indices = [None]
         self._angle = _angle.Angle(_decimal(0.0), _decimal(0.0), _decimal(0.0))
         self._offset = _point.Point(_decimal(0.0), _decimal(0.0), _decimal(0.0))
         self._index = 0
         self._models = [model]
+        self._model_data = [None]
         self.color = t_db.color.ui.rgb_scalar
         self.material = gl_materials.Rubber(self.color)
 
@@ -406,15 +417,27 @@ class Preview3D(wx.Panel):
         index = self._index
 
         if self.triangles[index] is None:
-            model = self._models[index]
-            normals, triangles, triangle_count = get_triangles(model)
+            renderer = _renderers.get_active_renderer_cls()
+            data = self._model_data[index]
+
+            mesh = None if data is None else renderer.get_cached_mesh(data[0])
+
+            if mesh is None:
+                # only parse the model file when the mesh is not cached
+                model = self._get_model(index)
+                mesh = renderer.build_mesh(model, None if data is None else data[0])
+
+            # smooth meshes come back indexed
+            normals, triangles, triangle_count, *indices = mesh
             self.normals[index] = normals
             self.triangles[index] = triangles
             self.triangle_count[index] = triangle_count
+            self.indices[index] = indices[0] if indices else None
 
         normals = self.normals[index]
         triangles = self.triangles[index]
         triangle_count = self.triangle_count[index]
+        indices = self.indices[index]
 
         if self._angle:
             triangles @= self._angle
@@ -422,21 +445,39 @@ class Preview3D(wx.Panel):
         if self._offset:
             triangles @= self._offset
 
-        return normals, triangles, triangle_count
+        return normals, triangles, triangle_count, indices
+
+    def _get_model(self, index):
+        model = self._models[index]
+
+        if model is None:
+            data, type_ = self._model_data[index]
+
+            if type_ == 'stl':
+                model = _read_stl(data)
+            else:
+                model = _read_step(data)
+
+            self._models[index] = model
+
+        return model
 
     def set_model_db(self, db_obj: _model3d.Model3D, color: _color.Color, material: gl_materials.GLMaterial):
         models = db_obj.all_model_data
-        new_models = []
 
-        for model, type_ in models:
-            if type_ in ('stp', 'step'):
-                model = _read_step(model)
-            elif type_ == 'stl':
-                model = _read_stl(model)
-            else:
-                continue
+        # the models are parsed lazily so a model that has its mesh in the
+        # mesh cache never has to be loaded
+        model_data = [(data, type_) for data, type_ in models
+                      if type_ in ('stp', 'step', 'stl')]
+
+        count = len(model_data)
 
-            new_models.append(model)
+        self._models = [None] * count
+        self._model_data = model_data
+        self.normals = [None] * count
+        self.triangles = [None] * count
+        self.triangle_count = [0] * count
+        self.indices = [None] * count
 
         self._angle = db_obj.angle
         self._offset = db_obj.offset
@@ -472,10 +513,12 @@ class Preview3D(wx.Panel):
         self.normals = []
         self.triangles = []
         self.triangle_count = []
+        self.indices = []
         self._angle = _angle.Angle(_decimal(0.0), _decimal(0.0), _decimal(0.0))
         self._offset = _point.Point(_decimal(0.0), _decimal(0.0), _decimal(0.0))
         self._index = -1
         self._models = []
+        self._model_data = []
         self.color = None
         self.material = None
         self._pending_index = None
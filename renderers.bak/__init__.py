@@ -1,14 +1,44 @@
 
+from typing import TYPE_CHECKING
+
 import numpy as np
 
 from ...geometry import point as _point
 from ...wrappers.decimal import Decimal as _decimal
 from ... import config as _config
 
+if TYPE_CHECKING:
+    from . import lod as _lod
+
 
 class Config(metaclass=_config.Config):
+    # "GLRenderer" draws from client side arrays, "VBORenderer" keeps the
+    # meshes in vertex buffer objects
     renderer = "GLRenderer"
 
+    # directory used to store tessellated meshes, an empty string uses
+    # the default location inside of the users local data directory
+    mesh_cache_path = ""
+
+    # maximum size of the mesh cache in MB, 0 disables the cache
+    mesh_cache_size = 1024
+
+    # projected size in pixels where a LOD mesh switches to the next finer
+    # level, one less entry than there are levels
+    lod_thresholds = (48, 192)
+
+    # fraction of a threshold an object has to be past it before the
+    # level changes
+    lod_hysteresis = 0.2
+
+    # pack mesh normals into 4 bytes each (GL_INT_2_10_10_10_REV) instead
+    # of 3 floats, needs OpenGL 3.3 or ARB_vertex_type_2_10_10_10_rev
+    packed_normals = False
+
+    # draw objects that share a model with hardware instancing when the
+    # renderer and the driver support it
+    instancing = True
+
 
 _registered = {}
 _active = None
@@ -57,7 +87,15 @@ class RendererBase:
         raise NotImplementedError
 
     @staticmethod
-    def get_world_coords(mx: int, my: int) -> _point.Point:
+    def get_gl_type(arr: np.ndarray) -> int:
+        raise NotImplementedError
+
+    def invalidate(self, *arrays: np.ndarray):
+        raise NotImplementedError
+
+    @staticmethod
+    def get_world_coords(mx: int, my: int, modelview=None, projection=None,
+                         viewport=None) -> _point.Point:
         raise NotImplementedError
 
     def reset_camera(self, *_):
@@ -67,7 +105,30 @@ class RendererBase:
         raise NotImplementedError
 
     @staticmethod
-    def build_mesh(model) -> tuple[np.ndarray, np.ndarray, int]:
+    def build_mesh(model, data: bytes | None = None,
+                   level: int | None = None) -> "_lod._MeshT":
+        raise NotImplementedError
+
+    @staticmethod
+    def get_cached_mesh(data: bytes, level: int | None = None) -> "_lod._MeshT | None":
+        raise NotImplementedError
+
+    @staticmethod
+    def build_lod_mesh(model, data: bytes | None = None) -> "_lod.LODMesh":
+        raise NotImplementedError
+
+    @staticmethod
+    def get_cached_lod_mesh(data: bytes) -> "_lod.LODMesh | None":
+        raise NotImplementedError
+
+    @staticmethod
+    def build_indexed_mesh(model, data: bytes | None = None,
+                           level: int | None = None) -> tuple[np.ndarray, np.ndarray, int, np.ndarray]:
+        raise NotImplementedError
+
+    @staticmethod
+    def get_cached_indexed_mesh(data: bytes, level: int | None = None
+                                ) -> tuple[np.ndarray, np.ndarray, int, np.ndarray] | None:
         raise NotImplementedError
 
     def rotate(self, dx: _decimal, dy: _decimal):
@@ -90,6 +151,13 @@ class DrawWrapperBase:
     def __enter__(self):
         return self
 
+    def begin_frame(self):
+        """
+        Called once at the start of every frame with the GL context current,
+        also by code that keeps a wrapper around instead of entering it.
+        """
+        pass
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         pass
 
@@ -100,3 +168,13 @@ class DrawWrapperBase:
     def model(*args, **kwargs):
         raise NotImplementedError
 
+    @staticmethod
+    def instances(*args, **kwargs):
+        raise NotImplementedError
+
+
+# the renderer modules register themselves through RendererMeta
+from . import gl_renderer  # NOQA
+from . import vbo_renderer  # NOQA
+
+set_renderer_active(Config.renderer)
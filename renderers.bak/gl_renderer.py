@@ -1,17 +1,21 @@
 from OpenGL import GL
 from OpenGL import GLU
 
-from OCP.gp import gp_Vec, gp
+from OCP.gp import gp
 from OCP.TopAbs import TopAbs_REVERSED
 from OCP.BRep import BRep_Tool
 from OCP.BRepMesh import BRepMesh_IncrementalMesh
+from OCP.BRepTools import BRepTools
 from OCP.TopLoc import TopLoc_Location
 
 import numpy as np
 
 import math
 
-from . import RendererBase, DrawWrapperBase
+from . import RendererBase, RendererMeta, DrawWrapperBase, Config as _renderers_config
+from . import mesh_cache as _mesh_cache
+from . import lod as _lod
+from . import render_queue as _render_queue
 from ...geometry import point as _point
 from ...geometry import angle as _angle
 # from ...geometry import line as _line
@@ -20,21 +24,62 @@ from ... import gl_materials as _gl_materials
 from ...wrappers.decimal import Decimal as _decimal
 
 
-def _get_triangles(ocp_mesh) -> tuple[np.ndarray, np.ndarray, int]:
-    loc = TopLoc_Location()  # Face locations
-    mesh = BRepMesh_IncrementalMesh(
-        theShape=ocp_mesh.wrapped,
-        theLinDeflection=0.001,
-        isRelative=True,
-        theAngDeflection=0.1,
-        isInParallel=True,
-    )
+# parameters handed to BRepMesh_IncrementalMesh, the linear deflection is
+# relative to the size of the edges being meshed
+LINEAR_DEFLECTION = 0.001
+ANGULAR_DEFLECTION = 0.1
+
+# (linear deflection, angular deflection) of each LOD level, coarse to fine.
+# The finest level matches the parameters used for non LOD meshes so both
+# share the same cache entries.
+LOD_LEVELS = (
+    (0.01, 0.5),
+    (0.004, 0.25),
+    (LINEAR_DEFLECTION, ANGULAR_DEFLECTION)
+)
+
+# vertices closer than WELD_TOLERANCE (model units) are merged in indexed
+# meshes unless their normals are more than WELD_CREASE_ANGLE apart
+WELD_TOLERANCE = 1e-5
+WELD_CREASE_ANGLE = math.radians(20.0)
+
+# crease angle used for flat meshes, only the corners of coplanar
+# triangles get welded so the facets stay visible
+WELD_FLAT_CREASE_ANGLE = math.radians(0.1)
+
+# (normals, triangles, triangle_count) for meshes drawn with glDrawArrays,
+# (normals, vertices, index_count, indices) for meshes drawn with
+# glDrawElements
+_MeshT = (tuple[np.ndarray, np.ndarray, int] |
+          tuple[np.ndarray, np.ndarray, int, np.ndarray])
+
+
+def _trsf_to_matrix(trsf) -> np.ndarray:
+    """Convert a `gp_Trsf` into a (3, 4) affine matrix [R | t]."""
+    return np.array([[trsf.Value(row, col) for col in range(1, 5)]
+                     for row in range(1, 4)], dtype=np.dtypes.Float64DType)
+
 
-    mesh.Perform()
+def _get_triangulation_arrays(ocp_mesh) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Pull the triangulation of every face of an already meshed shape into
+    NumPy in bulk.
+
+    Each face contributes one list comprehension for its nodes and one for
+    its triangles. The face location is applied to all of the nodes at once
+    with a single matrix multiply instead of transforming each `gp_Pnt`
+    separately, and reversed faces get their winding flipped by swapping
+    index columns.
+
+    Returns:
+      vertices: (N,3) float64 world space nodes of all faces
+      faces:    (F,3) int32 zero based indices into vertices
+    """
+    loc = TopLoc_Location()  # Face locations
 
-    triangles = []
-    normals = []
-    triangle_count = 0
+    vertices = []
+    faces = []
+    offset = 0
 
     for facet in ocp_mesh.faces():
         if not facet:
@@ -45,93 +90,280 @@ def _get_triangles(ocp_mesh) -> tuple[np.ndarray, np.ndarray, int]:
         if poly_triangulation is None:
             continue
 
-        trsf = loc.Transformation()
+        node_count = poly_triangulation.NbNodes()
+        if node_count == 0:
+            continue
 
-        facet_reversed = facet.wrapped.Orientation() == TopAbs_REVERSED
+        nodes = np.array([(p.X(), p.Y(), p.Z()) for p in
+                          map(poly_triangulation.Node, range(1, node_count + 1))],
+                         dtype=np.dtypes.Float64DType)
 
-        for tri in poly_triangulation.Triangles():
-            id0, id1, id2 = tri.Get()
+        tris = np.array([tri.Get() for tri in poly_triangulation.Triangles()],
+                        dtype=np.dtypes.Int32DType).reshape(-1, 3)
 
-            if facet_reversed:
-                id1, id2 = id2, id1
+        if not loc.IsIdentity():
+            m = _trsf_to_matrix(loc.Transformation())
+            nodes = nodes @ m[:, :3].T + m[:, 3]
 
-            aP1 = poly_triangulation.Node(id0).Transformed(trsf)
-            aP2 = poly_triangulation.Node(id1).Transformed(trsf)
-            aP3 = poly_triangulation.Node(id2).Transformed(trsf)
+        if facet.wrapped.Orientation() == TopAbs_REVERSED:
+            tris = tris[:, [0, 2, 1]]
 
-            triangles.append([[aP1.X(), aP1.Y(), aP1.Z()],
-                              [aP2.X(), aP2.Y(), aP2.Z()],
-                              [aP3.X(), aP3.Y(), aP3.Z()]])
+        vertices.append(nodes)
+        faces.append(tris + (offset - 1))
+        offset += node_count
 
-            aVec1 = gp_Vec(aP1, aP2)
-            aVec2 = gp_Vec(aP1, aP3)
-            aVNorm = aVec1.Crossed(aVec2)
+    if not vertices:
+        return (np.zeros((0, 3), dtype=np.dtypes.Float64DType),
+                np.zeros((0, 3), dtype=np.dtypes.Int32DType))
 
-            if aVNorm.SquareMagnitude() > gp.Resolution_s():  # NOQA
-                aVNorm.Normalize()
-            else:
-                aVNorm.SetCoord(0.0, 0.0, 0.0)
+    return np.concatenate(vertices), np.concatenate(faces)
 
-            for _ in range(3):
-                normals.extend([aVNorm.X(), aVNorm.Y(), aVNorm.Z()])
 
-            triangle_count += 3
+def _get_triangles(ocp_mesh, lin_deflection: float,
+                   ang_deflection: float) -> tuple[np.ndarray, np.ndarray, int]:
+    BRepMesh_IncrementalMesh(
+        theShape=ocp_mesh.wrapped,
+        theLinDeflection=lin_deflection,
+        isRelative=True,
+        theAngDeflection=ang_deflection,
+        isInParallel=True,
+    )
 
-    return (np.array(normals, dtype=np.dtypes.Float64DType),
-            np.array(triangles, dtype=np.dtypes.Float64DType),
-            triangle_count)
+    vertices, faces = _get_triangulation_arrays(ocp_mesh)
 
+    triangles = vertices[faces]  # (F,3,3)
 
-def _get_smooth_triangles(ocp_mesh) -> tuple[np.ndarray, np.ndarray, int]:
-    from .. import Config
+    # flat normals, one per triangle and repeated for each of its corners.
+    # degenerate triangles get a zero normal
+    face_normals = _compute_face_normals(triangles[:, 0], triangles[:, 1],
+                                         triangles[:, 2])
 
-    loc = TopLoc_Location()  # Face locations
+    sq_mag = np.einsum('ij,ij->i', face_normals, face_normals)
+    valid = sq_mag > gp.Resolution_s()  # NOQA
+
+    face_normals[valid] /= np.sqrt(sq_mag[valid])[:, None]
+    face_normals[~valid] = 0.0
+
+    normals = np.repeat(face_normals, 3, axis=0)
+
+    normals, triangles = _to_render_arrays(normals, triangles)
+
+    return normals, triangles, len(faces) * 3
+
+
+def _pack_normals(normals: np.ndarray) -> np.ndarray:
+    """
+    Pack (N,3) unit normals into (N,) uint32 in the
+    `GL_INT_2_10_10_10_REV` layout, 10 signed bits per component.
+    """
+    packed = np.clip(np.rint(normals * 511.0), -511, 511).astype(np.dtypes.Int32DType) & 0x3FF
+
+    return np.ascontiguousarray(packed[:, 0] | (packed[:, 1] << 10) | (packed[:, 2] << 20),
+                                dtype=np.dtypes.UInt32DType)
+
+
+def _to_render_arrays(normals: np.ndarray,
+                      vertices: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Convert the float64 normals and vertices the mesh gets built with into
+    the layout that gets handed to OpenGL. Vertices become contiguous
+    float32 in the same shape. Normals become (N,3) float32 or, if
+    `Config.packed_normals` is set, (N,) uint32 packed normals.
+    """
+    if _renderers_config.packed_normals:
+        normals = _pack_normals(normals.reshape(-1, 3))
+    else:
+        normals = np.ascontiguousarray(normals.reshape(-1, 3), dtype=np.dtypes.Float32DType)
+
+    return normals, np.ascontiguousarray(vertices, dtype=np.dtypes.Float32DType)
+
+
+def _weld_vertices(vertices: np.ndarray, normals: np.ndarray, faces: np.ndarray,
+                   tolerance: float = WELD_TOLERANCE,
+                   crease_angle: float = WELD_CREASE_ANGLE
+                   ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Merge vertices that sit at the same position unless their normals are
+    more than crease_angle (radians) apart.
+
+    OCP triangulates every face on its own so the nodes along the edge two
+    faces share are stored once for each face. A seam between two faces
+    that meet at a sharp edge keeps one set of vertices per face so the edge
+    stays sharp, a seam between two faces that continue smoothly gets
+    welded and the normals across it get averaged.
+
+    Positions are snapped to a grid of tolerance before they are compared.
+
+    Returns:
+      vertices: (M,3) float64
+      normals:  (M,3) float64
+      faces:    (K,3) uint32, triangles that collapsed while welding are
+                dropped
+    """
+    vertex_count = len(vertices)
+
+    if not vertex_count:
+        return vertices, normals, faces.astype(np.dtypes.UInt32DType)
+
+    _, group = np.unique(np.floor(vertices / tolerance + 0.5).astype(np.dtypes.Int64DType),
+                         axis=0, return_inverse=True)
+    group = group.reshape(-1)
+
+    cos_crease = math.cos(crease_angle)
+    group_rep = np.empty(group.max() + 1, dtype=np.dtypes.Int64DType)
+    remap = np.empty(vertex_count, dtype=np.dtypes.Int64DType)
+    todo = np.arange(vertex_count)
+
+    # every pass takes the first remaining vertex of each position group and
+    # merges the remaining vertices of that group that point the same way
+    # into it. Most groups are done after one pass, a corner where several
+    # sharp edges meet needs one pass for every face.
+    while len(todo):
+        todo_group = group[todo]
+        _, first = np.unique(todo_group, return_index=True)
+        group_rep[todo_group[first]] = todo[first]
+        rep = group_rep[todo_group]
+
+        match = np.einsum('ij,ij->i', normals[todo], normals[rep]) >= cos_crease
+        match[first] = True
+
+        remap[todo[match]] = rep[match]
+        todo = todo[~match]
+
+    reps, inverse = np.unique(remap, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    welded_normals = np.zeros((len(reps), 3), dtype=np.dtypes.Float64DType)
+    np.add.at(welded_normals, inverse, normals)
+    welded_normals = _safe_normalize(welded_normals)
+
+    faces = inverse[faces]
+    keep = ((faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) &
+            (faces[:, 2] != faces[:, 0]))
+
+    return (np.ascontiguousarray(vertices[reps], dtype=np.dtypes.Float64DType),
+            np.ascontiguousarray(welded_normals, dtype=np.dtypes.Float64DType),
+            np.ascontiguousarray(faces[keep], dtype=np.dtypes.UInt32DType))
+
+
+def _get_indexed_triangles(ocp_mesh, lin_deflection: float, ang_deflection: float,
+                           method: str) -> tuple[np.ndarray, np.ndarray, int, np.ndarray]:
+    """
+    Tessellate into a shared vertex layout for `glDrawElements`.
+
+    With method "flat" every triangle corner starts out with the normal of
+    its triangle, welding then joins the corners of coplanar neighbours.
+
+    Returns:
+      normals:     (M,3) float32 or (M,) packed, see `_to_render_arrays`
+      vertices:    (M,3) float32
+      index_count: K*3
+      indices:     (K*3,) uint32
+    """
     BRepMesh_IncrementalMesh(
         theShape=ocp_mesh.wrapped,
-        theLinDeflection=0.001,
+        theLinDeflection=lin_deflection,
         isRelative=True,
-        theAngDeflection=0.1,
+        theAngDeflection=ang_deflection,
         isInParallel=True,
     )
 
-    ocp_mesh_vertices = []
-    triangles = []
-    offset = 0
-    for facet in ocp_mesh.faces():
-        if not facet:
-            continue
+    ocp_mesh_vertices, triangles = _get_triangulation_arrays(ocp_mesh)
 
-        # Triangulate the face
-        poly_triangulation = BRep_Tool.Triangulation_s(facet.wrapped, loc)  # NOQA
+    if method == 'flat':
+        corners = ocp_mesh_vertices[triangles]  # (F,3,3)
+        face_normals = _safe_normalize(
+            _compute_face_normals(corners[:, 0], corners[:, 1], corners[:, 2]))
 
-        if not poly_triangulation:
-            continue
+        ocp_mesh_vertices = corners.reshape(-1, 3)
+        vertex_normals = np.repeat(face_normals, 3, axis=0)
+        triangles = np.arange(len(ocp_mesh_vertices)).reshape(-1, 3)
+        crease_angle = WELD_FLAT_CREASE_ANGLE
+    else:
+        vertex_normals = _compute_vertex_normals(ocp_mesh_vertices, triangles, method)
+        crease_angle = WELD_CREASE_ANGLE
 
-        trsf = loc.Transformation()
-        # Store the vertices in the triangulated face
-        node_count = poly_triangulation.NbNodes()
-        for i in range(1, node_count + 1):
-            gp_pnt = poly_triangulation.Node(i).Transformed(trsf)
-            pnt = (gp_pnt.X(), gp_pnt.Y(), gp_pnt.Z())
-            ocp_mesh_vertices.append(pnt)
+    vertices, normals, triangles = _weld_vertices(
+        ocp_mesh_vertices, vertex_normals, triangles, crease_angle=crease_angle)
 
-        # Store the triangles from the triangulated faces
+    normals, vertices = _to_render_arrays(normals, vertices)
+    indices = triangles.reshape(-1)
 
-        facet_reversed = facet.wrapped.Orientation() == TopAbs_REVERSED
+    return normals, vertices, len(indices), indices
 
-        order = [1, 3, 2] if facet_reversed else [1, 2, 3]
-        for tri in poly_triangulation.Triangles():
-            triangles.append([tri.Value(i) + offset - 1 for i in order])
 
-        offset += node_count
+def _get_mesh_params(level: int | None = None) -> tuple[float, float, str]:
+    """
+    Returns (linear deflection, angular deflection, normal method) where the
+    normal method is either "flat" or one of the smoothing weights that
+    `_compute_vertex_normals` accepts.
+
+    level is an index into `LOD_LEVELS`, None is the default (finest) mesh.
+    """
+    from .. import Config
+
+    if Config.renderer.smooth_normals:
+        method = Config.renderer.smooth_weight
+    else:
+        method = 'flat'
+
+    if level is None:
+        return LINEAR_DEFLECTION, ANGULAR_DEFLECTION, method
+
+    lin_deflection, ang_deflection = LOD_LEVELS[level]
+    return lin_deflection, ang_deflection, method
+
+
+def _is_indexed(params: tuple[float, float, str]) -> bool:
+    # smooth meshes share most of their vertices between triangles so they
+    # are built indexed, flat meshes only share them inside a face
+    return params[2] != 'flat'
+
+
+def _tessellate(model, lin_deflection: float, ang_deflection: float,
+                method: str) -> _MeshT:
+    if method == 'flat':
+        return _get_triangles(model, lin_deflection, ang_deflection)
+
+    return _get_indexed_triangles(model, lin_deflection, ang_deflection, method)
+
 
-    ocp_mesh_vertices = np.array(ocp_mesh_vertices, dtype=np.dtypes.Float64DType)
-    triangles = np.array(triangles, dtype=np.dtypes.Int32DType)
+def _make_cache_key(data: bytes, params: tuple[float, float, str],
+                    indexed: bool = False) -> str:
+    lin_deflection, ang_deflection, method = params
 
-    normals, triangles = (
-        _make_per_corner_arrays(ocp_mesh_vertices, triangles, Config.renderer.smooth_weight))
+    if indexed:
+        method += '/indexed'
 
-    return normals, triangles, len(triangles)
+    if _renderers_config.packed_normals:
+        method += '/packed'
+
+    return _mesh_cache.make_key(data, lin_deflection, ang_deflection, method)
+
+
+def _load_cached_mesh(key: str) -> _MeshT | None:
+    arrays = _mesh_cache.load(key)
+
+    if arrays is None or 'triangles' not in arrays:
+        return None
+
+    normals = arrays['normals']
+    triangles = arrays['triangles']
+
+    if 'indices' in arrays:
+        indices = arrays['indices']
+        return normals, triangles, len(indices), indices
+
+    return normals, triangles, len(triangles.reshape(-1, 3))
+
+
+def _store_cached_mesh(key: str, mesh: _MeshT) -> None:
+    normals, triangles, _, *indices = mesh
+
+    if indices:
+        _mesh_cache.store(key, normals=normals, triangles=triangles, indices=indices[0])
+    else:
+        _mesh_cache.store(key, normals=normals, triangles=triangles)
 
 
 def _safe_normalize(v, eps=1e-12) -> np.ndarray:
@@ -215,31 +447,14 @@ def _compute_vertex_normals(vertices: np.ndarray, faces: np.ndarray,
     return vertex_normals
 
 
-def _make_per_corner_arrays(vertices: np.ndarray, faces: np.ndarray,
-                            method: str = "area") -> tuple[np.ndarray, np.ndarray]:
-    """
-    Given:
-      vertices: (N,3) float
-      faces: (F,3) int
-    Returns:
-      positions_flat: (F*3, 3) float32
-      normals_flat:   (F*3, 3) float32
-    Suitable for glVertexPointer(3, GL_FLOAT, 0, positions_flat) and
-    glNormalPointer(GL_FLOAT, 0, normals_flat).
-    """
-    # compute smooth per-vertex normals
-    v_normals = _compute_vertex_normals(vertices, faces, method=method)  # (N,3)
-
-    # expand to per-corner arrays (flatten triangles in order)
-    positions_flat = vertices[faces].reshape(-1, 3)
-    normals_flat = v_normals[faces].reshape(-1, 3)
+_GL_TYPES = {
+    np.dtype(np.float32).str: GL.GL_FLOAT,
+    np.dtype(np.float64).str: GL.GL_DOUBLE,
+    np.dtype(np.uint32).str: GL.GL_INT_2_10_10_10_REV
+}
 
-    # Ensure float32 contiguous arrays for OpenGL
-    return (np.ascontiguousarray(normals_flat, dtype=np.dtypes.Float64DType),
-            np.ascontiguousarray(positions_flat, dtype=np.dtypes.Float64DType))
 
-
-class GLRenderer(RendererBase):
+class GLRenderer(RendererBase, metaclass=RendererMeta):
 
     def __init__(self):
         from .. import Config
@@ -257,10 +472,21 @@ class GLRenderer(RendererBase):
                                        _decimal(75.0))
 
     @staticmethod
-    def get_world_coords(mx: int, my: int) -> _point.Point:
-        modelview = GL.glGetDoublev(GL.GL_MODELVIEW_MATRIX)
-        projection = GL.glGetDoublev(GL.GL_PROJECTION_MATRIX)
-        viewport = GL.glGetIntegerv(GL.GL_VIEWPORT)
+    def get_world_coords(mx: int, my: int, modelview=None, projection=None,
+                         viewport=None) -> _point.Point:
+        """
+        modelview, projection, viewport: the cached camera matrices (row
+        major, see `Camera.get_matrices`), they are read back from GL when
+        not given
+        """
+        if modelview is None or projection is None or viewport is None:
+            modelview = GL.glGetDoublev(GL.GL_MODELVIEW_MATRIX)
+            projection = GL.glGetDoublev(GL.GL_PROJECTION_MATRIX)
+            viewport = GL.glGetIntegerv(GL.GL_VIEWPORT)
+        else:
+            # gluUnProject takes the matrices column major
+            modelview = np.asarray(modelview, dtype=np.float64).T
+            projection = np.asarray(projection, dtype=np.float64).T
 
         depth = GL.glReadPixels(float(mx), float(my), 1.0, 1.0,
                                 GL.GL_DEPTH_COMPONENT, GL.GL_FLOAT, None)
@@ -540,8 +766,8 @@ class GLRenderer(RendererBase):
                         p1 = (x + TILE_SIZE, 0, y)
                         self._grid[1].append([p1, p2, p3])
 
-            self._grid[0] = np.array(self._grid[0], dtype=np.dtypes.Float64DType)
-            self._grid[1] = np.array(self._grid[1], dtype=np.dtypes.Float64DType)
+            self._grid[0] = np.array(self._grid[0], dtype=np.dtypes.Float32DType)
+            self._grid[1] = np.array(self._grid[1], dtype=np.dtypes.Float32DType)
 
         return self._grid
 
@@ -549,6 +775,21 @@ class GLRenderer(RendererBase):
     def set_viewport(width: int | float, height: int | float):
         GL.glViewport(0, 0, width, height)
 
+    def invalidate(self, *arrays: np.ndarray):
+        """
+        Tell the renderer the contents of arrays changed in place. Client
+        side arrays are read on every draw so there is nothing to do here.
+        """
+        pass
+
+    @staticmethod
+    def get_gl_type(arr: np.ndarray) -> int:
+        """
+        Returns the GL type to pass to glVertexPointer/glNormalPointer for
+        a vertex or normal array. uint32 arrays are packed normals.
+        """
+        return _GL_TYPES[arr.dtype.str]
+
     def init(self, w: int | float, h: int | float):
         GL.glClearColor(0.20, 0.20, 0.20, 0.0)
         GL.glViewport(0, 0, w, h)
@@ -591,13 +832,108 @@ class GLRenderer(RendererBase):
         self.viewMatrix = GL.glGetFloatv(GL.GL_MODELVIEW_MATRIX)
 
     @staticmethod
-    def build_mesh(model) -> tuple[np.ndarray, np.ndarray, int]:
-        from .. import Config
+    def get_cached_mesh(data: bytes, level: int | None = None) -> _MeshT | None:
+        """
+        Returns the mesh for the model file data if it is in the mesh cache
+        without touching OCP at all, None otherwise.
+        """
+        params = _get_mesh_params(level)
+        return _load_cached_mesh(_make_cache_key(data, params, _is_indexed(params)))
+
+    @staticmethod
+    def build_mesh(model, data: bytes | None = None,
+                   level: int | None = None) -> _MeshT:
+        """
+        Tessellate model.
+
+        Flat meshes come back as (normals, triangles, triangle_count) with
+        3 corners per triangle. Smooth meshes come back indexed as
+        (normals, vertices, index_count, indices), see `build_indexed_mesh`.
+
+        data is the STEP/STL file data the model was loaded from. When it is
+        passed the mesh is looked up in and stored into the mesh cache.
+
+        level selects one of the `LOD_LEVELS`, None builds the default mesh.
+        """
+        params = _get_mesh_params(level)
+
+        if data is None:
+            return _tessellate(model, *params)
+
+        key = _make_cache_key(data, params, _is_indexed(params))
+        mesh = _load_cached_mesh(key)
+
+        if mesh is not None:
+            return mesh
+
+        mesh = _tessellate(model, *params)
+        _store_cached_mesh(key, mesh)
+
+        return mesh
+
+    @staticmethod
+    def get_cached_indexed_mesh(data: bytes, level: int | None = None
+                                ) -> tuple[np.ndarray, np.ndarray, int, np.ndarray] | None:
+        return _load_cached_mesh(
+            _make_cache_key(data, _get_mesh_params(level), indexed=True))
+
+    @staticmethod
+    def build_indexed_mesh(model, data: bytes | None = None, level: int | None = None
+                           ) -> tuple[np.ndarray, np.ndarray, int, np.ndarray]:
+        """
+        Tessellate model into (normals, vertices, index_count, indices)
+        with the seam vertices welded, also when flat normals are
+        configured. The tuple unpacks into the mesh arguments of
+        `DrawWrapper.model`.
+
+        data and level work the same as they do for `build_mesh`.
+        """
+        params = _get_mesh_params(level)
+
+        if data is None:
+            return _get_indexed_triangles(model, *params)
+
+        key = _make_cache_key(data, params, indexed=True)
+        mesh = _load_cached_mesh(key)
+
+        if mesh is not None:
+            return mesh
+
+        mesh = _get_indexed_triangles(model, *params)
+        _store_cached_mesh(key, mesh)
+
+        return mesh
+
+    @staticmethod
+    def get_cached_lod_mesh(data: bytes) -> _lod.LODMesh | None:
+        levels = []
+
+        for level in range(len(LOD_LEVELS)):
+            mesh = GLRenderer.get_cached_mesh(data, level)
+            if mesh is None:
+                return None
+
+            levels.append(mesh)
+
+        return _lod.LODMesh(levels)
 
-        if Config.renderer.smooth_normals:
-            return _get_smooth_triangles(model)
+    @staticmethod
+    def build_lod_mesh(model, data: bytes | None = None) -> _lod.LODMesh:
+        """
+        Tessellate model once for every entry in `LOD_LEVELS`.
+
+        The levels are built coarse to fine. The mesher keeps an existing
+        triangulation on the shape if it is already fine enough, so going
+        the other way would hand back the finest mesh for every level. Any
+        triangulation the shape already carries is removed for the same
+        reason.
+        """
+        BRepTools.Clean_s(model.wrapped)  # NOQA
+
+        levels = [GLRenderer.build_mesh(model, data, level)
+                  for level in range(len(LOD_LEVELS))]
 
-        return _get_triangles(model)
+        return _lod.LODMesh(levels)
 
     def draw(self) -> "DrawWrapper":
         wrapper = DrawWrapper(self)
@@ -675,10 +1011,10 @@ class DrawWrapper(DrawWrapperBase):
     def grid(self):
         if self.grid:
             GL.glColor4f(0.8, 0.8, 0.8, 0.4)
-            GL.glVertexPointer(3, GL.GL_DOUBLE, 0, self._grid[0])
+            GL.glVertexPointer(3, GL.GL_FLOAT, 0, self._grid[0])
             GL.glDrawArrays(GL.GL_TRIANGLES, 0, len(self._grid[0]) * 3)
             GL.glColor4f(0.3, 0.3, 0.3, 0.4)
-            GL.glVertexPointer(3, GL.GL_DOUBLE, 0, self._grid[1])
+            GL.glVertexPointer(3, GL.GL_FLOAT, 0, self._grid[1])
             GL.glDrawArrays(GL.GL_TRIANGLES, 0, len(self._grid[1]) * 3)
 
     @staticmethod
@@ -688,38 +1024,161 @@ class DrawWrapper(DrawWrapperBase):
         triangle_count: int,
         color: tuple[float, float, float, float],
         material: _gl_materials.GLMaterial | None,
-        is_selected: bool
+        is_selected: bool,
+        indices: np.ndarray | None = None
     ):
+        """
+        Draw a mesh.
+
+        Without indices triangles holds 3 corners per triangle and
+        triangle_count is the number of corners. With indices (uint32, as
+        built by `GLRenderer.build_indexed_mesh`) triangles holds the shared
+        vertices and triangle_count is the number of indices to draw.
+        Both layouts unpack straight from `GLRenderer.build_mesh`.
+        """
 
         if triangle_count != 0:
-            if is_selected:
-                GL.glLightfv(GL.GL_LIGHT0, GL.GL_AMBIENT, [1.0, 1.0, 1.0, 1.0])
-                GL.glLightfv(GL.GL_LIGHT0, GL.GL_DIFFUSE, [1.0, 1.0, 1.0, 1.0])
-                GL.glMaterialfv(GL.GL_FRONT, GL.GL_AMBIENT, [0.8, 0.8, 0.8, 1.0])
-                GL.glMaterialfv(GL.GL_FRONT, GL.GL_SPECULAR, [1.0, 1.0, 1.0, 1.0])
-                GL.glMaterialf(GL.GL_FRONT, GL.GL_SHININESS, 100.0)
+            queue = _render_queue.get_active()
 
-            elif material is not None:
-                material.set()
+            if queue is not None:
+                queue.add(normals, triangles, triangle_count, color,
+                          material, is_selected, indices)
+                return
 
-            GL.glColor4f(*color)
+            DrawWrapper.begin_model(color, material, is_selected)
+            DrawWrapper.draw_mesh(normals, triangles, triangle_count, indices)
+            DrawWrapper.end_model(is_selected)
 
-            GL.glVertexPointer(3, GL.GL_DOUBLE, 0, triangles)
+    @staticmethod
+    def draw_mesh(normals: np.ndarray | None, triangles: np.ndarray,
+                  triangle_count: int, indices: np.ndarray | None = None):
+        """
+        Draw a mesh with whatever color, material and light state is set.
+        """
+        GL.glVertexPointer(3, GLRenderer.get_gl_type(triangles), 0, triangles)
 
-            if normals:
-                GL.glNormalPointer(GL.GL_DOUBLE, 0, normals)
+        if normals is not None:
+            GL.glNormalPointer(GLRenderer.get_gl_type(normals), 0, normals)
 
+        if indices is None:
             GL.glDrawArrays(GL.GL_TRIANGLES, 0, triangle_count)
+        else:
+            GL.glDrawElements(GL.GL_TRIANGLES, triangle_count,
+                              GL.GL_UNSIGNED_INT, indices)
+
+    @staticmethod
+    def instances(
+        normals: np.ndarray | None,
+        triangles: np.ndarray,
+        triangle_count: int,
+        matrices: np.ndarray,
+        colors: np.ndarray,
+        material: _gl_materials.GLMaterial | None,
+        indices: np.ndarray | None = None
+    ):
+        """
+        Draw the same mesh once for every instance.
+
+        matrices: (N,4,4) model to world matrices, NumPy (row major) layout
+        colors: (N,4) rgba
+
+        The mesh arguments are the same as for `model`. Client side arrays
+        can not be shared between draws so this pushes a matrix and draws
+        the arrays once per instance.
+        """
+        if triangle_count == 0 or not len(matrices):
+            return
+
+        GL.glPushClientAttrib(GL.GL_CLIENT_VERTEX_ARRAY_BIT)
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+
+        if material is not None:
+            material.set()
+
+        GL.glVertexPointer(3, GLRenderer.get_gl_type(triangles), 0, triangles)
+
+        if normals is not None:
+            GL.glEnableClientState(GL.GL_NORMAL_ARRAY)
+            GL.glNormalPointer(GLRenderer.get_gl_type(normals), 0, normals)
+
+        DrawWrapper.draw_instances(triangle_count, matrices, colors, indices)
+
+        GL.glPopClientAttrib()
 
-            if is_selected:
-                GL.glLightfv(GL.GL_LIGHT0, GL.GL_AMBIENT, [0.5, 0.5, 0.5, 1.0])
-                GL.glLightfv(GL.GL_LIGHT0, GL.GL_DIFFUSE, [0.3, 0.3, 0.3, 1.0])
-                GL.glLightfv(GL.GL_LIGHT0, GL.GL_SPECULAR, [0.5, 0.5, 0.5, 1.0])
+    @staticmethod
+    def draw_instances(triangle_count: int, matrices: np.ndarray,
+                       colors: np.ndarray, indices) -> None:
+        """
+        Draw the mesh whose arrays are already set up once per matrix.
+        indices is the index array, None for non indexed meshes. When the
+        indices are in a bound element buffer an offset can be passed.
+        """
+        gl_matrices = np.ascontiguousarray(
+            np.asarray(matrices, dtype=np.float32).transpose(0, 2, 1))
+
+        for matrix, color in zip(gl_matrices, colors):
+            GL.glPushMatrix()
+            GL.glMultMatrixf(matrix)
+            GL.glColor4f(*color)
+
+            if indices is None:
+                GL.glDrawArrays(GL.GL_TRIANGLES, 0, triangle_count)
+            else:
+                GL.glDrawElements(GL.GL_TRIANGLES, triangle_count,
+                                  GL.GL_UNSIGNED_INT, indices)
+
+            GL.glPopMatrix()
+
+    @staticmethod
+    def begin_model(color: tuple[float, float, float, float],
+                    material: _gl_materials.GLMaterial | None,
+                    is_selected: bool):
+        """
+        Set up the lighting, material and color used to draw a model.
+        """
+        if is_selected:
+            DrawWrapper.begin_highlight()
+
+        elif material is not None:
+            material.set()
+
+        GL.glColor4f(*color)
 
-                GL.glMaterialfv(GL.GL_FRONT, GL.GL_AMBIENT, [0.3, 0.3, 0.3, 1.0])
-                GL.glMaterialfv(GL.GL_FRONT, GL.GL_DIFFUSE, [0.5, 0.5, 0.5, 1.0])
-                GL.glMaterialfv(GL.GL_FRONT, GL.GL_SPECULAR, [0.8, 0.8, 0.8, 1.0])
-                GL.glMaterialf(GL.GL_FRONT, GL.GL_SHININESS, 80.0)
+    @staticmethod
+    def end_model(is_selected: bool):
+        """
+        Undo the highlight `begin_model` sets up for a selected model.
+        """
+        if is_selected:
+            DrawWrapper.end_highlight()
+
+    @staticmethod
+    def set_color(color: tuple[float, float, float, float]):
+        GL.glColor4f(*color)
 
+    @staticmethod
+    def begin_highlight():
+        """
+        Set the light and material used to draw selected models.
+        """
+        GL.glLightfv(GL.GL_LIGHT0, GL.GL_AMBIENT, [1.0, 1.0, 1.0, 1.0])
+        GL.glLightfv(GL.GL_LIGHT0, GL.GL_DIFFUSE, [1.0, 1.0, 1.0, 1.0])
+        GL.glMaterialfv(GL.GL_FRONT, GL.GL_AMBIENT, [0.8, 0.8, 0.8, 1.0])
+        GL.glMaterialfv(GL.GL_FRONT, GL.GL_SPECULAR, [1.0, 1.0, 1.0, 1.0])
+        GL.glMaterialf(GL.GL_FRONT, GL.GL_SHININESS, 100.0)
+
+    @staticmethod
+    def end_highlight():
+        """
+        Put the default light and material back after `begin_highlight`.
+        """
+        GL.glLightfv(GL.GL_LIGHT0, GL.GL_AMBIENT, [0.5, 0.5, 0.5, 1.0])
+        GL.glLightfv(GL.GL_LIGHT0, GL.GL_DIFFUSE, [0.3, 0.3, 0.3, 1.0])
+        GL.glLightfv(GL.GL_LIGHT0, GL.GL_SPECULAR, [0.5, 0.5, 0.5, 1.0])
+
+        GL.glMaterialfv(GL.GL_FRONT, GL.GL_AMBIENT, [0.3, 0.3, 0.3, 1.0])
+        GL.glMaterialfv(GL.GL_FRONT, GL.GL_DIFFUSE, [0.5, 0.5, 0.5, 1.0])
+        GL.glMaterialfv(GL.GL_FRONT, GL.GL_SPECULAR, [0.8, 0.8, 0.8, 1.0])
+        GL.glMaterialf(GL.GL_FRONT, GL.GL_SHININESS, 80.0)
 
 GLRenderer.set_active()
@@ -0,0 +1,333 @@
+"""
+Color ID picking.
+
+The CPU picker in `canvas.object_picker` has to find the objects under the
+mouse every time it gets asked. `IdBuffer` instead draws the visible
+objects into an offscreen framebuffer with every object in a flat color
+that encodes its index in the list that was drawn, with lighting,
+blending and multisampling off so the colors come out exactly as they
+went in. Finding the object under a pixel is then reading one value out of
+an array, no matter how many objects there are.
+
+Reading the framebuffer back with glReadPixels straight into host memory
+waits for the GPU to finish the frame. The pixels are read into one of two
+pixel buffer objects instead and a fence is placed behind the read.
+`resolve` maps the buffer once the fence has passed, by then the copy has
+long finished, the second buffer lets the next pass start while the one
+before it has not been resolved yet.
+
+The pass only needs to be drawn again when what it shows changes, the
+caller hands `render` a key (the camera and scene generations) and the
+pass is skipped when the key is the same as the one of the last pass.
+
+`IdBuffer.create` returns None if the driver has no framebuffer or pixel
+buffer objects, picking then stays on the CPU.
+"""
+
+import ctypes
+
+from OpenGL import GL
+
+import numpy as np
+
+from . import lod as _lod
+from . import render_queue as _render_queue
+
+
+# two pixel buffers, one being read into while the other waits to be
+# resolved
+_SLOT_COUNT = 2
+
+
+def encode_ids(count: int) -> np.ndarray:
+    """
+    The (count,4) uint8 colors for the object indices 0 to count - 1. The
+    index + 1 is stored in red, green and blue, 0 is left for the
+    background.
+    """
+    ids = np.arange(1, count + 1, dtype=np.uint32)
+
+    colors = np.empty((count, 4), dtype=np.uint8)
+    colors[:, 0] = ids & 0xFF
+    colors[:, 1] = (ids >> 8) & 0xFF
+    colors[:, 2] = (ids >> 16) & 0xFF
+    colors[:, 3] = 0xFF
+
+    return colors
+
+
+def decode_ids(pixels: np.ndarray) -> np.ndarray:
+    """
+    Turn RGBA pixels as read with GL_UNSIGNED_BYTE, viewed as little endian
+    uint32, into the ids `encode_ids` put in them. Returns a new array.
+    """
+    # the bytes are R, G, B, A in memory, as a little endian uint32 red is
+    # the lowest byte
+    return (pixels & 0xFFFFFF).astype(np.uint32)
+
+
+class _Pass:
+
+    __slots__ = ('slot', 'fence', 'key', 'objects', 'width', 'height')
+
+    def __init__(self, slot, fence, key, objects, width, height):
+        self.slot = slot
+        self.fence = fence
+        self.key = key
+        self.objects = objects
+        self.width = width
+        self.height = height
+
+
+class IdBuffer:
+
+    def __init__(self):
+        self.framebuffer = int(GL.glGenFramebuffers(1))
+        self.color_buffer = int(GL.glGenRenderbuffers(1))
+        self.depth_buffer = int(GL.glGenRenderbuffers(1))
+        self.pixel_buffers = [int(buffer) for buffer in
+                              np.ravel(GL.glGenBuffers(_SLOT_COUNT))]
+
+        self.width = 0
+        self.height = 0
+
+        self._has_fences = bool(GL.glFenceSync)
+        self._queue = _render_queue.RenderQueue()
+
+        # passes that have been read into a pixel buffer, oldest first
+        self._pending: list[_Pass] = []
+
+        # key of the last pass drawn and of the pass the ids are from
+        self._key = None
+        self._resolved_key = None
+
+        self._ids = np.zeros((0, 0), dtype=np.uint32)
+        self._objects = []
+
+    @classmethod
+    def create(cls) -> "IdBuffer | None":
+        """
+        The GL context has to be current. Returns None if framebuffer or
+        pixel buffer objects are not supported.
+        """
+        if not (GL.glGenFramebuffers and GL.glGenRenderbuffers and
+                GL.glMapBuffer and GL.glGenBuffers):
+            return None
+
+        return cls()
+
+    def _resize(self, width: int, height: int) -> None:
+        self.width = width
+        self.height = height
+
+        GL.glBindRenderbuffer(GL.GL_RENDERBUFFER, self.color_buffer)
+        GL.glRenderbufferStorage(GL.GL_RENDERBUFFER, GL.GL_RGBA8, width, height)
+        GL.glBindRenderbuffer(GL.GL_RENDERBUFFER, self.depth_buffer)
+        GL.glRenderbufferStorage(GL.GL_RENDERBUFFER, GL.GL_DEPTH_COMPONENT24,
+                                 width, height)
+        GL.glBindRenderbuffer(GL.GL_RENDERBUFFER, 0)
+
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.framebuffer)
+        GL.glFramebufferRenderbuffer(GL.GL_FRAMEBUFFER, GL.GL_COLOR_ATTACHMENT0,
+                                     GL.GL_RENDERBUFFER, self.color_buffer)
+        GL.glFramebufferRenderbuffer(GL.GL_FRAMEBUFFER, GL.GL_DEPTH_ATTACHMENT,
+                                     GL.GL_RENDERBUFFER, self.depth_buffer)
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, 0)
+
+        for buffer in self.pixel_buffers:
+            GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, buffer)
+            GL.glBufferData(GL.GL_PIXEL_PACK_BUFFER, width * height * 4,
+                            None, GL.GL_STREAM_READ)
+
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+
+        # the passes in flight were read with the old size
+        self._drop_pending()
+        self._key = None
+
+    def _drop_pending(self) -> None:
+        for pending in self._pending:
+            if pending.fence is not None:
+                GL.glDeleteSync(pending.fence)
+
+        self._pending = []
+
+    def render(self, objs: list, key, width: int, height: int,
+               draw_wrapper) -> bool:
+        """
+        Draw objs into the ID buffer with the projection and modelview that
+        are loaded and start reading it back. Nothing gets drawn if key is
+        the same as the key of the last pass. Returns True if the pass was
+        drawn.
+
+        Objects that provide `mesh` and `instance_matrix` (see
+        `Canvas._draw_instanced`) are drawn from those, all others through
+        their renderers in `triangles`.
+        """
+        if width <= 0 or height <= 0:
+            return False
+
+        if (width, height) != (self.width, self.height):
+            self._resize(width, height)
+
+        if key == self._key:
+            return False
+
+        self._key = key
+
+        # free a pixel buffer, the oldest pass gets replaced by this one
+        if len(self._pending) == _SLOT_COUNT:
+            oldest = self._pending.pop(0)
+            if oldest.fence is not None:
+                GL.glDeleteSync(oldest.fence)
+
+        used = [pending.slot for pending in self._pending]
+        slot = next(i for i in range(_SLOT_COUNT) if i not in used)
+
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self.framebuffer)
+        GL.glPushAttrib(GL.GL_ENABLE_BIT | GL.GL_COLOR_BUFFER_BIT |
+                        GL.GL_VIEWPORT_BIT | GL.GL_CURRENT_BIT)
+        GL.glPushClientAttrib(GL.GL_CLIENT_VERTEX_ARRAY_BIT)
+
+        GL.glViewport(0, 0, width, height)
+        GL.glDisable(GL.GL_LIGHTING)
+        GL.glDisable(GL.GL_BLEND)
+        GL.glDisable(GL.GL_DITHER)
+        GL.glDisable(GL.GL_MULTISAMPLE)
+        GL.glDisable(GL.GL_TEXTURE_2D)
+        GL.glEnable(GL.GL_DEPTH_TEST)
+
+        GL.glClearColor(0.0, 0.0, 0.0, 0.0)
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT | GL.GL_DEPTH_BUFFER_BIT)
+
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glDisableClientState(GL.GL_NORMAL_ARRAY)
+
+        for obj, color in zip(objs, encode_ids(len(objs)).tolist()):
+            GL.glColor4ub(*color)
+            self._draw_object(obj, draw_wrapper)
+
+        GL.glPopClientAttrib()
+        GL.glPopAttrib()
+
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, self.pixel_buffers[slot])
+        GL.glReadBuffer(GL.GL_COLOR_ATTACHMENT0)
+        GL.glPixelStorei(GL.GL_PACK_ALIGNMENT, 4)
+        GL.glReadPixels(0, 0, width, height, GL.GL_RGBA, GL.GL_UNSIGNED_BYTE,
+                        ctypes.c_void_p(0))
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, 0)
+
+        fence = None
+        if self._has_fences:
+            fence = GL.glFenceSync(GL.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+
+        self._pending.append(_Pass(slot, fence, key, list(objs), width, height))
+        return True
+
+    def _draw_object(self, obj, draw_wrapper) -> None:
+        mesh = _lod.get_mesh(obj)
+        matrix = getattr(obj, 'instance_matrix', None)
+
+        if mesh is not None and matrix is not None:
+            _, triangles, triangle_count, *indices = mesh
+
+            GL.glPushMatrix()
+            GL.glMultMatrixf(np.ascontiguousarray(
+                np.asarray(matrix, dtype=np.float32).T))
+            draw_wrapper.draw_mesh(None, triangles, triangle_count, *indices)
+            GL.glPopMatrix()
+            return
+
+        # collect what the renderers of the object draw and draw only the
+        # geometry, the color is the id
+        with self._queue:
+            for renderer in obj.triangles:
+                renderer()
+
+        for item in self._queue.take():
+            draw_wrapper.draw_mesh(None, item.triangles, item.triangle_count,
+                                   item.indices)
+
+    def _is_done(self, pending: _Pass) -> bool:
+        if pending.fence is None:
+            return True
+
+        status = GL.glClientWaitSync(pending.fence, 0, 0)
+        return status in (GL.GL_ALREADY_SIGNALED, GL.GL_CONDITION_SATISFIED)
+
+    def resolve(self) -> None:
+        """
+        Pick up the newest pass whose read back has finished. Never waits
+        on the GPU when fences are supported, the GL context has to be
+        current.
+        """
+        done = None
+        for i in range(len(self._pending) - 1, -1, -1):
+            if self._is_done(self._pending[i]):
+                done = i
+                break
+
+        if done is None:
+            return
+
+        pending = self._pending[done]
+
+        # passes older than the one resolved are of no use anymore
+        for older in self._pending[:done + 1]:
+            if older.fence is not None:
+                GL.glDeleteSync(older.fence)
+
+        self._pending = self._pending[done + 1:]
+
+        width = pending.width
+        height = pending.height
+
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, self.pixel_buffers[pending.slot])
+        address = GL.glMapBuffer(GL.GL_PIXEL_PACK_BUFFER, GL.GL_READ_ONLY)
+
+        if address:
+            data = (ctypes.c_uint32 * (width * height)).from_address(address)
+            pixels = np.frombuffer(data, dtype='<u4').reshape(height, width)
+
+            # flip the rows so they run top to bottom like window coords,
+            # decoding copies them out before the buffer gets unmapped
+            self._ids = decode_ids(pixels[::-1])
+            self._objects = pending.objects
+            self._resolved_key = pending.key
+
+            GL.glUnmapBuffer(GL.GL_PIXEL_PACK_BUFFER)
+
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+
+    def is_current(self, key) -> bool:
+        """
+        True if the ids that have been resolved are from a pass drawn with
+        key.
+        """
+        return self._resolved_key is not None and self._resolved_key == key
+
+    def object_at(self, x: int, y: int):
+        """
+        The object drawn at window pixel x, y (top left origin) in the last
+        resolved pass or None.
+        """
+        height, width = self._ids.shape
+        x = int(x)
+        y = int(y)
+
+        if not (0 <= x < width and 0 <= y < height):
+            return None
+
+        index = int(self._ids[y, x]) - 1
+        if index < 0 or index >= len(self._objects):
+            return None
+
+        return self._objects[index]
+
+    def release(self) -> None:
+        self._drop_pending()
+
+        GL.glDeleteFramebuffers(1, [self.framebuffer])
+        GL.glDeleteRenderbuffers(2, [self.color_buffer, self.depth_buffer])
+        GL.glDeleteBuffers(_SLOT_COUNT, self.pixel_buffers)
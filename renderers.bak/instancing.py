@@ -0,0 +1,201 @@
+"""
+Hardware instancing.
+
+A harness holds thousands of identical terminals, seals and locks. Those
+share a single mesh and get drawn with one glDrawArraysInstanced /
+glDrawElementsInstanced call per model with the model to world matrix and
+the color of every instance passed as per instance vertex attributes.
+
+The fixed function pipeline has no way to read per instance data so the
+instances are drawn with a small GLSL 1.20 program. It reads the light and
+material state that is already set (`GL_LIGHT0`, `glMaterial`) through the
+compatibility built-ins and lights the same way the fixed function
+pipeline does with `GL_COLOR_MATERIAL` set to `GL_AMBIENT_AND_DIFFUSE`.
+
+`InstanceProgram.create` returns None if the driver does not support
+instanced arrays, the renderer then falls back to drawing the shared mesh
+once per instance with a matrix push.
+"""
+
+import ctypes
+import logging
+
+from OpenGL import GL
+
+import numpy as np
+
+from . import Config
+
+
+_logger = logging.getLogger(__name__)
+
+# attribute locations, these stay clear of the locations NVIDIA aliases
+# to gl_Vertex, gl_Normal and gl_Color
+MATRIX_LOCATION = 10  # a mat4 takes 4 locations, 10 - 13
+COLOR_LOCATION = 14
+
+_INSTANCE_STRIDE = 20 * 4  # 16 floats of matrix and 4 of color
+
+_VERTEX_SHADER = '''
+#version 120
+
+attribute mat4 instance_matrix;
+attribute vec4 instance_color;
+
+varying vec4 color;
+
+void main()
+{
+    vec4 eye = gl_ModelViewMatrix * (instance_matrix * gl_Vertex);
+    vec3 normal = normalize(gl_NormalMatrix * (mat3(instance_matrix) * gl_Normal));
+
+    vec3 light;
+    if (gl_LightSource[0].position.w == 0.0)
+        light = normalize(gl_LightSource[0].position.xyz);
+    else
+        light = normalize(gl_LightSource[0].position.xyz - eye.xyz);
+
+    float diffuse = max(dot(normal, light), 0.0);
+    float specular = 0.0;
+
+    if (diffuse > 0.0) {
+        vec3 half_vector = normalize(light + normalize(-eye.xyz));
+        specular = pow(max(dot(normal, half_vector), 0.0),
+                       gl_FrontMaterial.shininess);
+    }
+
+    color = (gl_LightModel.ambient + gl_LightSource[0].ambient +
+             gl_LightSource[0].diffuse * diffuse) * instance_color +
+            gl_LightSource[0].specular * gl_FrontMaterial.specular * specular;
+    color.a = instance_color.a;
+
+    gl_Position = gl_ProjectionMatrix * eye;
+}
+'''
+
+_FRAGMENT_SHADER = '''
+#version 120
+
+varying vec4 color;
+
+void main()
+{
+    gl_FragColor = color;
+}
+'''
+
+
+def pack_instances(matrices: np.ndarray, colors: np.ndarray) -> np.ndarray:
+    """
+    Interleave (N,4,4) row major model matrices and (N,4) colors into the
+    (N,20) float32 layout the instance buffer uses. The matrices are stored
+    column major the way OpenGL reads them.
+    """
+    count = len(matrices)
+
+    data = np.empty((count, 20), dtype=np.float32)
+    data[:, :16] = np.asarray(matrices, dtype=np.float32).transpose(0, 2, 1).reshape(count, 16)
+    data[:, 16:] = colors
+
+    return data
+
+
+def _compile_shader(shader_type: int, source: str) -> int:
+    shader = GL.glCreateShader(shader_type)
+    GL.glShaderSource(shader, source)
+    GL.glCompileShader(shader)
+
+    if not GL.glGetShaderiv(shader, GL.GL_COMPILE_STATUS):
+        log = GL.glGetShaderInfoLog(shader)
+        GL.glDeleteShader(shader)
+        raise RuntimeError(log)
+
+    return shader
+
+
+class InstanceProgram:
+
+    def __init__(self, program: int):
+        self.program = program
+        self.buffer = int(GL.glGenBuffers(1))
+
+    @classmethod
+    def create(cls) -> "InstanceProgram | None":
+        """
+        Build the program, the GL context has to be current. Returns None
+        if instancing is turned off in `Config.instancing` or is not
+        supported.
+        """
+        if not Config.instancing:
+            return None
+
+        if not (GL.glVertexAttribDivisor and GL.glDrawArraysInstanced and
+                GL.glDrawElementsInstanced):
+            return None
+
+        try:
+            vertex_shader = _compile_shader(GL.GL_VERTEX_SHADER, _VERTEX_SHADER)
+            fragment_shader = _compile_shader(GL.GL_FRAGMENT_SHADER, _FRAGMENT_SHADER)
+        except RuntimeError as err:
+            _logger.warning('Instancing disabled, shader compile failed: %s', err)
+            return None
+
+        program = GL.glCreateProgram()
+        GL.glAttachShader(program, vertex_shader)
+        GL.glAttachShader(program, fragment_shader)
+        GL.glBindAttribLocation(program, MATRIX_LOCATION, 'instance_matrix')
+        GL.glBindAttribLocation(program, COLOR_LOCATION, 'instance_color')
+        GL.glLinkProgram(program)
+
+        GL.glDeleteShader(vertex_shader)
+        GL.glDeleteShader(fragment_shader)
+
+        if not GL.glGetProgramiv(program, GL.GL_LINK_STATUS):
+            _logger.warning('Instancing disabled, shader link failed: %s',
+                            GL.glGetProgramInfoLog(program))
+            GL.glDeleteProgram(program)
+            return None
+
+        return cls(program)
+
+    def draw(self, triangle_count: int, matrices: np.ndarray, colors: np.ndarray,
+             indexed: bool) -> None:
+        """
+        Draw the mesh whose vertex and normal arrays (and element array if
+        indexed is True) are already bound once for every matrix.
+        """
+        data = pack_instances(matrices, colors)
+
+        GL.glUseProgram(self.program)
+
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self.buffer)
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, data.nbytes, data, GL.GL_STREAM_DRAW)
+
+        for i in range(4):
+            GL.glEnableVertexAttribArray(MATRIX_LOCATION + i)
+            GL.glVertexAttribPointer(MATRIX_LOCATION + i, 4, GL.GL_FLOAT, GL.GL_FALSE,
+                                     _INSTANCE_STRIDE, ctypes.c_void_p(i * 16))
+            GL.glVertexAttribDivisor(MATRIX_LOCATION + i, 1)
+
+        GL.glEnableVertexAttribArray(COLOR_LOCATION)
+        GL.glVertexAttribPointer(COLOR_LOCATION, 4, GL.GL_FLOAT, GL.GL_FALSE,
+                                 _INSTANCE_STRIDE, ctypes.c_void_p(64))
+        GL.glVertexAttribDivisor(COLOR_LOCATION, 1)
+
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
+        if indexed:
+            GL.glDrawElementsInstanced(GL.GL_TRIANGLES, triangle_count,
+                                       GL.GL_UNSIGNED_INT, None, len(data))
+        else:
+            GL.glDrawArraysInstanced(GL.GL_TRIANGLES, 0, triangle_count, len(data))
+
+        for location in range(MATRIX_LOCATION, COLOR_LOCATION + 1):
+            GL.glVertexAttribDivisor(location, 0)
+            GL.glDisableVertexAttribArray(location)
+
+        GL.glUseProgram(0)
+
+    def release(self) -> None:
+        GL.glDeleteBuffers(1, [self.buffer])
+        GL.glDeleteProgram(self.program)
@@ -0,0 +1,97 @@
+"""
+Level of detail meshes.
+
+A part that covers a handful of pixels on the screen does not need the same
+tessellation as one that fills the view. `LODMesh` holds several
+tessellations of the same model, ordered coarse to fine, and picks the one
+to draw from the size of the object on the screen.
+
+The switch points between the levels are `Config.lod_thresholds`, given in
+pixels of the projected bounding box diagonal. To keep a mesh that sits
+right at one of those points from flipping back and forth between two
+levels every frame a level is only left once the size is
+`Config.lod_hysteresis` (a fraction of the threshold) past the switch
+point.
+
+Objects that support LOD expose their `LODMesh` as `obj.lod` and draw
+`obj.lod.mesh`, `get_mesh` returns the mesh to draw for objects with and
+without LOD. The canvas updates the selected level for every visible
+object before drawing.
+
+Objects loaded from the same model share the arrays of every level but
+each gets its own `LODMesh` (see `LODMesh.share`) so the level is
+selected per object.
+"""
+
+import numpy as np
+
+from . import Config
+
+
+# (normals, triangles, triangle_count) or, for indexed meshes,
+# (normals, vertices, index_count, indices)
+_MeshT = (tuple[np.ndarray, np.ndarray, int] |
+          tuple[np.ndarray, np.ndarray, int, np.ndarray])
+
+
+class LODMesh:
+
+    def __init__(self, levels: list[_MeshT]):
+        if not levels:
+            raise ValueError('at least one level is needed')
+
+        self.levels = levels
+
+        # start with the finest level, the first select will move it down
+        # if the object is small
+        self.level = len(levels) - 1
+
+    @property
+    def mesh(self) -> _MeshT:
+        return self.levels[self.level]
+
+    def share(self) -> "LODMesh":
+        """
+        Returns a `LODMesh` using the same level meshes with its own
+        selected level.
+        """
+        lod_mesh = LODMesh(self.levels)
+        lod_mesh.level = self.level
+        return lod_mesh
+
+    def select(self, screen_size: float) -> bool:
+        """
+        Select the level for an object that is screen_size pixels across.
+
+        Returns True if the level changed.
+        """
+        thresholds = Config.lod_thresholds
+        hysteresis = Config.lod_hysteresis
+
+        top = min(len(self.levels), len(thresholds) + 1) - 1
+        level = min(self.level, top)
+
+        while level < top and screen_size > thresholds[level] * (1.0 + hysteresis):
+            level += 1
+
+        while level > 0 and screen_size < thresholds[level - 1] * (1.0 - hysteresis):
+            level -= 1
+
+        if level == self.level:
+            return False
+
+        self.level = level
+        return True
+
+
+def get_mesh(obj) -> _MeshT | None:
+    """
+    Returns the mesh obj is drawn with, the selected level of `obj.lod` if
+    it has one, otherwise `obj.mesh`.
+    """
+    lod_mesh = getattr(obj, 'lod', None)
+
+    if lod_mesh is not None:
+        return lod_mesh.mesh
+
+    return getattr(obj, 'mesh', None)
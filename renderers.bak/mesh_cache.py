@@ -0,0 +1,197 @@
+"""
+Persistent on-disk cache for tessellated meshes.
+
+Meshing a STEP/STL model with OCP is by far the most expensive part of
+loading a part. The result only depends on the model data and on the
+parameters that were handed to the mesher, so it is stored on disk and
+reused the next time the same model gets loaded.
+
+Every entry is a directory named after the cache key that holds one `.npy`
+file per array. The arrays are loaded memory mapped in copy-on-write mode
+so a warm load does not read the whole file up front and code that
+transforms the arrays in place never writes back into the cache.
+
+The total size of the cache is bounded by `Config.mesh_cache_size` (MB).
+The modification time of an entry directory is bumped each time the entry
+is used and the least recently used entries get removed first when the
+cache grows past that size.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from . import Config
+
+
+# bump this if the layout or the content of the stored arrays changes
+_FORMAT_VERSION = 2
+
+_lock = threading.Lock()
+_cache_path = None
+
+
+def make_key(data: bytes, lin_deflection: float, ang_deflection: float,
+             method: str) -> str:
+    """
+    Build the cache key for a model.
+
+    data: the raw STEP/STL file data
+    lin_deflection, ang_deflection: parameters passed to the mesher
+    method: the normal smoothing method or "flat"
+    """
+    hsh = hashlib.blake2b(digest_size=20)
+    hsh.update(data)
+    hsh.update(f'|{_FORMAT_VERSION}|{lin_deflection!r}|'
+               f'{ang_deflection!r}|{method}'.encode('utf-8'))
+
+    return hsh.hexdigest()
+
+
+def get_cache_path() -> str:
+    global _cache_path
+
+    if _cache_path is None:
+        path = Config.mesh_cache_path
+
+        if not path:
+            import wx
+
+            path = os.path.join(wx.StandardPaths.Get().GetUserLocalDataDir(),
+                                'mesh_cache')
+
+        _cache_path = path
+
+    return _cache_path
+
+
+def set_cache_path(path: str) -> None:
+    global _cache_path
+    _cache_path = path
+
+
+def is_enabled() -> bool:
+    return Config.mesh_cache_size > 0
+
+
+def load(key: str) -> dict[str, np.ndarray] | None:
+    """
+    Returns the arrays stored under key or None if there is no entry.
+    """
+    if not is_enabled():
+        return None
+
+    entry_path = os.path.join(get_cache_path(), key)
+
+    if not os.path.isdir(entry_path):
+        return None
+
+    arrays = {}
+
+    try:
+        for file_name in os.listdir(entry_path):
+            name, ext = os.path.splitext(file_name)
+            if ext != '.npy':
+                continue
+
+            arrays[name] = np.load(os.path.join(entry_path, file_name),
+                                   mmap_mode='c', allow_pickle=False)
+
+        # mark the entry as most recently used
+        os.utime(entry_path)
+    except (OSError, ValueError):
+        # damaged or partially removed entry
+        shutil.rmtree(entry_path, ignore_errors=True)
+        return None
+
+    if not arrays:
+        return None
+
+    return arrays
+
+
+def store(key: str, **arrays: np.ndarray) -> None:
+    """
+    Stores arrays under key and evicts old entries if the cache has grown
+    past its maximum size.
+
+    The entry is written into a temporary directory first and then moved
+    into place so other processes never see a partially written entry.
+    """
+    if not is_enabled():
+        return
+
+    cache_path = get_cache_path()
+    entry_path = os.path.join(cache_path, key)
+
+    if os.path.isdir(entry_path):
+        return
+
+    tmp_path = f'{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+    try:
+        os.makedirs(tmp_path, exist_ok=True)
+
+        for name, arr in arrays.items():
+            np.save(os.path.join(tmp_path, name + '.npy'),
+                    np.ascontiguousarray(arr), allow_pickle=False)
+
+        os.replace(tmp_path, entry_path)
+    except OSError:
+        # another process beat us to it or the disk is not writable,
+        # either way the cache is only an optimization
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return
+
+    _evict(cache_path, Config.mesh_cache_size * 1024 * 1024)
+
+
+def clear() -> None:
+    with _lock:
+        shutil.rmtree(get_cache_path(), ignore_errors=True)
+
+
+def _entry_size(entry_path: str) -> int:
+    size = 0
+    for entry in os.scandir(entry_path):
+        size += entry.stat().st_size
+
+    return size
+
+
+def _evict(cache_path: str, max_size: int) -> None:
+    with _lock:
+        entries = []
+        total_size = 0
+
+        try:
+            for entry in os.scandir(cache_path):
+                if not entry.is_dir() or entry.name.endswith('.tmp'):
+                    continue
+
+                try:
+                    size = _entry_size(entry.path)
+                    mtime = entry.stat().st_mtime
+                except OSError:
+                    continue
+
+                total_size += size
+                entries.append((mtime, size, entry.path))
+        except OSError:
+            return
+
+        if total_size <= max_size:
+            return
+
+        # oldest first
+        entries.sort()
+
+        for _, size, entry_path in entries:
+            shutil.rmtree(entry_path, ignore_errors=True)
+            total_size -= size
+
+            if total_size <= max_size:
+                break
@@ -0,0 +1,189 @@
+"""
+State sorted draw queue.
+
+Drawing every object straight away means calling `material.set()` and
+`glColor` for each of them and, for the selected object, rewriting the
+light and material state before and after it. With thousands of objects
+most of those calls set the state to what it already is.
+
+While a `RenderQueue` is active (`with queue:`) `DrawWrapper.model` adds
+the draw to the queue instead of drawing it. `flush` then sorts the draws
+by material and color and only changes state when it differs from the
+draw before. Selected objects are drawn last in a pass of their own so the
+highlight state is set once for all of them instead of being set and
+undone around each one.
+
+Materials are compared with `==`, equal materials are sorted next to
+each other even when they are separate objects.
+"""
+
+from OpenGL import GL
+
+import numpy as np
+
+
+_active = None
+
+
+def get_active() -> "RenderQueue | None":
+    return _active
+
+
+class _DrawItem:
+
+    __slots__ = ('normals', 'triangles', 'triangle_count', 'color',
+                 'material', 'indices')
+
+    def __init__(self, normals, triangles, triangle_count, color, material, indices):
+        self.normals = normals
+        self.triangles = triangles
+        self.triangle_count = triangle_count
+        self.color = color
+        self.material = material
+        self.indices = indices
+
+
+def material_keys(items: list) -> dict[int, int]:
+    """
+    id(material) -> sort key of the materials of items (anything with a
+    material attribute). Materials that are equal get the same key even if
+    they are separate objects, `flush` compares them with `==` so they have
+    to end up next to each other.
+    """
+    keys = {}
+    distinct = []
+
+    for item in items:
+        material = item.material
+        if material is None or id(material) in keys:
+            continue
+
+        for key, other in enumerate(distinct):
+            if material == other:
+                break
+        else:
+            key = len(distinct)
+            distinct.append(material)
+
+        keys[id(material)] = key
+
+    return keys
+
+
+class RenderQueue:
+
+    def __init__(self):
+        self._items: list[_DrawItem] = []
+        self._selected: list[_DrawItem] = []
+        self._previous = None
+
+        # state changes issued by the last flush
+        self.material_changes = 0
+        self.color_changes = 0
+
+    def __enter__(self) -> "RenderQueue":
+        global _active
+
+        self._previous = _active
+        _active = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        global _active
+
+        _active = self._previous
+        self._previous = None
+
+    def __len__(self) -> int:
+        return len(self._items) + len(self._selected)
+
+    def add(self, normals: np.ndarray | None, triangles: np.ndarray,
+            triangle_count: int, color, material, is_selected: bool,
+            indices: np.ndarray | None = None) -> None:
+
+        item = _DrawItem(normals, triangles, triangle_count, tuple(color),
+                         material, indices)
+
+        if is_selected:
+            self._selected.append(item)
+        else:
+            self._items.append(item)
+
+    def clear(self) -> None:
+        self._items = []
+        self._selected = []
+
+    def take(self) -> list[_DrawItem]:
+        """
+        Empty the queue and return the draws in it, selected or not, in the
+        order they were added. For passes that draw the geometry with state
+        of their own.
+        """
+        items = self._items + self._selected
+        self.clear()
+        return items
+
+    def flush(self, draw_wrapper) -> None:
+        """
+        Draw everything in the queue with draw_wrapper and empty it.
+        """
+        keys = material_keys(self._items)
+        items = sorted(self._items, key=lambda i: (
+            keys.get(id(i.material), -1), i.color))
+        # selected objects are drawn with the highlight, not their material
+        selected = sorted(self._selected, key=lambda i: i.color)
+        self.clear()
+
+        self.material_changes = 0
+        self.color_changes = 0
+
+        if not items and not selected:
+            return
+
+        GL.glPushClientAttrib(GL.GL_CLIENT_VERTEX_ARRAY_BIT)
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glDisableClientState(GL.GL_NORMAL_ARRAY)
+
+        self._draw_items(draw_wrapper, items, True)
+
+        if selected:
+            draw_wrapper.begin_highlight()
+            self._draw_items(draw_wrapper, selected, False)
+            draw_wrapper.end_highlight()
+
+        GL.glPopClientAttrib()
+
+    def _draw_items(self, draw_wrapper, items: list[_DrawItem],
+                    use_material: bool) -> None:
+        has_normals = False
+        last_material = None
+        last_color = None
+
+        for item in items:
+            if use_material and item.material is not None and (
+                last_material is None or item.material != last_material
+            ):
+                item.material.set()
+                last_material = item.material
+                self.material_changes += 1
+
+                # material.set() can change the current color
+                last_color = None
+
+            if item.color != last_color:
+                draw_wrapper.set_color(item.color)
+                last_color = item.color
+                self.color_changes += 1
+
+            # a mesh without normals must not read the normal array of the
+            # mesh drawn before it
+            if (item.normals is not None) != has_normals:
+                has_normals = item.normals is not None
+
+                if has_normals:
+                    GL.glEnableClientState(GL.GL_NORMAL_ARRAY)
+                else:
+                    GL.glDisableClientState(GL.GL_NORMAL_ARRAY)
+
+            draw_wrapper.draw_mesh(item.normals, item.triangles,
+                                   item.triangle_count, item.indices)
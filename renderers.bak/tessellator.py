@@ -0,0 +1,376 @@
+"""
+Background tessellation service.
+
+Parsing a STEP file and running BRepMesh_IncrementalMesh on it can take
+several seconds for a large housing. Doing that on the UI thread freezes the
+editor so the work is handed off to a pool of worker processes instead.
+
+The workers get the raw model file data and return the normal, triangle
+and (for indexed meshes) index arrays through shared memory so the (possibly very large) arrays do not
+have to be pickled on the way back. Results are collected as they come in
+and handed to the UI thread in batches, one `wx.CallAfter` per batch, so
+several meshes finishing at about the same time only cause a single
+redraw.
+
+Objects loaded from the same model file share one set of arrays. A model
+that is already being tessellated is not queued a second time and a model
+whose arrays are still in use by another object is handed those arrays
+instead of being loaded again, so mesh memory grows with the number of
+unique parts and not with the number of objects.
+"""
+
+from typing import Callable
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import weakref
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent import futures
+
+import wx
+import numpy as np
+
+from . import mesh_cache as _mesh_cache
+from . import lod as _lod
+
+
+_SharedT = tuple[str, tuple[int, ...], str]
+
+_logger = logging.getLogger(__name__)
+
+
+def make_model_key(data: bytes) -> str:
+    """
+    Returns a key that is the same for all objects loaded from the same
+    model file data.
+    """
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+class _SharedMeshes:
+    """
+    Meshes that are in use, held through weak references so a mesh is
+    dropped as soon as the last object using it goes away.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meshes = {}
+
+    def get(self, key: tuple) -> tuple | None:
+        with self._lock:
+            refs = self._meshes.get(key, None)
+
+            if refs is None:
+                return None
+
+            args = tuple(ref() if isinstance(ref, weakref.ref) else ref
+                         for ref in refs)
+
+            if any(arg is None for arg in args):
+                del self._meshes[key]
+                return None
+
+        return args
+
+    def add(self, key: tuple, args: tuple) -> None:
+        refs = tuple(weakref.ref(arg) if isinstance(arg, (np.ndarray, _lod.LODMesh))
+                     else arg for arg in args)
+
+        with self._lock:
+            self._meshes[key] = refs
+
+
+def _read_model(data: bytes, type_: str):
+    import build123d
+
+    suffix = '.stl' if type_ == 'stl' else '.stp'
+
+    # every worker needs its own file, a fixed file name would get
+    # overwritten by the other workers
+    fd, tmp_file_path = tempfile.mkstemp(suffix=suffix)
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+
+        if type_ == 'stl':
+            model = build123d.import_stl(tmp_file_path)
+        else:
+            model = build123d.import_step(tmp_file_path)
+    finally:
+        try:
+            os.remove(tmp_file_path)
+        except OSError:
+            pass
+
+    return model
+
+
+def _to_shared(arr: np.ndarray) -> _SharedT:
+    arr = np.ascontiguousarray(arr)
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+
+    dst = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+    dst[...] = arr
+
+    name = shm.name
+    del dst
+    shm.close()
+
+    return name, arr.shape, arr.dtype.str
+
+
+def _from_shared(shared: _SharedT) -> np.ndarray:
+    name, shape, dtype = shared
+
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        src = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        arr = src.copy()
+        del src
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return arr
+
+
+def _free_shared(shared: _SharedT) -> None:
+    # unlink a segment whose array is not going to be read
+    try:
+        shm = shared_memory.SharedMemory(name=shared[0])
+    except FileNotFoundError:
+        return
+
+    shm.close()
+    shm.unlink()
+
+
+def _mesh_to_shared(mesh: tuple) -> tuple:
+    # (normals, triangles, triangle_count[, indices]) with every array
+    # moved into shared memory
+    normals, triangles, triangle_count, *indices = mesh
+
+    return (_to_shared(normals), _to_shared(triangles), triangle_count,
+            *[_to_shared(arr) for arr in indices])
+
+
+def _mesh_from_shared(shared_mesh: tuple) -> tuple:
+    normals, triangles, triangle_count, *indices = shared_mesh
+
+    return (_from_shared(normals), _from_shared(triangles), triangle_count,
+            *[_from_shared(shared) for shared in indices])
+
+
+def _free_shared_mesh(shared_mesh: tuple) -> None:
+    normals, triangles, _, *indices = shared_mesh
+
+    for shared in (normals, triangles, *indices):
+        _free_shared(shared)
+
+
+def _init_worker(cache_path: str) -> None:
+    _mesh_cache.set_cache_path(cache_path)
+
+
+def _tessellate_worker(renderer_cls, data: bytes, type_: str,
+                       lod: bool) -> list[tuple]:
+    if lod:
+        lod_mesh = renderer_cls.get_cached_lod_mesh(data)
+
+        if lod_mesh is None:
+            model = _read_model(data, type_)
+            lod_mesh = renderer_cls.build_lod_mesh(model, data)
+
+        meshes = lod_mesh.levels
+    else:
+        mesh = renderer_cls.get_cached_mesh(data)
+
+        if mesh is None:
+            model = _read_model(data, type_)
+            mesh = renderer_cls.build_mesh(model, data)
+
+        meshes = [mesh]
+
+    return [_mesh_to_shared(mesh) for mesh in meshes]
+
+
+class TessellationService:
+    """
+    Tessellates models in a process pool.
+
+    on_ready is called on the UI thread with a list of `(callback, args)`
+    tuples for every batch of meshes that has finished. The callbacks are
+    the ones passed to `submit` and it is up to on_ready to call them with
+    args.
+    """
+
+    def __init__(self, on_ready: Callable[[list[tuple[Callable, tuple]]], None],
+                 max_workers: int | None = None):
+        self._on_ready = on_ready
+
+        if max_workers is None:
+            max_workers = max(1, (os.cpu_count() or 2) - 1)
+
+        self._max_workers = max_workers
+        self._executor = None
+
+        self._lock = threading.Lock()
+        self._ready = []
+        self._call_pending = False
+        self._futures = set()
+        self._is_shutdown = False
+
+        # share key -> callbacks waiting on the mesh
+        self._waiting: dict[tuple, list[Callable]] = {}
+        self._shared = _SharedMeshes()
+
+    def _get_executor(self) -> futures.ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn so the workers do not inherit the wx and GL state of
+            # the UI process
+            self._executor = futures.ProcessPoolExecutor(
+                max_workers=self._max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(_mesh_cache.get_cache_path(),))
+
+        return self._executor
+
+    @property
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._futures)
+
+    def submit(self, renderer_cls, data: bytes, type_: str,
+               callback: Callable, lod: bool = False) -> bool:
+        """
+        Queue a model for tessellation.
+
+        callback is called with (normals, triangles, triangle_count), with
+        (normals, vertices, index_count, indices) for an indexed mesh, or
+        with a single `LODMesh` if lod is True.
+
+        Objects loaded from the same data get the same arrays so the arrays
+        must not be changed in place.
+
+        If another object loaded from the same data is still using its
+        mesh, or the mesh is in the mesh cache, callback gets called with
+        it before this returns and True is returned. Otherwise False is
+        returned and callback is called on the UI thread once the mesh is
+        ready.
+        """
+        share_key = (renderer_cls.__name__, make_model_key(data), lod)
+
+        args = self._shared.get(share_key)
+
+        if args is None:
+            if lod:
+                lod_mesh = renderer_cls.get_cached_lod_mesh(data)
+                args = None if lod_mesh is None else (lod_mesh,)
+            else:
+                args = renderer_cls.get_cached_mesh(data)
+
+            if args is not None:
+                self._shared.add(share_key, args)
+
+        if args is not None:
+            callback(*args)
+            return True
+
+        with self._lock:
+            if share_key in self._waiting:
+                # the same model is already being tessellated
+                self._waiting[share_key].append(callback)
+                return False
+
+            self._waiting[share_key] = [callback]
+
+        future = self._get_executor().submit(
+            _tessellate_worker, renderer_cls, data, type_, lod)
+
+        with self._lock:
+            self._futures.add(future)
+
+        future.add_done_callback(
+            lambda f: self._on_future_done(f, share_key, lod))
+
+        return False
+
+    def _on_future_done(self, future: futures.Future, share_key: tuple, lod: bool) -> None:
+        # this runs on one of the executor's internal threads
+        with self._lock:
+            self._futures.discard(future)
+            callbacks = self._waiting.pop(share_key, [])
+
+        if future.cancelled():
+            return
+
+        try:
+            results = future.result()
+        except Exception:  # NOQA
+            _logger.exception('Tessellation failed')
+            return
+
+        if self._is_shutdown:
+            # nobody is going to take the meshes anymore, the segments are
+            # only freed when they get read
+            for shared_mesh in results:
+                _free_shared_mesh(shared_mesh)
+            return
+
+        try:
+            meshes = [_mesh_from_shared(shared_mesh) for shared_mesh in results]
+        except Exception:  # NOQA
+            _logger.exception('Reading the tessellated mesh failed')
+
+            # the segments that were read are already gone
+            for shared_mesh in results:
+                _free_shared_mesh(shared_mesh)
+            return
+
+        if lod:
+            args = (_lod.LODMesh(meshes),)
+        else:
+            args = meshes[0]
+
+        self._shared.add(share_key, args)
+
+        with self._lock:
+            self._ready.extend((callback, args) for callback in callbacks)
+
+            if self._call_pending:
+                return
+
+            self._call_pending = True
+
+        wx.CallAfter(self._deliver)
+
+    def _deliver(self) -> None:
+        with self._lock:
+            ready = self._ready
+            self._ready = []
+            self._call_pending = False
+
+        if ready and not self._is_shutdown:
+            self._on_ready(ready)
+
+    def shutdown(self) -> None:
+        self._is_shutdown = True
+
+        with self._lock:
+            pending = list(self._futures)
+            self._futures.clear()
+            self._waiting.clear()
+
+        for future in pending:
+            future.cancel()
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
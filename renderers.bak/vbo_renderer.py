@@ -0,0 +1,288 @@
+"""
+Retained mode renderer.
+
+`GLRenderer` hands NumPy arrays to glVertexPointer/glNormalPointer so every
+mesh gets copied from host memory again on every redraw. `VBORenderer`
+uploads each array into a vertex buffer object the first time it is drawn
+and after that a frame only binds and draws the buffers.
+
+Buffers are keyed on the array object. An array is uploaded again when its
+data pointer, shape or dtype changes. Code that changes the contents of an
+array in place has to call `VBORenderer.invalidate` for it. The buffer of
+an array that gets garbage collected is deleted at the start of the next
+frame, when the GL context is current.
+"""
+
+import ctypes
+import threading
+import weakref
+
+from OpenGL import GL
+
+import numpy as np
+
+from . import gl_renderer as _gl_renderer
+from . import instancing as _instancing
+from . import render_queue as _render_queue
+from ... import gl_materials as _gl_materials
+
+
+class _Buffer:
+
+    def __init__(self, buffer_id: int, ref: weakref.ref, signature: tuple):
+        self.buffer_id = buffer_id
+        self.ref = ref
+        self.signature = signature
+
+
+def _get_signature(arr: np.ndarray) -> tuple:
+    return arr.__array_interface__['data'][0], arr.shape, arr.dtype.str
+
+
+class BufferCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buffers: dict[int, _Buffer] = {}
+        self._freed: list[int] = []
+
+    def _on_array_freed(self, key: int, ref: weakref.ref) -> None:
+        # this can get called from any thread and while the GL context
+        # is not current so the buffer only gets queued for deletion here
+        with self._lock:
+            buf = self._buffers.get(key, None)
+
+            if buf is None or buf.ref is not ref:
+                return
+
+            del self._buffers[key]
+            self._freed.append(buf.buffer_id)
+
+    def get(self, arr: np.ndarray, target: int = GL.GL_ARRAY_BUFFER) -> int:
+        """
+        Returns the buffer holding arr and uploads arr if the buffer is
+        missing or out of date. The buffer is left bound to target.
+        """
+        key = id(arr)
+        signature = _get_signature(arr)
+
+        with self._lock:
+            buf = self._buffers.get(key, None)
+
+        if buf is not None and buf.ref() is arr:
+            GL.glBindBuffer(target, buf.buffer_id)
+
+            if buf.signature != signature:
+                GL.glBufferData(target, arr.nbytes, np.ascontiguousarray(arr),
+                                GL.GL_STATIC_DRAW)
+                buf.signature = signature
+
+            return buf.buffer_id
+
+        buffer_id = int(GL.glGenBuffers(1))
+        GL.glBindBuffer(target, buffer_id)
+        GL.glBufferData(target, arr.nbytes, np.ascontiguousarray(arr),
+                        GL.GL_STATIC_DRAW)
+
+        ref = weakref.ref(arr, lambda r, k=key: self._on_array_freed(k, r))
+
+        with self._lock:
+            old_buf = self._buffers.get(key, None)
+            if old_buf is not None:
+                # the id got reused by a new array before the callback for
+                # the old one ran
+                self._freed.append(old_buf.buffer_id)
+
+            self._buffers[key] = _Buffer(buffer_id, ref, signature)
+
+        return buffer_id
+
+    def invalidate(self, arr: np.ndarray) -> None:
+        with self._lock:
+            buf = self._buffers.get(id(arr), None)
+
+            if buf is not None and buf.ref() is arr:
+                buf.signature = None
+
+    def collect(self) -> None:
+        """
+        Delete the buffers of arrays that have been garbage collected. The
+        GL context has to be current.
+        """
+        with self._lock:
+            freed = self._freed
+            self._freed = []
+
+        if freed:
+            GL.glDeleteBuffers(len(freed), freed)
+
+    def release(self) -> None:
+        """
+        Delete all buffers. The GL context has to be current.
+        """
+        with self._lock:
+            freed = self._freed + [buf.buffer_id for buf in self._buffers.values()]
+            self._freed = []
+            self._buffers.clear()
+
+        if freed:
+            GL.glDeleteBuffers(len(freed), freed)
+
+
+class VBORenderer(_gl_renderer.GLRenderer):
+
+    def __init__(self):
+        super().__init__()
+        self.buffers = BufferCache()
+
+        self._instance_program = None
+        self._instance_program_checked = False
+
+    def get_instance_program(self) -> "_instancing.InstanceProgram | None":
+        """
+        Returns the program used for hardware instancing or None if it is not
+        available. The GL context has to be current.
+        """
+        if not self._instance_program_checked:
+            self._instance_program_checked = True
+            self._instance_program = _instancing.InstanceProgram.create()
+
+        return self._instance_program
+
+    def invalidate(self, *arrays: np.ndarray):
+        for arr in arrays:
+            if arr is not None:
+                self.buffers.invalidate(arr)
+
+    def draw(self) -> "DrawWrapper":
+        wrapper = DrawWrapper(self)
+        return wrapper
+
+
+class DrawWrapper(_gl_renderer.DrawWrapper):
+
+    def __init__(self, renderer: VBORenderer):
+        super().__init__(renderer)
+        self._buffers = renderer.buffers
+
+    def __enter__(self):
+        self.begin_frame()
+        return super().__enter__()
+
+    def begin_frame(self):
+        # the buffers of arrays that have been garbage collected can only
+        # be deleted with the context current
+        self._buffers.collect()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, 0)
+        super().__exit__(exc_type, exc_val, exc_tb)
+
+    def grid(self):
+        if self._grid:
+            GL.glColor4f(0.8, 0.8, 0.8, 0.4)
+            self._buffers.get(self._grid[0])
+            GL.glVertexPointer(3, VBORenderer.get_gl_type(self._grid[0]), 0, None)
+            GL.glDrawArrays(GL.GL_TRIANGLES, 0, len(self._grid[0]) * 3)
+
+            GL.glColor4f(0.3, 0.3, 0.3, 0.4)
+            self._buffers.get(self._grid[1])
+            GL.glVertexPointer(3, VBORenderer.get_gl_type(self._grid[1]), 0, None)
+            GL.glDrawArrays(GL.GL_TRIANGLES, 0, len(self._grid[1]) * 3)
+
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
+    def model(
+        self,
+        normals: np.ndarray | None,
+        triangles: np.ndarray | None,
+        triangle_count: int,
+        color: tuple[float, float, float, float],
+        material: _gl_materials.GLMaterial | None,
+        is_selected: bool,
+        indices: np.ndarray | None = None
+    ):
+
+        if triangle_count != 0:
+            queue = _render_queue.get_active()
+
+            if queue is not None:
+                queue.add(normals, triangles, triangle_count, color,
+                          material, is_selected, indices)
+                return
+
+            self.begin_model(color, material, is_selected)
+            self.draw_mesh(normals, triangles, triangle_count, indices)
+            self.end_model(is_selected)
+
+    def draw_mesh(self, normals: np.ndarray | None, triangles: np.ndarray,
+                  triangle_count: int, indices: np.ndarray | None = None):
+
+        self._buffers.get(triangles)
+        GL.glVertexPointer(3, VBORenderer.get_gl_type(triangles), 0, None)
+
+        if normals is not None:
+            self._buffers.get(normals)
+            GL.glNormalPointer(VBORenderer.get_gl_type(normals), 0, None)
+
+        if indices is None:
+            GL.glDrawArrays(GL.GL_TRIANGLES, 0, triangle_count)
+        else:
+            self._buffers.get(indices, GL.GL_ELEMENT_ARRAY_BUFFER)
+            GL.glDrawElements(GL.GL_TRIANGLES, triangle_count,
+                              GL.GL_UNSIGNED_INT, None)
+            GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, 0)
+
+        # other code draws from client side arrays
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
+    def instances(
+        self,
+        normals: np.ndarray | None,
+        triangles: np.ndarray,
+        triangle_count: int,
+        matrices: np.ndarray,
+        colors: np.ndarray,
+        material: _gl_materials.GLMaterial | None,
+        indices: np.ndarray | None = None
+    ):
+        """
+        Draw the same mesh once for every instance, see
+        `gl_renderer.DrawWrapper.instances`.
+
+        The mesh buffers are bound once. With instancing available all of
+        the instances are drawn with a single call, otherwise the bound
+        buffers get drawn once per instance.
+        """
+        if triangle_count == 0 or not len(matrices):
+            return
+
+        GL.glPushClientAttrib(GL.GL_CLIENT_VERTEX_ARRAY_BIT)
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+
+        if material is not None:
+            material.set()
+
+        self._buffers.get(triangles)
+        GL.glVertexPointer(3, VBORenderer.get_gl_type(triangles), 0, None)
+
+        if normals is not None:
+            GL.glEnableClientState(GL.GL_NORMAL_ARRAY)
+            self._buffers.get(normals)
+            GL.glNormalPointer(VBORenderer.get_gl_type(normals), 0, None)
+
+        if indices is not None:
+            self._buffers.get(indices, GL.GL_ELEMENT_ARRAY_BUFFER)
+
+        program = self.renderer.get_instance_program()
+
+        if program is None:
+            self.draw_instances(triangle_count, matrices, colors,
+                                None if indices is None else ctypes.c_void_p(0))
+        else:
+            program.draw(triangle_count, matrices, colors, indices is not None)
+
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, 0)
+        GL.glPopClientAttrib()